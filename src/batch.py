@@ -0,0 +1,207 @@
+# Simulates many track files in parallel, one track per worker process
+
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import NotRequired, Optional, TypedDict
+from engine.entity import Entity
+from engine.frame_store import FrameStore
+from utils.convert import load_track
+
+
+class BatchJob(TypedDict):
+    path: str
+    start_frame: int
+    end_frame: int
+    lra: bool
+    # Directory of a frame store to read already simulated frames from (and write
+    # new ones to)
+    frame_store: NotRequired[str]
+
+
+class TrackEvent(TypedDict):
+    frame: int
+    entity: int
+    event: str
+
+
+class EntityResult(TypedDict):
+    mount_phase: str
+    sled_intact: bool
+    # Same format as fixture_tests.json (pos.x, pos.y, vel.x, vel.y as f64 hex)
+    points: list[str]
+
+
+class TrackResult(TypedDict):
+    path: str
+    start_frame: int
+    end_frame: int
+    final_state: list[EntityResult]
+    events: list[TrackEvent]
+    load_time: float
+    simulate_time: float
+    error: Optional[str]
+
+
+def get_entity_result(entity: Entity) -> EntityResult:
+    return {
+        "mount_phase": entity.state.mount_phase.name,
+        "sled_intact": entity.state.sled_intact,
+        "points": [
+            struct.pack(
+                ">4d",
+                point.position.x,
+                point.position.y,
+                point.velocity.x,
+                point.velocity.y,
+            ).hex()
+            for point in entity.points
+        ],
+    }
+
+
+def simulate_track(job: BatchJob) -> TrackResult:
+    result: TrackResult = {
+        "path": job["path"],
+        "start_frame": job["start_frame"],
+        "end_frame": job["end_frame"],
+        "final_state": [],
+        "events": [],
+        "load_time": 0.0,
+        "simulate_time": 0.0,
+        "error": None,
+    }
+
+    try:
+        start_time = time.perf_counter()
+        frame_store = None
+        if "frame_store" in job:
+            frame_store = FrameStore(job["frame_store"])
+        with open(job["path"], "r") as f:
+            engine = load_track(f, job["lra"], frame_store=frame_store)
+        result["load_time"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        previous_states = None
+        frame_state = None
+        # Frames are visited in order, so none of them need to stay cached
+        for frame, frame_state in engine.iter_frames(
+            job["start_frame"], job["end_frame"] + 1
+        ):
+            states = [
+                (entity.state.mount_phase, entity.state.sled_intact)
+                for entity in frame_state.entities
+            ]
+            if previous_states is not None:
+                for i, (mount_phase, sled_intact) in enumerate(states):
+                    if mount_phase != previous_states[i][0]:
+                        result["events"].append(
+                            {"frame": frame, "entity": i, "event": mount_phase.name}
+                        )
+                    if not sled_intact and previous_states[i][1]:
+                        result["events"].append(
+                            {"frame": frame, "entity": i, "event": "SLED_BROKEN"}
+                        )
+            previous_states = states
+
+        if frame_state is not None:
+            result["final_state"] = [
+                get_entity_result(entity) for entity in frame_state.entities
+            ]
+        result["simulate_time"] = time.perf_counter() - start_time
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def find_tracks(paths: list[str]) -> list[str]:
+    track_paths: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            track_paths.extend(
+                str(track_path)
+                for track_path in sorted(Path(path).glob("*.track.json"))
+            )
+        else:
+            track_paths.append(path)
+    return track_paths
+
+
+# Rough relative cost of a job, for scheduling
+def estimate_cost(job: BatchJob) -> int:
+    if not os.path.exists(job["path"]):
+        return 0
+    return os.path.getsize(job["path"]) * (job["end_frame"] - job["start_frame"] + 1)
+
+
+def run_batch(
+    jobs: list[BatchJob], processes: Optional[int] = None
+) -> list[TrackResult]:
+    # Longest jobs get scheduled first so that no worker is left with a long tail
+    order = sorted(range(len(jobs)), key=lambda i: estimate_cost(jobs[i]), reverse=True)
+    results: list[Optional[TrackResult]] = [None] * len(jobs)
+
+    # Workers load the engine modules once when importing this module, so each job
+    # only pays for loading its track
+    with multiprocessing.Pool(processes) as pool:
+        ordered_results = pool.imap(
+            simulate_track, [jobs[i] for i in order], chunksize=1
+        )
+        for i, result in zip(order, ordered_results):
+            results[i] = result
+
+    return [result for result in results if result is not None]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulates many track files in parallel"
+    )
+    parser.add_argument("paths", nargs="+", help=".track.json files or directories")
+    parser.add_argument("--start", type=int, default=0, help="first frame")
+    parser.add_argument("--end", type=int, default=400, help="last frame")
+    parser.add_argument("--lra", action="store_true", help="use lra remounting")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write results as json")
+    parser.add_argument(
+        "--frame-store", default=None, help="directory to keep simulated frames in"
+    )
+    args = parser.parse_args()
+
+    jobs: list[BatchJob] = [
+        {
+            "path": path,
+            "start_frame": args.start,
+            "end_frame": args.end,
+            "lra": args.lra,
+        }
+        for path in find_tracks(args.paths)
+    ]
+    if args.frame_store is not None:
+        for job in jobs:
+            job["frame_store"] = args.frame_store
+
+    start_time = time.perf_counter()
+    results = run_batch(jobs, args.processes)
+    elapsed = time.perf_counter() - start_time
+
+    for result in results:
+        if result["error"] is not None:
+            print(f"{result['path']}: {result['error']}", file=sys.stderr)
+        else:
+            print(
+                f"{result['path']}: {len(result['events'])} events, "
+                f"load {result['load_time']:.2f}s, "
+                f"simulate {result['simulate_time']:.2f}s"
+            )
+    print(f"{len(results)} tracks in {elapsed:.2f}s")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
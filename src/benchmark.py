@@ -0,0 +1,376 @@
+# Benchmarks for the engine, run from the repository root
+# python src/benchmark.py memory
+# python src/benchmark.py load
+# python src/benchmark.py cells
+# python src/benchmark.py airtime
+# python src/benchmark.py rss
+# python src/benchmark.py lazy
+# python src/benchmark.py stream
+# python src/benchmark.py backends
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import timeit
+import tracemalloc
+import utils.convert
+from engine.engine import Engine, PhysicsBackend
+from engine.grid import Grid
+from engine.vector import Vector
+from typing import Optional
+from utils.convert import convert_lines, convert_track
+
+MEMORY_TRACKS = ["veil.track.json", "fakie_park_autumn.track.json"]
+LOAD_TRACKS = MEMORY_TRACKS
+LOAD_REPEATS = 5
+CELL_LOOKUPS = 100000
+# Tracks where riders spend time away from lines
+AIRTIME_TRACKS = [
+    "phunner.track.json",
+    "dismount.track.json",
+    "sled_fakie.track.json",
+    "ten_pc_spam.track.json",
+]
+AIRTIME_REPEATS = 3
+LAZY_REPEATS = 3
+# Lines added far away from the riders of each track, for the lazy loading benchmark
+FAR_LINES = 100000
+# Lines of the synthetic track for the streaming benchmark
+SYNTHETIC_LINES = 1000000
+# Track whose rider gets copied for the backend benchmark, and the numbers of riders
+BACKEND_TRACK = "veil.track.json"
+BACKEND_RIDERS = [1, 10, 50, 100, 200, 400]
+
+
+def load_track(track_file: str, lra: bool = False) -> Engine:
+    with open(f"fixtures/{track_file}", "r") as f:
+        track_data = json.load(f)
+    return convert_track(track_data, lra)
+
+
+def get_num_lines(engine: Engine) -> int:
+    return engine.grid.get_num_lines()
+
+
+# Bytes allocated per loaded line (lines plus the grid cells holding them) and per
+# cached frame, measured with tracemalloc
+def benchmark_memory(frames: int):
+    for track_file in MEMORY_TRACKS:
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        engine = load_track(track_file)
+        loaded = tracemalloc.get_traced_memory()[0]
+        engine.get_frame(frames)
+        simulated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        num_lines = get_num_lines(engine)
+        print(
+            f"{track_file}: {num_lines} lines, "
+            f"{(loaded - start) / num_lines:.0f} bytes per line, "
+            f"{(simulated - loaded) / frames:.0f} bytes per cached frame "
+            f"({len(engine.state_cache.frames[0].templates)} riders)"
+        )
+
+
+# Time taken to load each track, and to build its grid by adding lines one at a time
+# compared to adding them all at once, best of LOAD_REPEATS runs (frames is unused)
+def benchmark_load(frames: int):
+    for track_file in LOAD_TRACKS:
+        with open(f"fixtures/{track_file}", "r") as f:
+            track_data = json.load(f)
+        engine = convert_track(track_data, False)
+        lines = convert_lines(track_data["lines"])
+
+        def load():
+            convert_track(track_data, False)
+
+        def build_incremental():
+            grid = Grid(engine.grid.version, engine.grid.cell_size)
+            for line in lines:
+                grid.add_line(line)
+
+        def build_bulk():
+            grid = Grid(engine.grid.version, engine.grid.cell_size)
+            grid.add_lines(lines)
+
+        load_time, incremental_time, bulk_time = (
+            min(timeit.repeat(function, number=1, repeat=LOAD_REPEATS))
+            for function in (load, build_incremental, build_bulk)
+        )
+        print(
+            f"{track_file}: {len(lines)} lines, {len(engine.grid.cells)} cells, "
+            f"loaded in {load_time * 1000:.1f}ms, grid built in "
+            f"{incremental_time * 1000:.1f}ms one at a time, "
+            f"{bulk_time * 1000:.1f}ms all at once"
+        )
+
+
+# Cell lookups per second at positions around the lines of each track, through
+# CellPosition keys compared to integer keys (frames is unused)
+def benchmark_cells(frames: int):
+    for track_file in LOAD_TRACKS:
+        engine = load_track(track_file)
+        grid = engine.grid
+        lines = grid.get_all_lines()
+        rng = random.Random(0)
+        positions = [
+            rng.choice(lines).base.endpoints[0]
+            + Vector(rng.uniform(-20, 20), rng.uniform(-20, 20))
+            for _ in range(CELL_LOOKUPS)
+        ]
+
+        def lookup_cell_positions():
+            for position in positions:
+                grid.cells.get(grid.get_cell_position(position).get_key())
+
+        def lookup_keys():
+            for position in positions:
+                grid.get_cell(position)
+
+        cell_position_time, key_time = (
+            min(timeit.repeat(function, number=1, repeat=LOAD_REPEATS))
+            for function in (lookup_cell_positions, lookup_keys)
+        )
+        print(
+            f"{track_file}: {CELL_LOOKUPS / cell_position_time:.0f} lookups/s with "
+            f"CellPosition, {CELL_LOOKUPS / key_time:.0f} lookups/s with integer keys"
+        )
+
+
+# Frames simulated per second with the scalar backend, skipping collisions of contact
+# points in empty space compared to querying the grid for every point, best of
+# AIRTIME_REPEATS runs
+def benchmark_airtime(frames: int):
+    for track_file in AIRTIME_TRACKS:
+        with open(f"fixtures/{track_file}", "r") as f:
+            track_data = json.load(f)
+
+        def simulate(skip_empty: bool):
+            engine = convert_track(track_data, False, backend=PhysicsBackend.SCALAR)
+            if not skip_empty:
+                engine.grid.is_area_empty = lambda *bounds: False
+            engine.get_frame(frames)
+
+        skip_time, query_time = (
+            min(
+                timeit.repeat(
+                    lambda: simulate(skip_empty), number=1, repeat=AIRTIME_REPEATS
+                )
+            )
+            for skip_empty in (True, False)
+        )
+        print(
+            f"{track_file}: {frames / query_time:.0f} frames/s querying every point, "
+            f"{frames / skip_time:.0f} frames/s skipping empty space"
+        )
+
+
+# Peak resident memory of the process after loading the track (or nothing), in bytes
+def get_peak_rss(track_file: Optional[str]) -> int:
+    if track_file is not None:
+        load_track(track_file)
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Peak resident memory after loading each track, each in a new process, compared to
+# a process that loads nothing (frames is unused)
+def benchmark_rss(frames: int):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        baseline = pool.apply(get_peak_rss, (None,))
+        print(f"no track: {baseline / 2**20:.1f}MB peak RSS")
+        for track_file in MEMORY_TRACKS:
+            peak_rss = pool.apply(get_peak_rss, (track_file,))
+            print(
+                f"{track_file}: {peak_rss / 2**20:.1f}MB peak RSS "
+                f"({(peak_rss - baseline) / 2**20:.1f}MB for the track)"
+            )
+
+
+# Same track with FAR_LINES lines scattered far away from everything on it
+def add_far_lines(track_data: dict) -> dict:
+    rng = random.Random(0)
+    first_id = max(line["id"] for line in track_data["lines"]) + 1
+    far_lines = []
+    for index in range(FAR_LINES):
+        x = rng.uniform(1e5, 1e6)
+        y = rng.uniform(1e5, 1e6)
+        far_lines.append(
+            {
+                "id": first_id + index,
+                "type": index % 2,
+                "x1": x,
+                "y1": y,
+                "x2": x + rng.uniform(-100, 100),
+                "y2": y + rng.uniform(-100, 100),
+                "flipped": False,
+                "leftExtended": False,
+                "rightExtended": False,
+            }
+        )
+    return {**track_data, "lines": track_data["lines"] + far_lines}
+
+
+# Time from loading each track until the first frames are simulated, building every
+# line up front compared to building lines once frames get near them, best of
+# LAZY_REPEATS runs
+def benchmark_lazy(frames: int):
+    for track_file in MEMORY_TRACKS:
+        with open(f"fixtures/{track_file}", "r") as f:
+            track_data = json.load(f)
+
+        for name, data in (
+            (track_file, track_data),
+            (f"{track_file} + far lines", add_far_lines(track_data)),
+        ):
+            engines = []
+
+            def load(lazy: bool):
+                engine = convert_track(
+                    data, False, backend=PhysicsBackend.SCALAR, lazy=lazy
+                )
+                engine.get_frame(frames)
+                engines.append(engine)
+
+            eager_time, lazy_time = (
+                min(timeit.repeat(lambda: load(lazy), number=1, repeat=LAZY_REPEATS))
+                for lazy in (False, True)
+            )
+            print(
+                f"{name}: {eager_time * 1000:.0f}ms building "
+                f"{get_num_lines(engines[0])} lines up front, {lazy_time * 1000:.0f}ms "
+                f"building {get_num_lines(engines[-1])} lines near frames"
+            )
+
+
+# Writes a track of short lines scattered around the start of a rider, one line at a
+# time so that the lines never all exist at once in this process
+def write_synthetic_track(path: str, num_lines: int):
+    rng = random.Random(0)
+    with open(path, "w") as f:
+        f.write(
+            '{"label": "synthetic", "version": "6.2", "riders": [{"startPosition": '
+            '{"x": 0, "y": 0}, "startVelocity": {"x": 0.4, "y": 0}}], "lines": ['
+        )
+        for line_id in range(num_lines):
+            x = rng.uniform(-50000, 50000)
+            y = rng.uniform(-50000, 50000)
+            if line_id > 0:
+                f.write(",")
+            f.write(
+                json.dumps(
+                    {
+                        "id": line_id,
+                        "type": line_id % 3,
+                        "x1": x,
+                        "y1": y,
+                        "x2": x + rng.uniform(-30, 30),
+                        "y2": y + rng.uniform(-30, 30),
+                        "flipped": False,
+                        "leftExtended": False,
+                        "rightExtended": False,
+                    }
+                )
+            )
+        f.write("]}")
+
+
+# Seconds taken to load the track, parsing the whole file first or reading its lines
+# one at a time, and the peak resident memory of the process afterwards
+def measure_load(track_path: str, streaming: bool) -> tuple[float, int]:
+    start_time = time.perf_counter()
+    with open(track_path, "r") as f:
+        if streaming:
+            utils.convert.load_track(f, False)
+        else:
+            convert_track(json.load(f), False)
+    return time.perf_counter() - start_time, get_peak_rss(None)
+
+
+# Load time and peak resident memory of each track (and a synthetic track with
+# SYNTHETIC_LINES lines), parsing the whole file first compared to converting lines
+# as they get read, each in a new process (frames is unused)
+def benchmark_stream(frames: int):
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_path = os.path.join(directory, "synthetic.track.json")
+        write_synthetic_track(synthetic_path, SYNTHETIC_LINES)
+        track_paths = [f"fixtures/{track_file}" for track_file in MEMORY_TRACKS]
+        track_paths.append(synthetic_path)
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            baseline = pool.apply(get_peak_rss, (None,))
+            for track_path in track_paths:
+                (parse_time, parse_rss), (stream_time, stream_rss) = (
+                    pool.apply(measure_load, (track_path, streaming))
+                    for streaming in (False, True)
+                )
+                print(
+                    f"{os.path.basename(track_path)}: "
+                    f"{parse_time * 1000:.0f}ms and "
+                    f"{(parse_rss - baseline) / 2**20:.1f}MB parsing the whole file, "
+                    f"{stream_time * 1000:.0f}ms and "
+                    f"{(stream_rss - baseline) / 2**20:.1f}MB reading lines one at a "
+                    "time"
+                )
+
+
+# Time per rider per frame of each physics backend with more and more copies of the
+# rider of BACKEND_TRACK, which shows how many riders the numpy backend needs to make
+# up for the overhead of its array operations
+def benchmark_backends(frames: int):
+    with open(f"fixtures/{BACKEND_TRACK}", "r") as f:
+        track_data = json.load(f)
+    rider = track_data["riders"][0]
+
+    for num_riders in BACKEND_RIDERS:
+        track_data["riders"] = [
+            {
+                **rider,
+                "startPosition": {
+                    "x": rider["startPosition"]["x"] + i * 0.01,
+                    "y": rider["startPosition"]["y"],
+                },
+            }
+            for i in range(num_riders)
+        ]
+        times = []
+        for backend in PhysicsBackend:
+            engine = convert_track(track_data, False, backend=backend)
+            start_time = time.perf_counter()
+            engine.get_frame(frames)
+            elapsed = time.perf_counter() - start_time
+            times.append(
+                f"{backend.name.lower()} {elapsed / frames / num_riders * 1e6:.0f}us"
+            )
+        print(f"{num_riders} riders: {', '.join(times)} per rider per frame")
+
+
+BENCHMARKS = {
+    "memory": benchmark_memory,
+    "load": benchmark_load,
+    "cells": benchmark_cells,
+    "airtime": benchmark_airtime,
+    "rss": benchmark_rss,
+    "lazy": benchmark_lazy,
+    "stream": benchmark_stream,
+    "backends": benchmark_backends,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs engine benchmarks")
+    parser.add_argument("benchmark", choices=BENCHMARKS.keys())
+    parser.add_argument("--frames", type=int, default=400, help="frames to simulate")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    BENCHMARKS[args.benchmark](args.frames)
+    print(f"done in {time.perf_counter() - start_time:.2f}s")
@@ -2,92 +2,117 @@ from engine.point import BasePoint
 
 
 # Common bone properties and methods
+# Bones refer to their points by index into the entity's points, so the same bones
+# can be shared by every copy of an entity
 class BaseBone:
+    __slots__ = ("point1", "point2", "rest_length", "length_factor", "bias")
+
     def __init__(
-        self, point1: BasePoint, point2: BasePoint, bias: float, length_factor: float
+        self,
+        points: list[BasePoint],
+        point1: int,
+        point2: int,
+        bias: float,
+        length_factor: float,
     ):
         self.point1 = point1
         self.point2 = point2
         # Initial rest length of the bone
-        self.rest_length = point1.position.distance_from(point2.position)
+        self.rest_length = points[point1].position.distance_from(
+            points[point2].position
+        )
         # Multiplier against the rest length
         self.length_factor = length_factor
         # Which point gets updated more (0 affects point 1 entirely, 1 affects point 2 entirely)
         self.bias = bias
 
-    def get_vector(self):
-        return self.point1.position - self.point2.position
+    def get_vector(self, points: list[BasePoint]):
+        return points[self.point1].position - points[self.point2].position
 
-    def get_adjustment(self):
-        current_length = self.get_vector().length()
+    def get_adjustment(self, points: list[BasePoint]):
+        current_length = self.get_vector(points).length()
 
         if current_length == 0:
             return 0
 
         return (current_length - self.rest_length * self.length_factor) / current_length
 
-    def update_points(self, adjustment: float):
-        bone_vector = self.get_vector()
-        self.point1.update_state(
-            self.point1.position - bone_vector * adjustment * (1 - self.bias),
-            self.point1.velocity,
-            self.point1.previous_position,
+    def update_points(self, points: list[BasePoint], adjustment: float):
+        bone_vector = self.get_vector(points)
+        point1 = points[self.point1]
+        point2 = points[self.point2]
+        point1.update_state(
+            point1.position - bone_vector * adjustment * (1 - self.bias),
+            point1.velocity,
+            point1.previous_position,
         )
-        self.point2.update_state(
-            self.point2.position + bone_vector * adjustment * self.bias,
-            self.point2.velocity,
-            self.point2.previous_position,
+        point2.update_state(
+            point2.position + bone_vector * adjustment * self.bias,
+            point2.velocity,
+            point2.previous_position,
         )
 
 
 # Bones connecting points to keep them as the same structure
 class NormalBone:
-    def __init__(self, point1: BasePoint, point2: BasePoint):
-        self.base = BaseBone(point1, point2, 0.5, 1)
+    __slots__ = ("base",)
+
+    def __init__(self, points: list[BasePoint], point1: int, point2: int):
+        self.base = BaseBone(points, point1, point2, 0.5, 1)
 
-    def process(self, adjustment_strength: float):
-        adjustment = self.base.get_adjustment()
-        self.base.update_points(adjustment * adjustment_strength)
+    def process(self, points: list[BasePoint], adjustment_strength: float):
+        adjustment = self.base.get_adjustment(points)
+        self.base.update_points(points, adjustment * adjustment_strength)
 
 
 # Bones designed to only repel points after a certain rest length is reached
 class RepelBone:
-    def __init__(self, point1: BasePoint, point2: BasePoint, length_factor: float):
-        self.base = BaseBone(point1, point2, 0.5, length_factor)
+    __slots__ = ("base",)
+
+    def __init__(
+        self, points: list[BasePoint], point1: int, point2: int, length_factor: float
+    ):
+        self.base = BaseBone(points, point1, point2, 0.5, length_factor)
 
-    def process(self, adjustment_strength: float):
-        adjustment = self.base.get_adjustment()
+    def process(self, points: list[BasePoint], adjustment_strength: float):
+        adjustment = self.base.get_adjustment(points)
         if (
-            self.base.get_vector().length()
+            self.base.get_vector(points).length()
             < self.base.rest_length * self.base.length_factor
         ):
-            self.base.update_points(adjustment * adjustment_strength)
+            self.base.update_points(points, adjustment * adjustment_strength)
 
 
 class FlutterBone:
-    def __init__(self, point1: BasePoint, point2: BasePoint):
-        self.base = BaseBone(point1, point2, 1, 1)
+    __slots__ = ("base",)
+
+    def __init__(self, points: list[BasePoint], point1: int, point2: int):
+        self.base = BaseBone(points, point1, point2, 1, 1)
 
-    def process(self):
-        adjustment = self.base.get_adjustment()
-        self.base.update_points(adjustment)
+    def process(self, points: list[BasePoint]):
+        adjustment = self.base.get_adjustment(points)
+        self.base.update_points(points, adjustment)
 
 
 # Bones that can break after a certain stretch threshold
 # These bones are connected between two skeletons
 class MountBone:
-    def __init__(self, point1: BasePoint, point2: BasePoint, endurance: float):
-        self.base = BaseBone(point1, point2, 0.5, 1)
+    __slots__ = ("base", "endurance")
+
+    def __init__(
+        self, points: list[BasePoint], point1: int, point2: int, endurance: float
+    ):
+        self.base = BaseBone(points, point1, point2, 0.5, 1)
         self.endurance = endurance
 
-    def get_intact(self, remounting: bool) -> bool:
+    def get_intact(self, points: list[BasePoint], remounting: bool) -> bool:
         REMOUNT_ENDURANCE_FACTOR = 2
-        adjustment = self.base.get_adjustment()
+        adjustment = self.base.get_adjustment(points)
         endurance = self.endurance
         if remounting:
             endurance *= REMOUNT_ENDURANCE_FACTOR
         return adjustment <= endurance * self.base.rest_length * self.base.length_factor
 
-    def process(self, adjustment_strength: float):
-        adjustment = self.base.get_adjustment()
-        self.base.update_points(adjustment * adjustment_strength)
+    def process(self, points: list[BasePoint], adjustment_strength: float):
+        adjustment = self.base.get_adjustment(points)
+        self.base.update_points(points, adjustment * adjustment_strength)
@@ -0,0 +1,363 @@
+from engine.entity import (
+    Entity,
+    EntityState,
+    MountPhase,
+    RemountVersion,
+    Skeleton,
+    InitialEntityParams,
+)
+from engine.point import BasePoint
+from engine.vector import Vector
+from typing import Optional, Union
+from collections import OrderedDict
+from array import array
+import bisect
+import struct
+import sys
+
+
+class CachedFrame:
+    def __init__(self, entities: list[Entity]):
+        self.entities: list[Entity] = entities
+
+
+# The parts of an entity that stay the same between frames
+EntityTemplate = tuple[Skeleton, InitialEntityParams, RemountVersion]
+
+
+def get_templates(entities: list[Entity]) -> tuple[EntityTemplate, ...]:
+    return tuple(
+        (entity.skeleton, entity.state.init_state, entity.state.remount_version)
+        for entity in entities
+    )
+
+
+# Number of bytes a frame of these entities takes up as a single record
+def get_record_size(templates: tuple[EntityTemplate, ...]) -> int:
+    num_points = sum(
+        len(skeleton.contact_points) + len(skeleton.flutter_points)
+        for skeleton, _, _ in templates
+    )
+    return (
+        num_points * PackedFrame.POINT_VALUES * 8
+        + len(templates) * PackedFrame.STATE_FORMAT.size
+    )
+
+
+# A frame as stored by FrameCache, with the state of every entity packed into
+# buffers (entities share their skeleton and initial state between frames, so
+# only point state and mount state need to be kept)
+# The buffers can also be views into a memory mapped file (see FrameStore)
+class PackedFrame:
+    __slots__ = ("templates", "points", "states")
+
+    # Position, velocity and previous position (x and y) of each point
+    POINT_VALUES = 6
+    # Mount phase, sled intact and the three remount timers of each entity
+    STATE_FORMAT = struct.Struct("<B?3i")
+
+    def __init__(
+        self,
+        templates: tuple[EntityTemplate, ...],
+        points: Union[array, memoryview],
+        states: Union[bytes, memoryview],
+    ):
+        self.templates = templates
+        self.points = points
+        self.states = states
+
+    def get_size(self) -> int:
+        return sys.getsizeof(self.points) + sys.getsizeof(self.states)
+
+    def get_record(self) -> bytes:
+        return self.points.tobytes() + bytes(self.states)
+
+    # Builds new entities from the packed state
+    def unpack(self) -> CachedFrame:
+        entities: list[Entity] = []
+        values = self.points
+        offset = 0
+
+        for i, (skeleton, init_state, remount_version) in enumerate(self.templates):
+            state = EntityState(init_state, remount_version)
+            (
+                mount_phase,
+                state.sled_intact,
+                state.frames_until_dismounted,
+                state.frames_until_remounting,
+                state.frames_until_mounted,
+            ) = self.STATE_FORMAT.unpack_from(self.states, i * self.STATE_FORMAT.size)
+            state.mount_phase = MountPhase(mount_phase)
+
+            points: list[BasePoint] = []
+            num_points = len(skeleton.contact_points) + len(skeleton.flutter_points)
+            for _ in range(num_points):
+                points.append(
+                    BasePoint(
+                        Vector(values[offset], values[offset + 1]),
+                        Vector(values[offset + 2], values[offset + 3]),
+                        Vector(values[offset + 4], values[offset + 5]),
+                    )
+                )
+                offset += self.POINT_VALUES
+
+            entities.append(Entity(state, skeleton, points))
+
+        return CachedFrame(entities)
+
+
+def pack_frame(entities: list[Entity]) -> PackedFrame:
+    values: list[float] = []
+    for entity in entities:
+        for point in entity.points:
+            values += (
+                point.position.x,
+                point.position.y,
+                point.velocity.x,
+                point.velocity.y,
+                point.previous_position.x,
+                point.previous_position.y,
+            )
+    states = b"".join(
+        PackedFrame.STATE_FORMAT.pack(
+            entity.state.mount_phase.value,
+            entity.state.sled_intact,
+            entity.state.frames_until_dismounted,
+            entity.state.frames_until_remounting,
+            entity.state.frames_until_mounted,
+        )
+        for entity in entities
+    )
+    return PackedFrame(get_templates(entities), array("d", values), states)
+
+
+# Frame storage used by the engine, which stores every frame that gets simulated
+# unless given a budget (in frames or bytes), after which frames get evicted by
+# select_victim (least recently used by default)
+# Frames are stored packed and get unpacked into new entities when requested
+# Frame 0 is the initial state and is never removed
+class FrameCache:
+    def __init__(
+        self, max_frames: Optional[int] = None, max_bytes: Optional[int] = None
+    ):
+        self.frames: dict[int, PackedFrame] = {}
+        # Sorted indices of stored frames, used to find where to resume simulating from
+        self.indices: list[int] = []
+        # Stored frames from least to most recently used
+        self.usage: OrderedDict[int, None] = OrderedDict()
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.frame_bytes: dict[int, int] = {}
+        self.total_bytes = 0
+        self.playhead = 0
+
+        # Requests that had their frame stored, here or in the frame store of the
+        # engine, and how many of those came from the frame store
+        self.hits = 0
+        self.store_hits = 0
+        # Requests that had to be simulated from an earlier frame
+        self.misses = 0
+        # Frames that were simulated again after being simulated before
+        self.recomputed = 0
+        self.max_simulated = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, frame: int):
+        return frame in self.frames
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "recomputed": self.recomputed,
+            "frames": len(self.frames),
+            "bytes": self.total_bytes,
+        }
+
+    def get(self, frame: int) -> Optional[CachedFrame]:
+        if frame not in self.frames:
+            return None
+        self.usage.move_to_end(frame)
+        return self.frames[frame].unpack()
+
+    # Returns the latest stored frame at or before the given frame
+    # Whether the request was a hit is recorded by the engine with record_request,
+    # since the frame may also be in its frame store
+    def get_nearest(self, frame: int) -> tuple[int, CachedFrame]:
+        self.playhead = frame
+        index = self.indices[bisect.bisect_right(self.indices, frame) - 1]
+        self.usage.move_to_end(index)
+        return (index, self.frames[index].unpack())
+
+    def record_request(self, hit: bool, from_store: bool):
+        if hit:
+            self.hits += 1
+            if from_store:
+                self.store_hits += 1
+        else:
+            self.misses += 1
+
+    def latest(self) -> int:
+        return self.indices[-1]
+
+    def get_frame_size(self, packed_frame: PackedFrame) -> int:
+        return packed_frame.get_size()
+
+    def store(self, frame: int, cached_frame: CachedFrame):
+        if frame in self.frames:
+            self.remove(frame)
+        packed_frame = pack_frame(cached_frame.entities)
+        bisect.insort(self.indices, frame)
+        self.frames[frame] = packed_frame
+        self.usage[frame] = None
+        self.frame_bytes[frame] = self.get_frame_size(packed_frame)
+        self.total_bytes += self.frame_bytes[frame]
+        self.enforce_budget(frame)
+
+    def remove(self, frame: int):
+        if frame in self.frames:
+            del self.frames[frame]
+            del self.indices[bisect.bisect_left(self.indices, frame)]
+            del self.usage[frame]
+            self.total_bytes -= self.frame_bytes.pop(frame, 0)
+
+    # Removes every frame from the given frame onwards
+    def truncate(self, frame: int):
+        for index in self.indices[bisect.bisect_left(self.indices, max(frame, 1)) :]:
+            self.remove(index)
+
+    def over_budget(self) -> bool:
+        return (self.max_frames is not None and len(self.frames) > self.max_frames) or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes
+        )
+
+    # Evicts frames until the budget is met, without evicting frame 0 or the given frame
+    def enforce_budget(self, protected_frame: int):
+        while self.over_budget():
+            victim = self.select_victim(protected_frame)
+            if victim is None:
+                return
+            self.remove(victim)
+
+    # Eviction policy, returns which stored frame to evict next
+    def select_victim(self, protected_frame: int) -> Optional[int]:
+        for frame in self.usage:
+            if frame != 0 and frame != protected_frame:
+                return frame
+        return None
+
+    # Whether a newly simulated frame should be stored
+    def should_store(self, frame: int, target_frame: int) -> bool:
+        return True
+
+    # Called for every newly simulated frame while seeking to target_frame
+    def add(self, frame: int, cached_frame: CachedFrame, target_frame: int):
+        if frame <= self.max_simulated:
+            self.recomputed += 1
+        else:
+            self.max_simulated = frame
+
+        if self.should_store(frame, target_frame):
+            self.store(frame, cached_frame)
+
+    # Called after every frame request, once target_frame is available
+    def update_playhead(self, target_frame: int):
+        pass
+
+    # Called with the time taken to simulate a number of frames
+    def record_steps(self, num_steps: int, elapsed: float):
+        pass
+
+
+# Keeps the frames closest to the last requested frame when over budget
+class WindowCache(FrameCache):
+    def select_victim(self, protected_frame: int) -> Optional[int]:
+        # Indices are sorted, so the farthest frame from the playhead is at either end
+        candidates = [
+            frame
+            for frame in self.indices[1:3] + self.indices[-2:]
+            if frame != 0 and frame != protected_frame
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda frame: abs(frame - self.playhead))
+
+
+# Only keeps a keyframe every few frames plus a small window of frames around the
+# last requested frame, re-simulating from the nearest keyframe on a miss
+# Memory grows with (track length / interval) instead of track length
+# When over budget, the least recently used non-keyframes get evicted first
+class KeyframeCache(FrameCache):
+    # Number of steps timed before an automatic interval gets picked
+    WARMUP_STEPS = 40
+    MAX_INTERVAL = 400
+
+    def __init__(
+        self,
+        interval: Optional[int] = None,
+        hot_window: int = 8,
+        max_seek_time: float = 0.05,
+        max_frames: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        super().__init__(max_frames, max_bytes)
+        # If no interval is given, it gets picked from the measured step cost so
+        # that re-simulating from a keyframe takes about max_seek_time seconds
+        self.interval = interval
+        self.hot_window = hot_window
+        self.max_seek_time = max_seek_time
+        self.hot_frames: set[int] = set()
+        self.timed_steps = 0
+        self.timed_elapsed = 0.0
+
+    def is_keyframe(self, frame: int) -> bool:
+        if self.interval is None:
+            # Keep everything until an interval has been picked
+            return True
+        return frame % self.interval == 0
+
+    def should_store(self, frame: int, target_frame: int) -> bool:
+        return self.is_keyframe(frame) or target_frame - frame <= self.hot_window
+
+    def store(self, frame: int, cached_frame: CachedFrame):
+        super().store(frame, cached_frame)
+        if frame in self.frames and not self.is_keyframe(frame):
+            self.hot_frames.add(frame)
+
+    def remove(self, frame: int):
+        super().remove(frame)
+        self.hot_frames.discard(frame)
+
+    def select_victim(self, protected_frame: int) -> Optional[int]:
+        for frame in self.usage:
+            if frame in self.hot_frames and frame != protected_frame:
+                return frame
+        return super().select_victim(protected_frame)
+
+    def update_playhead(self, target_frame: int):
+        for frame in list(self.hot_frames):
+            if abs(frame - target_frame) > self.hot_window:
+                self.remove(frame)
+
+    def record_steps(self, num_steps: int, elapsed: float):
+        if self.interval is not None or num_steps == 0:
+            return
+
+        self.timed_steps += num_steps
+        self.timed_elapsed += elapsed
+
+        if self.timed_steps >= self.WARMUP_STEPS:
+            step_time = self.timed_elapsed / self.timed_steps
+            if step_time > 0:
+                interval = int(self.max_seek_time / step_time)
+            else:
+                interval = self.MAX_INTERVAL
+            self.interval = max(1, min(self.MAX_INTERVAL, interval))
+
+            # Warmup frames that are no longer keyframes get evicted with the hot window
+            for frame in self.indices:
+                if not self.is_keyframe(frame):
+                    self.hot_frames.add(frame)
@@ -1,15 +1,27 @@
 from engine.vector import Vector
 from engine.entity import Entity
-from engine.grid import Grid, GridVersion
+from engine.grid import Grid, GridVersion, get_cell_key
 from engine.line import NormalLine, AccelerationLine
+from engine.line_tiles import LineTiles
+from engine.cache import CachedFrame, FrameCache, get_templates, pack_frame
+from engine.frame_store import FrameStore, get_track_hash
+import engine.scalar_backend
 from engine.flags import GRAVITY_FIX
-from typing import Optional, Union
+from enum import Enum
+from typing import Iterator, Optional, Union
+import time
 import utils.debug
 
+DEFAULT_CELL_SIZE = 14
 
-class CachedFrame:
-    def __init__(self, entities: list[Entity]):
-        self.entities: list[Entity] = entities
+
+class PhysicsBackend(Enum):
+    # Steps each entity with its own objects, supports debug breakpoints
+    PYTHON = 0
+    # Steps all entities at once with NumPy arrays (requires numpy)
+    NUMPY = 1
+    # Steps each entity with plain float math, updating points in place
+    SCALAR = 2
 
 
 # Not specific implementation, just used for caching
@@ -19,56 +31,218 @@ class Engine:
         grid_version: GridVersion,
         entities: list[Entity],
         lines: list[Union[NormalLine, AccelerationLine]],
+        state_cache: Optional[FrameCache] = None,
+        backend: PhysicsBackend = PhysicsBackend.PYTHON,
+        frame_store: Optional[FrameStore] = None,
+        line_tiles: Optional[LineTiles] = None,
     ):
-        DEFAULT_CELL_SIZE = 14
         self.grid = Grid(grid_version, DEFAULT_CELL_SIZE)
         self.gravity_vector = Vector(0, 1)
-        self.state_cache: list[CachedFrame] = [CachedFrame(entities)]
+        if state_cache is None:
+            state_cache = FrameCache()
+        self.state_cache = state_cache
+        self.state_cache.store(0, CachedFrame(entities))
+        # Earliest simulated frame that queried each grid cell (by cell key) and each
+        # block of cells (by block column and row)
+        self.cell_first_frames: dict[int, int] = {}
+        self.block_first_frames: dict[tuple[int, int], int] = {}
+        # Every frame up to this one was simulated by this engine, so the cells they
+        # queried are known (later frames may have been read from the frame store)
+        self.recorded_frames = 0
+        self.templates = get_templates(entities)
 
         self.gravity_scale = 0.175
         if GRAVITY_FIX:
             self.gravity_scale = 0.17500000000000002
 
-        for line in lines:
-            self.grid.add_line(line)
+        self.grid.add_lines(lines)
+        # Lines that only get added once simulated frames get near them (a frame
+        # store loads them all, since the track hash covers every line)
+        self.grid.line_tiles = line_tiles
+
+        self.backend = backend
+        if backend == PhysicsBackend.NUMPY and entities:
+            # NumPy is optional, so it only gets imported if this backend is used
+            from engine.numpy_backend import NumpySkeletons
+
+            self.numpy_skeletons = NumpySkeletons(entities)
+
+        self.frame_store = frame_store
+        self.open_frame_store(0)
 
     def get_frame(self, target_frame: int) -> Optional[CachedFrame]:
         if target_frame < 0:
             return None
 
+        start_frame, frame_state = self.get_nearest_frame(target_frame)
+        start_time = time.perf_counter()
+
+        for frame in range(start_frame + 1, target_frame + 1):
+            self.simulate_frame(frame, frame_state)
+            self.state_cache.add(frame, frame_state, target_frame)
+
+        self.state_cache.record_steps(
+            target_frame - start_frame, time.perf_counter() - start_time
+        )
+        self.state_cache.update_playhead(target_frame)
+        return frame_state
+
+    # Yields every step_size-th frame from start_frame up to (not including)
+    # stop_frame, simulating forward without adding frames to the state cache, so
+    # memory use does not grow with the number of frames
+    # If checkpoint_interval is given, every frame that is a multiple of it still
+    # gets stored, so that later get_frame calls can start from it
+    def iter_frames(
+        self,
+        start_frame: int,
+        stop_frame: int,
+        step_size: int = 1,
+        checkpoint_interval: Optional[int] = None,
+    ) -> Iterator[tuple[int, CachedFrame]]:
+        if start_frame < 0 or step_size < 1:
+            return
+
+        current_frame, frame_state = self.get_nearest_frame(start_frame)
+
+        for frame in range(start_frame, stop_frame, step_size):
+            while current_frame < frame:
+                current_frame += 1
+                self.simulate_frame(current_frame, frame_state)
+                if (
+                    checkpoint_interval is not None
+                    and current_frame % checkpoint_interval == 0
+                ):
+                    self.state_cache.store(current_frame, frame_state)
+
+            # Yielded frames are copies, since the current state keeps getting stepped
+            yield (
+                frame,
+                CachedFrame([entity.copy() for entity in frame_state.entities]),
+            )
+
+    # Returns the latest frame at or before the given frame that is either cached or
+    # in the frame store
+    # The frame gets unpacked into new entities, so it can be stepped in place (the
+    # cache packs each frame it stores)
+    def get_nearest_frame(self, target_frame: int) -> tuple[int, CachedFrame]:
+        start_frame, frame_state = self.state_cache.get_nearest(target_frame)
+        from_store = False
+        if self.frame_store is not None:
+            stored_frame = min(target_frame, len(self.frame_store) - 1)
+            packed_frame = self.frame_store.get(stored_frame)
+            if stored_frame > start_frame and packed_frame is not None:
+                start_frame, frame_state = stored_frame, packed_frame.unpack()
+                from_store = True
+        self.state_cache.record_request(start_frame == target_frame, from_store)
+        return (start_frame, frame_state)
+
+    # Steps the state of the previous frame to the given frame
+    def simulate_frame(self, frame: int, frame_state: CachedFrame):
+        self.step(frame_state)
+        self.record_queried_cells(frame)
+        if (
+            self.frame_store is not None
+            and frame == len(self.frame_store)
+            and utils.debug.breakpoint_target == 0
+        ):
+            self.frame_store.append(frame, pack_frame(frame_state.entities))
+
+    # Advances the given frame to the next frame, updating its entities in place
+    def step(self, frame_state: CachedFrame):
         gravity = self.gravity_scale * self.gravity_vector
+        new_entities = frame_state.entities
 
-        for frame in range(len(self.state_cache), target_frame + 1):
-            new_entities: list[Entity] = []
-
-            for entity in self.state_cache[frame - 1].entities:
-                new_entities.append(entity.copy())
+        for entity in new_entities:
+            entity.dismounted_this_frame = False
 
+        if self.backend == PhysicsBackend.NUMPY and new_entities:
+            self.numpy_skeletons.process_skeletons(new_entities, gravity, self.grid)
+        elif self.backend == PhysicsBackend.SCALAR:
+            for entity in new_entities:
+                engine.scalar_backend.process_skeleton(entity, gravity, self.grid)
+        else:
             for entity in new_entities:
                 if utils.debug.at_breakpoint(None):
                     break
                 # physics steps
                 entity.process_skeleton(gravity, self.grid)
 
-            for entity in new_entities:
-                if utils.debug.at_breakpoint(None):
-                    break
-                # remount steps
-                entity.process_remount(new_entities)
-
-            self.state_cache.append(CachedFrame(new_entities))
-
-        return self.state_cache[target_frame]
+        for entity in new_entities:
+            if utils.debug.at_breakpoint(None):
+                break
+            # remount steps
+            entity.process_remount(new_entities)
+
+    def record_queried_cells(self, frame: int):
+        for cell_key in self.grid.queried_cells:
+            if self.cell_first_frames.get(cell_key, frame) >= frame:
+                self.cell_first_frames[cell_key] = frame
+        self.grid.queried_cells.clear()
+        for block in self.grid.queried_blocks:
+            if self.block_first_frames.get(block, frame) >= frame:
+                self.block_first_frames[block] = frame
+        self.grid.queried_blocks.clear()
+        if frame == self.recorded_frames + 1:
+            self.recorded_frames = frame
+
+    # Clears cached frames starting from the first frame that queried any cell (or
+    # block of cells) the line occupies, since earlier frames could not have
+    # interacted with it
+    # Returns the first cleared frame
+    def invalidate_line_cells(self, line: Union[NormalLine, AccelerationLine]) -> int:
+        # Frames read from the frame store have unknown queried cells, so they always
+        # get cleared
+        first_frame = self.recorded_frames + 1
+        for cell_x, cell_y, _, _ in self.grid.get_cells_between(
+            line.base.endpoints[0], line.base.endpoints[1]
+        ):
+            frame = self.cell_first_frames.get(get_cell_key(cell_x, cell_y))
+            if frame is not None and frame < first_frame:
+                first_frame = frame
+            frame = self.block_first_frames.get(self.grid.get_block(cell_x, cell_y))
+            if frame is not None and frame < first_frame:
+                first_frame = frame
+
+        self.state_cache.truncate(first_frame)
+        self.recorded_frames = min(self.recorded_frames, first_frame - 1)
+        self.cell_first_frames = {
+            cell_key: frame
+            for cell_key, frame in self.cell_first_frames.items()
+            if frame < first_frame
+        }
+        self.block_first_frames = {
+            block: frame
+            for block, frame in self.block_first_frames.items()
+            if frame < first_frame
+        }
+        return first_frame
+
+    # Switches the frame store to the file of the current track, which changes with
+    # every line edit (frames before keep_frames are unaffected by the edit)
+    def open_frame_store(self, keep_frames: int):
+        if self.frame_store is None:
+            return
+        self.frame_store.open(
+            get_track_hash(
+                self.grid.version, self.templates, self.grid.get_all_lines()
+            ),
+            self.templates,
+            keep_frames,
+        )
+        if len(self.frame_store) == 0:
+            initial_frame = self.state_cache.get(0)
+            assert initial_frame is not None
+            self.frame_store.append(0, pack_frame(initial_frame.entities))
 
-    # Primitive add and remove line methods
-    # A proper implementation would look through the grid to optimize cache clears
     def add_line(self, line: Union[NormalLine, AccelerationLine]):
         line.base.id = self.grid.get_max_line_id() + 1
-        self.state_cache = [self.state_cache[0]]
+        first_frame = self.invalidate_line_cells(line)
         self.grid.add_line(line)
+        self.open_frame_store(first_frame)
 
     def remove_line(self, id: int):
         line = self.grid.get_line_by_id(id)
         if line is not None:
-            self.state_cache = [self.state_cache[0]]
+            first_frame = self.invalidate_line_cells(line)
             self.grid.remove_line(line)
+            self.open_frame_store(first_frame)
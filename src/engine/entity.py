@@ -5,7 +5,7 @@ from engine.bone import NormalBone, RepelBone, MountBone, FlutterBone, BaseBone
 from engine.joint import Joint
 from engine.flags import LR_COM_SCARF
 from enum import Enum
-from typing import Union, TypedDict
+from typing import Optional, Union, TypedDict
 import math
 import utils.debug
 
@@ -86,18 +86,20 @@ class EntityState:
     # Checks if either remounting or mounted states can be entered by checking
     # that the bone stays intact with different strength/endurance remount values
     def can_enter_mount_phase(self, entity: "Entity", mount_phase: MountPhase):
-        for bone in entity.structural_bones:
+        for bone in entity.skeleton.structural_bones:
             if isinstance(bone, MountBone):
-                if not bone.get_intact(mount_phase == MountPhase.REMOUNTING):
+                if not bone.get_intact(
+                    entity.points, mount_phase == MountPhase.REMOUNTING
+                ):
                     return False
 
         if self.remount_version != RemountVersion.LRA:
-            for joint in entity.break_joints:
-                if joint.should_break():
+            for joint in entity.skeleton.break_joints:
+                if joint.should_break(entity.points):
                     return False
 
-            for joint in entity.mount_joints:
-                if joint.should_break():
+            for joint in entity.skeleton.mount_joints:
+                if joint.should_break(entity.points):
                     return False
 
         return True
@@ -138,22 +140,47 @@ class EntityState:
         return new_state
 
 
+# Everything about an entity that stays the same between frames (which points
+# collide, bones with their rest lengths, joints), which gets built once per entity
+# and shared by every copy of it
+class Skeleton:
+    def __init__(self):
+        self.contact_points: list[ContactPoint] = []
+        # Contact points of each part held together by its bones (the sled and the
+        # rider), which stay close to each other even when the parts separate
+        self.contact_groups: list[list[ContactPoint]] = []
+        self.flutter_points: list[FlutterPoint] = []
+        self.structural_bones: list[Union[NormalBone, MountBone, RepelBone]] = []
+        self.flutter_bones: list[FlutterBone] = []
+        self.bones: list[BaseBone] = []
+        self.break_joints: list[Joint] = []
+        self.mount_joints: list[Joint] = []
+
+
 # A hardcoded entity implementation for just the default rider and sled
 # A proper implementation adding support for custom skeletons would likely
 # separate the rider and sled as general skeleton entities and add a general
 # connection class for how to connect those skeleton entities with mount bones
 # and mount joints
 class Entity:
-    def __init__(self, state: EntityState):
+    def __init__(
+        self,
+        state: EntityState,
+        skeleton: Optional[Skeleton] = None,
+        points: Optional[list[BasePoint]] = None,
+    ):
         self.state = state
-        self.contact_points: list[ContactPoint] = []
-        self.flutter_points: list[FlutterPoint] = []
+        # Variable scoped to this class for checking dismount during this frame
+        self.dismounted_this_frame = False
+
+        if skeleton is not None and points is not None:
+            # Copy of an existing entity
+            self.skeleton = skeleton
+            self.points = points
+            return
+
+        self.skeleton = Skeleton()
         self.points: list[BasePoint] = []
-        self.structural_bones: list[Union[NormalBone, MountBone, RepelBone]] = []
-        self.flutter_bones: list[FlutterBone] = []
-        self.bones: list[BaseBone] = []
-        self.break_joints: list[Joint] = []
-        self.mount_joints: list[Joint] = []
 
         LRA = self.state.remount_version == RemountVersion.LRA
         MOUNT_ENDURANCE = 0.057
@@ -179,6 +206,10 @@ class Entity:
         LEFT_HAND = self.add_contact_point(Vector(11.5, -5.0), 0.1)
         LEFT_FOOT = self.add_contact_point(Vector(10.0, 5.0), 0.0)
         RIGHT_FOOT = self.add_contact_point(Vector(10.0, 5.0), 0.0)
+        self.skeleton.contact_groups = [
+            self.skeleton.contact_points[PEG:BUTT],
+            self.skeleton.contact_points[BUTT : RIGHT_FOOT + 1],
+        ]
         SCARF_0 = self.add_flutter_point(Vector(3, -5.5), SCARF_FRICTION)
         SCARF_1 = self.add_flutter_point(Vector(1, -5.5), SCARF_FRICTION)
         SCARF_2 = self.add_flutter_point(Vector(-1, -5.5), SCARF_FRICTION)
@@ -231,16 +262,13 @@ class Entity:
         self.add_mount_joint(TORSO, SLED_FRONT)
         self.add_break_joint(SLED_BACK, SLED_FRONT)
 
-        # Variable scoped to this class for checking dismount during this frame
-        self.dismounted_this_frame = False
-
     def apply_initial_state(self):
         # This updates the contact points with initial position, velocity, and initial rotation
         # Note that the use of cos and sin here may not give the same results for all numbers in different languages
         # This gets tested with 50 degrees so it happens to pass the test case
         cos_theta = math.cos(self.state.init_state["ROTATION"] * math.pi / 180)
         sin_theta = math.sin(self.state.init_state["ROTATION"] * math.pi / 180)
-        origin = self.contact_points[1].base.position  # Hardcoded to be tail
+        origin = self.points[1].position  # Hardcoded to be tail
 
         for point in self.points:
             offset = point.position - origin
@@ -260,13 +288,16 @@ class Entity:
                 start_position, start_velocity, start_position - start_velocity
             )
 
+    # Only the point state and entity state get copied, the skeleton is shared
     def copy(self):
-        new_entity = Entity(self.state.copy())
-
-        for i in range(len(self.points)):
-            new_entity.points[i].copy(self.points[i])
-
-        return new_entity
+        return Entity(
+            self.state.copy(),
+            self.skeleton,
+            [
+                BasePoint(point.position, point.velocity, point.previous_position)
+                for point in self.points
+            ],
+        )
 
     # Hard coded function to swap sleds between two entities
     # Full implementation should have a proper mount bone connection system
@@ -286,59 +317,61 @@ class Entity:
             self.points[i].copy(other.points[i])
             other.points[i].copy(point)
 
-    def add_contact_point(self, start_position: Vector, friction: float):
-        point = ContactPoint(start_position, friction)
-        self.points.append(point.base)
-        self.contact_points.append(point)
+    def add_point(self, start_position: Vector):
+        self.points.append(BasePoint(start_position, Vector(0, 0), start_position))
         return len(self.points) - 1
 
+    def add_contact_point(self, start_position: Vector, friction: float):
+        index = self.add_point(start_position)
+        self.skeleton.contact_points.append(ContactPoint(index, friction))
+        return index
+
     def add_flutter_point(self, start_position: Vector, air_friction: float):
-        point = FlutterPoint(start_position, air_friction)
-        self.points.append(point.base)
-        self.flutter_points.append(point)
-        return len(self.points) - 1
+        index = self.add_point(start_position)
+        self.skeleton.flutter_points.append(FlutterPoint(index, air_friction))
+        return index
 
     def add_normal_bone(self, point1: int, point2: int):
-        bone = NormalBone(self.points[point1], self.points[point2])
-        self.bones.append(bone.base)
-        self.structural_bones.append(bone)
-        return len(self.bones) - 1
+        bone = NormalBone(self.points, point1, point2)
+        self.skeleton.bones.append(bone.base)
+        self.skeleton.structural_bones.append(bone)
+        return len(self.skeleton.bones) - 1
 
     def add_mount_bone(self, point1: int, point2: int, endurance: float):
-        bone = MountBone(self.points[point1], self.points[point2], endurance)
-        self.bones.append(bone.base)
-        self.structural_bones.append(bone)
-        return len(self.bones) - 1
+        bone = MountBone(self.points, point1, point2, endurance)
+        self.skeleton.bones.append(bone.base)
+        self.skeleton.structural_bones.append(bone)
+        return len(self.skeleton.bones) - 1
 
     def add_repel_bone(self, point1: int, point2: int, length_factor: float):
-        bone = RepelBone(self.points[point1], self.points[point2], length_factor)
-        self.bones.append(bone.base)
-        self.structural_bones.append(bone)
-        return len(self.bones) - 1
+        bone = RepelBone(self.points, point1, point2, length_factor)
+        self.skeleton.bones.append(bone.base)
+        self.skeleton.structural_bones.append(bone)
+        return len(self.skeleton.bones) - 1
 
     def add_flutter_bone(self, point1: int, point2: int):
-        bone = FlutterBone(self.points[point1], self.points[point2])
-        self.bones.append(bone.base)
-        self.flutter_bones.append(bone)
-        return len(self.bones) - 1
+        bone = FlutterBone(self.points, point1, point2)
+        self.skeleton.bones.append(bone.base)
+        self.skeleton.flutter_bones.append(bone)
+        return len(self.skeleton.bones) - 1
 
     def add_break_joint(self, bone1: int, bone2: int):
-        joint = Joint(self.bones[bone1], self.bones[bone2])
-        self.break_joints.append(joint)
+        joint = Joint(self.skeleton.bones[bone1], self.skeleton.bones[bone2])
+        self.skeleton.break_joints.append(joint)
 
     def add_mount_joint(self, bone1: int, bone2: int):
-        joint = Joint(self.bones[bone1], self.bones[bone2])
-        self.mount_joints.append(joint)
+        joint = Joint(self.skeleton.bones[bone1], self.skeleton.bones[bone2])
+        self.skeleton.mount_joints.append(joint)
 
     def process_initial_points(self, gravity: Vector):
-        for point in self.contact_points:
-            point.initial_step(gravity)
+        for point in self.skeleton.contact_points:
+            point.initial_step(self.points, gravity)
 
         if utils.debug.at_breakpoint("Contact point gravity"):
             return
 
-        for point in self.flutter_points:
-            point.initial_step(gravity)
+        for point in self.skeleton.flutter_points:
+            point.initial_step(self.points, gravity)
 
         if utils.debug.at_breakpoint("Flutter point gravity"):
             return
@@ -347,7 +380,7 @@ class Entity:
         REMOUNT_STRENGTH_FACTOR = 0.1
         LRA_REMOUNT_STRENGTH_FACTOR = 0.5
 
-        for bone_index, bone in enumerate(self.structural_bones):
+        for bone_index, bone in enumerate(self.skeleton.structural_bones):
             if isinstance(bone, NormalBone) or isinstance(bone, RepelBone):
                 if (
                     self.state.remount_version == RemountVersion.LRA
@@ -358,7 +391,7 @@ class Entity:
                 else:
                     strength = 1
 
-                bone.process(strength)
+                bone.process(self.points, strength)
             else:
                 if (
                     self.state.remount_version == RemountVersion.LRA
@@ -376,21 +409,21 @@ class Entity:
                         self.state.remount_version == RemountVersion.LRA
                         and initial_phase == MountPhase.REMOUNTING
                     ):
-                        intact = bone.get_intact(True)
+                        intact = bone.get_intact(self.points, True)
                         strength = LRA_REMOUNT_STRENGTH_FACTOR
                     elif (
                         self.state.remount_version != RemountVersion.LRA
                         and self.state.mount_phase == MountPhase.REMOUNTING
                     ):
-                        intact = bone.get_intact(True)
+                        intact = bone.get_intact(self.points, True)
                         strength = REMOUNT_STRENGTH_FACTOR
                     else:
-                        intact = bone.get_intact(False)
+                        intact = bone.get_intact(self.points, False)
                         strength = 1
 
                     if not self.dismounted_this_frame:
                         if intact:
-                            bone.process(strength)
+                            bone.process(self.points, strength)
                         else:
                             self.dismounted_this_frame = True
                             self.state.dismount()
@@ -399,23 +432,24 @@ class Entity:
                 return
 
     def process_collisions(self, grid: Grid):
-        for point_index, point in enumerate(self.contact_points):
-            interacting_lines = grid.get_lines_near_position(point.base.position)
+        for point_index, point in enumerate(self.skeleton.contact_points):
+            base = self.points[point.index]
+            interacting_lines = grid.get_lines_near_position(base.position)
             for line in interacting_lines:
-                new_pos, new_prev_pos = line.interact(point)
-                point.base.update_state(new_pos, point.base.velocity, new_prev_pos)
+                new_pos, new_prev_pos = line.interact(base, point.friction)
+                base.update_state(new_pos, base.velocity, new_prev_pos)
 
             if utils.debug.at_breakpoint(f"Point collisions {point_index}"):
                 return
 
     def process_flutter_bones(self):
-        for bone in self.flutter_bones:
-            bone.process()
+        for bone in self.skeleton.flutter_bones:
+            bone.process(self.points)
 
     def process_mount_joints(self):
         if self.state.is_mounted():
-            for joint in self.mount_joints:
-                if joint.should_break() and not self.dismounted_this_frame:
+            for joint in self.skeleton.mount_joints:
+                if joint.should_break(self.points) and not self.dismounted_this_frame:
                     self.dismounted_this_frame = True
                     self.state.dismount()
                     if self.state.remount_version == RemountVersion.LRA:
@@ -427,8 +461,8 @@ class Entity:
             self.state.remount_version != RemountVersion.LRA
             and self.state.remount_version != RemountVersion.COM_V1
         ) or self.state.is_mounted():
-            for joint in self.break_joints:
-                if self.state.sled_is_intact() and joint.should_break():
+            for joint in self.skeleton.break_joints:
+                if self.state.sled_is_intact() and joint.should_break(self.points):
                     self.state.break_sled()
 
     def process_skeleton(self, gravity: Vector, grid: Grid):
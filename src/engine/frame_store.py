@@ -0,0 +1,198 @@
+# Persistent storage of simulated frames, so that reopening a track does not need to
+# simulate it again
+# Each track gets its own file in the store directory, named by a hash of everything
+# that affects the simulation, holding fixed size frame records in frame order
+# Records get read through a memory map without copying
+# Several processes can use the same file (batch workers simulating the same track),
+# so it only gets changed while holding an exclusive lock on it, where the platform
+# has file locks
+
+from engine.cache import EntityTemplate, PackedFrame, get_record_size
+from engine.grid import GridVersion
+from engine.line import NormalLine, AccelerationLine
+from engine.flags import LR_COM_SCARF, GRAVITY_FIX
+from utils.debug import to_raw_hex
+from typing import BinaryIO, Optional, Union
+import hashlib
+import mmap
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+# Bump when the record layout or physics change, so older files stop being used
+STORE_VERSION = 1
+
+
+def get_track_hash(
+    grid_version: GridVersion,
+    templates: tuple[EntityTemplate, ...],
+    lines: list[Union[NormalLine, AccelerationLine]],
+) -> str:
+    track_hash = hashlib.sha256()
+    track_hash.update(
+        f"{STORE_VERSION} {LR_COM_SCARF} {GRAVITY_FIX} {grid_version.name}\n".encode()
+    )
+
+    for _, init_state, remount_version in templates:
+        track_hash.update(
+            (
+                f"rider {init_state['POSITION'].hex()} {init_state['VELOCITY'].hex()} "
+                f"{to_raw_hex(init_state['ROTATION'])} {init_state['CAN_REMOUNT']} "
+                f"{remount_version.name}\n"
+            ).encode()
+        )
+
+    for line in sorted(lines, key=lambda line: line.base.id):
+        base = line.base
+        acceleration = ""
+        if isinstance(line, AccelerationLine):
+            acceleration = to_raw_hex(line.acceleration)
+        track_hash.update(
+            (
+                f"line {base.id} {base.endpoints[0].hex()} {base.endpoints[1].hex()} "
+                f"{base.flipped} {base.left_ext} {base.right_ext} "
+                f"{type(line).__name__} {acceleration}\n"
+            ).encode()
+        )
+
+    return track_hash.hexdigest()
+
+
+class FrameStore:
+    FILE_EXTENSION = ".frames"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path: Optional[str] = None
+        self.file: Optional[BinaryIO] = None
+        self.map: Optional[mmap.mmap] = None
+        self.templates: tuple[EntityTemplate, ...] = ()
+        self.record_size = 0
+        self.num_frames = 0
+        # Frames written to the file but not yet visible through the map
+        self.unflushed = False
+
+    def __len__(self):
+        return self.num_frames
+
+    # Switches to the file of the given track
+    # The first keep_frames frames of the currently open track are known to be the
+    # same for the new track, so they get copied over if the new file has fewer
+    def open(
+        self,
+        track_hash: str,
+        templates: tuple[EntityTemplate, ...],
+        keep_frames: int = 0,
+    ):
+        path = os.path.join(self.directory, track_hash + self.FILE_EXTENSION)
+        if path == self.path:
+            return
+
+        previous_map = self.get_map()
+        previous_frames = self.num_frames
+        previous_record_size = self.record_size
+        self.close()
+
+        self.path = path
+        self.templates = templates
+        self.record_size = get_record_size(templates)
+        self.file = open(path, "a+b")
+        self.lock()
+        try:
+            # Drop a partially written record, if writing was interrupted
+            self.num_frames = self.get_stored_frames()
+            self.file.truncate(self.num_frames * self.record_size)
+
+            keep_frames = min(keep_frames, previous_frames)
+            if (
+                previous_map is not None
+                and previous_record_size == self.record_size
+                and self.num_frames < keep_frames
+            ):
+                self.file.write(
+                    previous_map[
+                        self.num_frames * self.record_size : keep_frames
+                        * self.record_size
+                    ]
+                )
+                self.file.flush()
+                self.num_frames = keep_frames
+                self.unflushed = True
+        finally:
+            self.unlock()
+
+    def lock(self):
+        if fcntl is not None and self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+    def unlock(self):
+        if fcntl is not None and self.file is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    # Whole records in the file, including frames other processes have written
+    def get_stored_frames(self) -> int:
+        assert self.file is not None
+        return os.fstat(self.file.fileno()).st_size // self.record_size
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.path = None
+        self.file = None
+        # The map is left for the garbage collector, since frames read from it may
+        # still be referencing it
+        self.map = None
+        self.num_frames = 0
+        self.unflushed = False
+
+    def get_map(self) -> Optional[mmap.mmap]:
+        if self.file is None or self.num_frames == 0:
+            return None
+        if self.unflushed:
+            self.file.flush()
+            self.unflushed = False
+            self.map = None
+        if self.map is None:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def get(self, frame: int) -> Optional[PackedFrame]:
+        if not 0 <= frame < self.num_frames:
+            return None
+
+        frame_map = self.get_map()
+        assert frame_map is not None
+        record = memoryview(frame_map)[
+            frame * self.record_size : (frame + 1) * self.record_size
+        ]
+        states_offset = self.record_size - len(self.templates) * (
+            PackedFrame.STATE_FORMAT.size
+        )
+        return PackedFrame(
+            self.templates,
+            record[:states_offset].cast("d"),
+            record[states_offset:],
+        )
+
+    # Frames can only be added in order, since records are stored by frame
+    # Another process may have added the frame already (simulating the same frames),
+    # which leaves it to that copy
+    def append(self, frame: int, packed_frame: PackedFrame):
+        if self.file is None or frame != self.num_frames:
+            return
+        self.lock()
+        try:
+            num_frames = self.get_stored_frames()
+            if num_frames == frame:
+                self.file.write(packed_frame.get_record())
+                # Visible to other processes before the lock gets released
+                self.file.flush()
+                num_frames += 1
+            self.num_frames = num_frames
+            self.unflushed = True
+        finally:
+            self.unlock()
@@ -1,17 +1,55 @@
 from engine.vector import Vector
-from engine.line import NormalLine, AccelerationLine
+from engine.line import NormalLine, AccelerationLine, LineRecord
+from engine.line_tiles import LineTiles
+from array import array
 from enum import Enum
 from typing import Optional, Union
 import math
 
 
+# Width and height of the blocks of cells that is_area_empty marks as queried
+BLOCK_CELLS = 4
+# Distances to the nearest cell with lines only get searched up to this many cells
+MAX_CELL_DISTANCE = 8
+# Neighborhoods cached at most, the oldest get dropped past this, so that the cache
+# does not grow with the distance riders travel (a long track needs a few thousand)
+MAX_NEIGHBORHOODS = 4096
+# Same for the cell distances and block ranges of is_area_empty (a long track needs
+# a few thousand cell distances)
+MAX_CELL_DISTANCES = 16384
+MAX_RANGE_BLOCKS = 4096
+
+
 class GridVersion(Enum):
     V6_2 = 0
     V6_1 = 1
     V6_0 = 2
 
 
+# No specific implementation necessary, just needs to be deterministic and unique for any pair of signed integers
+# https://github.com/conundrumer/lr-core/blob/ce48ebed967d24ff4582995b31342440901f913d/src/utils/hashNumberPair.js#L16C1-L21C2
+def get_cell_key(x: int, y: int) -> int:
+    if x >= 0:
+        A = 2 * x
+    else:
+        A = -2 * x - 1
+    if y >= 0:
+        B = 2 * y
+    else:
+        B = -2 * y - 1
+    if A >= B:
+        C = A * A + A + B
+    else:
+        C = B * B + A
+    if C % 2 == 1:
+        return -(C - 1) // 2 - 1
+    else:
+        return C // 2
+
+
 class CellPosition:
+    __slots__ = ("cell_size", "world_position", "x", "y", "remainder")
+
     def __init__(self, world_position: Vector, cell_size: int):
         self.cell_size = cell_size
         self.world_position = world_position.copy()
@@ -19,50 +57,54 @@ class CellPosition:
         self.y = math.floor(world_position.y / cell_size)
         self.remainder = self.world_position - cell_size * Vector(self.x, self.y)
 
-    # No specific implementation necessary, just needs to be deterministic and unique for any pair of signed integers
-    # https://github.com/conundrumer/lr-core/blob/ce48ebed967d24ff4582995b31342440901f913d/src/utils/hashNumberPair.js#L16C1-L21C2
     def get_key(self) -> int:
-        if self.x >= 0:
-            A = 2 * self.x
-        else:
-            A = -2 * self.x - 1
-        if self.y >= 0:
-            B = 2 * self.y
-        else:
-            B = -2 * self.y - 1
-        if A >= B:
-            C = A * A + A + B
-        else:
-            C = B * B + A
-        if C % 2 == 1:
-            return -(C - 1) // 2 - 1
-        else:
-            return C // 2
+        return get_cell_key(self.x, self.y)
 
 
-# A container for lines that serves as an ordered list (descending line id order)
+# Keys of the cells of a neighborhood, with their lines and the records of the lines
+Neighborhood = tuple[
+    tuple[int, ...], list[Union[NormalLine, AccelerationLine]], list[LineRecord]
+]
+
+
+# A container for the lines in a cell, as indices into the line table of the grid
+# (Grid.lines), in descending id order (lines with equal ids in the order they were
+# added)
+# Indices are kept in an array instead of a list of lines and a set of ids, since
+# large tracks have many cells and lines spanning many of them
 class GridCell:
-    def __init__(self, position: CellPosition):
-        self.lines: list[Union[NormalLine, AccelerationLine]] = []
-        self.ids = set()
-        self.position = position
-
-    def add_line(self, new_line: Union[NormalLine, AccelerationLine]):
-        for i, line in enumerate(self.lines):
-            if line.base.id < new_line.base.id:
-                self.lines.insert(i, new_line)
-                self.ids.add(new_line.base.id)
+    __slots__ = ("line_indices", "x", "y")
+
+    def __init__(self, x: int, y: int):
+        self.line_indices = array("q")
+        # Column and row of the cell
+        self.x = x
+        self.y = y
+
+    # line_ids holds the id of the line at each index of the table
+    def add_line(self, index: int, line_ids: array):
+        line_id = line_ids[index]
+        for i, other_index in enumerate(self.line_indices):
+            if line_ids[other_index] < line_id:
+                self.line_indices.insert(i, index)
                 return
 
-        self.lines.append(new_line)
-        self.ids.add(new_line.base.id)
+        self.line_indices.append(index)
 
-    def remove_line(self, line_id: int):
-        for i, line in enumerate(self.lines):
-            if line.base.id == line_id:
-                del self.lines[i]
-                self.ids.remove(line_id)
-                return
+    # Takes indices in descending id order, which are all newer than the ones in the
+    # cell, so a stable sort keeps lines with equal ids in the order they were added
+    def add_lines(self, indices: list[int], line_ids: array):
+        if self.line_indices:
+            indices = sorted(
+                self.line_indices + array("q", indices),
+                key=line_ids.__getitem__,
+                reverse=True,
+            )
+        self.line_indices = array("q", indices)
+
+    def remove_line(self, index: int):
+        if index in self.line_indices:
+            self.line_indices.remove(index)
 
 
 # A grid of GridCells that processes all of the lines
@@ -71,241 +113,621 @@ class Grid:
         self.version = version
         self.cells: dict[int, GridCell] = {}
         self.cell_size = cell_size
+        # Keys of every cell queried by get_lines_near_position since this was last cleared
+        self.queried_cells: set[int] = set()
+        # Table of the lines in the grid, in the order they were added, and the id of
+        # each one (removed lines leave None behind, so indices stay valid)
+        self.lines: list[Optional[Union[NormalLine, AccelerationLine]]] = []
+        self.line_ids = array("q")
+        # Keys of the cells each line in the table is in, by table index
+        self.line_cell_keys: dict[int, list[int]] = {}
+        # Table index of the first line with each id, and of all the lines with ids
+        # more than one line has (tracks can have those, and they all collide)
+        self.indices_by_id: dict[int, int] = {}
+        self.duplicate_indices: dict[int, list[int]] = {}
+        self.max_line_id = -1
+        # Ids of the lines in ascending order, for finding the largest id left when
+        # the line with the largest one gets removed (ids of removed lines get skipped)
+        # Lines usually get added in ascending id order, which only appends, otherwise
+        # this is None until it is needed again
+        self.sorted_ids: Optional[list[int]] = []
+        # Keys and lines of the 3 x 3 cells around queried positions, by the cell
+        # columns and rows they span (see query_neighborhood)
+        self.neighborhoods: dict[tuple[int, ...], Neighborhood] = {}
+        self.max_neighborhoods = MAX_NEIGHBORHOODS
+        # Neighborhoods that include each cell, by cell key
+        self.cell_neighborhoods: dict[int, set[tuple[int, ...]]] = {}
+        # Cells with lines in them, by cell column and row
+        self.occupied_cells: set[tuple[int, int]] = set()
+        # Distance from cells to the nearest cell with lines (in cells along either
+        # axis, up to MAX_CELL_DISTANCE), by cell column and row, filled in as cells
+        # get checked and cleared when cells get or lose their lines
+        self.cell_distances: dict[tuple[int, int], int] = {}
+        self.max_cell_distances = MAX_CELL_DISTANCES
+        # Blocks checked by is_area_empty since this was last cleared, which stand in
+        # for querying each of their cells
+        self.queried_blocks: set[tuple[int, int]] = set()
+        # Blocks spanned by ranges of block columns and rows checked before
+        self.range_blocks: dict[
+            tuple[int, int, int, int], tuple[tuple[int, int], ...]
+        ] = {}
+        self.max_range_blocks = MAX_RANGE_BLOCKS
+        # Lines of the track not built yet, which get added to the grid once cells
+        # near them get used (None if every line was added up front)
+        self.line_tiles: Optional[LineTiles] = None
 
     def get_max_line_id(self) -> int:
-        max_found = -1
-        if self.cells:
-            for cell in self.cells.values():
-                if cell.lines:
-                    for line in cell.lines:
-                        if line.base.id > max_found:
-                            max_found = line.base.id
-        return max_found
+        if self.line_tiles is not None:
+            return max(self.max_line_id, self.line_tiles.get_max_line_id())
+        return self.max_line_id
 
     def get_line_by_id(
         self, line_id: int
     ) -> Optional[Union[NormalLine, AccelerationLine]]:
-        for cell in self.cells.values():
-            if line_id in cell.ids:
-                for line in cell.lines:
-                    if line.base.id == line_id:
-                        return line
+        if self.line_tiles is not None and line_id in self.line_tiles.pending_ids:
+            self.load_lines(self.line_tiles.take_line(line_id))
+        index = self.indices_by_id.get(line_id)
+        if index is None:
+            return None
+        return self.lines[index]
+
+    # Builds pending lines and adds them to the grid, which is not an edit of the
+    # track, since they were part of it all along
+    def load_lines(self, sources: list):
+        if sources:
+            assert self.line_tiles is not None
+            self.add_lines(self.line_tiles.build_lines(sources))
+
+    # Adds the pending lines that can be in the range of cells
+    def load_cells(self, first_x: int, last_x: int, first_y: int, last_y: int):
+        if self.line_tiles is not None and self.line_tiles.tiles:
+            self.load_lines(
+                self.line_tiles.take_cells(first_x, last_x, first_y, last_y)
+            )
+
+    # Table index of the line, None if it is not in the grid
+    def get_line_index(
+        self, line: Union[NormalLine, AccelerationLine]
+    ) -> Optional[int]:
+        line_id = line.base.id
+        index = self.indices_by_id.get(line_id)
+        if index is None or self.lines[index] is line:
+            return index
+        for index in self.duplicate_indices.get(line_id, ()):
+            if self.lines[index] is line:
+                return index
         return None
 
+    def get_num_lines(self) -> int:
+        return len(self.line_cell_keys)
+
+    def find_max_line_id(self) -> int:
+        if self.sorted_ids is None:
+            self.sorted_ids = sorted(self.indices_by_id)
+        sorted_ids = self.sorted_ids
+        while sorted_ids and sorted_ids[-1] not in self.indices_by_id:
+            sorted_ids.pop()
+        return sorted_ids[-1] if sorted_ids else -1
+
+    # Adds the line to the table, returning its table index
+    def index_line(self, line: Union[NormalLine, AccelerationLine]) -> int:
+        line_id = line.base.id
+        index = len(self.lines)
+        self.lines.append(line)
+        self.line_ids.append(line_id)
+        self.line_cell_keys[index] = []
+        first_index = self.indices_by_id.get(line_id)
+        if first_index is None:
+            self.indices_by_id[line_id] = index
+        else:
+            duplicate_indices = self.duplicate_indices.get(line_id)
+            if duplicate_indices is None:
+                duplicate_indices = self.duplicate_indices[line_id] = [first_index]
+            duplicate_indices.append(index)
+        if line_id >= self.max_line_id:
+            self.max_line_id = line_id
+            if self.sorted_ids is not None:
+                self.sorted_ids.append(line_id)
+        else:
+            self.sorted_ids = None
+        return index
+
+    # Removes the line from the table, returning its table index and the keys of the
+    # cells it was in
+    def unindex_line(
+        self, line: Union[NormalLine, AccelerationLine]
+    ) -> tuple[int, list[int]]:
+        index = self.get_line_index(line)
+        if index is None:
+            return -1, []
+        line_id = line.base.id
+        self.lines[index] = None
+        cell_keys = self.line_cell_keys.pop(index)
+        duplicate_indices = self.duplicate_indices.get(line_id)
+        if duplicate_indices is None:
+            del self.indices_by_id[line_id]
+            if line_id == self.max_line_id:
+                self.max_line_id = self.find_max_line_id()
+        else:
+            duplicate_indices.remove(index)
+            self.indices_by_id[line_id] = duplicate_indices[0]
+            if len(duplicate_indices) == 1:
+                del self.duplicate_indices[line_id]
+        return index, cell_keys
+
     def add_line(self, line: Union[NormalLine, AccelerationLine]):
-        for position in self.get_cell_positions_between(
+        index = self.index_line(line)
+        for cell_x, cell_y, _, _ in self.get_cells_between(
             line.base.endpoints[0], line.base.endpoints[1]
         ):
-            self.register(line, position)
-
+            self.register(index, cell_x, cell_y)
+
+    # Adds many lines at once, grouping them by cell so that cells do not need to
+    # insert each line in order
+    # Cells get created in the same order as adding the lines one at a time, then
+    # lines get sorted once and handed to their cells in descending id order
+    def add_lines(self, lines: list[Union[NormalLine, AccelerationLine]]):
+        indices = []
+        for line in lines:
+            index = self.index_line(line)
+            cell_keys = self.line_cell_keys[index]
+            for cell_x, cell_y, _, _ in self.get_cells_between(
+                line.base.endpoints[0], line.base.endpoints[1]
+            ):
+                cell_key = get_cell_key(cell_x, cell_y)
+                if cell_key not in self.cells:
+                    self.cells[cell_key] = GridCell(cell_x, cell_y)
+                cell_keys.append(cell_key)
+            indices.append(index)
+
+        # Sorting is stable, so lines with equal ids stay in the order they were added
+        new_indices: dict[int, list[int]] = {}
+        for index in sorted(indices, key=self.line_ids.__getitem__, reverse=True):
+            for cell_key in self.line_cell_keys[index]:
+                cell_indices = new_indices.get(cell_key)
+                if cell_indices is None:
+                    cell_indices = new_indices[cell_key] = []
+                cell_indices.append(index)
+
+        for cell_key, cell_indices in new_indices.items():
+            cell = self.cells[cell_key]
+            if not cell.line_indices:
+                self.occupy_cell(cell)
+            cell.add_lines(cell_indices, self.line_ids)
+            self.invalidate_neighborhoods(cell_key)
+
+    # Only visits the cells the line is in
     def remove_line(self, line: Union[NormalLine, AccelerationLine]):
-        for position in self.get_cell_positions_between(
-            line.base.endpoints[0], line.base.endpoints[1]
-        ):
-            self.unregister(line, position)
-
-    def move_line(
-        self,
-        old_point1: Vector,
-        old_point2: Vector,
-        line: Union[NormalLine, AccelerationLine],
-    ):
-        for position in self.get_cell_positions_between(old_point1, old_point2):
-            self.unregister(line, position)
-
-        for position in self.get_cell_positions_between(
-            line.base.endpoints[0], line.base.endpoints[1]
-        ):
-            self.register(line, position)
-
-    def register(
-        self, line: Union[NormalLine, AccelerationLine], position: CellPosition
-    ):
-        cell_key = position.get_key()
+        index, cell_keys = self.unindex_line(line)
+        for cell_key in cell_keys:
+            cell = self.cells.get(cell_key)
+            if cell is not None:
+                had_lines = bool(cell.line_indices)
+                cell.remove_line(index)
+                if had_lines and not cell.line_indices:
+                    self.vacate_cell(cell)
+            self.invalidate_neighborhoods(cell_key)
+
+    # Moves a line to the cells of its current endpoints, the grid keeps track of
+    # which cells it was in before
+    # The line gets a new table index, so it goes after lines with an equal id, the
+    # same as removing and adding it again
+    def move_line(self, line: Union[NormalLine, AccelerationLine]):
+        self.remove_line(line)
+        self.add_line(line)
+
+    def register(self, index: int, cell_x: int, cell_y: int):
+        cell_key = get_cell_key(cell_x, cell_y)
         if cell_key not in self.cells:
-            self.cells[cell_key] = GridCell(
-                self.get_cell_position(position.world_position)
-            )
-        self.cells[cell_key].add_line(line)
-
-    def unregister(
-        self, line: Union[NormalLine, AccelerationLine], position: CellPosition
-    ):
-        cell_key = position.get_key()
-        if cell_key in self.cells:
-            self.cells[cell_key].remove_line(line.base.id)
-
-    def get_cell(self, position: Vector):
-        cell_position = self.get_cell_position(position)
-        cell_key = cell_position.get_key()
-        if cell_key in self.cells:
-            return self.cells[cell_key]
-        return None
-
+            self.cells[cell_key] = GridCell(cell_x, cell_y)
+        cell = self.cells[cell_key]
+        if not cell.line_indices:
+            self.occupy_cell(cell)
+        cell.add_line(index, self.line_ids)
+        self.line_cell_keys[index].append(cell_key)
+        self.invalidate_neighborhoods(cell_key)
+
+    # Block of cells a cell is in, by block column and row
+    def get_block(self, cell_x: int, cell_y: int) -> tuple[int, int]:
+        return (cell_x // BLOCK_CELLS, cell_y // BLOCK_CELLS)
+
+    # Called when a cell gets its first line
+    def occupy_cell(self, cell: GridCell):
+        self.occupied_cells.add((cell.x, cell.y))
+        self.cell_distances.clear()
+
+    # Called when the last line of a cell gets removed
+    def vacate_cell(self, cell: GridCell):
+        self.occupied_cells.discard((cell.x, cell.y))
+        self.cell_distances.clear()
+
+    # Distance from the cell of the position to the nearest cell with lines
+    def get_position_distance(self, x: float, y: float) -> int:
+        return self.get_cell_distance(
+            math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+        )
+
+    def get_cell_distance(self, cell_x: int, cell_y: int) -> int:
+        distance = self.cell_distances.get((cell_x, cell_y))
+        if distance is None:
+            distance = self.find_cell_distance(cell_x, cell_y)
+            # Dicts keep insertion order, so the first distance is the oldest
+            if len(self.cell_distances) >= self.max_cell_distances:
+                del self.cell_distances[next(iter(self.cell_distances))]
+            self.cell_distances[(cell_x, cell_y)] = distance
+        return distance
+
+    # Searches rings of cells of increasing distance around the cell
+    def find_cell_distance(self, cell_x: int, cell_y: int) -> int:
+        self.load_cells(
+            cell_x - MAX_CELL_DISTANCE + 1,
+            cell_x + MAX_CELL_DISTANCE - 1,
+            cell_y - MAX_CELL_DISTANCE + 1,
+            cell_y + MAX_CELL_DISTANCE - 1,
+        )
+        occupied_cells = self.occupied_cells
+        if (cell_x, cell_y) in occupied_cells:
+            return 0
+        for distance in range(1, MAX_CELL_DISTANCE):
+            for offset in range(-distance, distance + 1):
+                if (
+                    (cell_x + offset, cell_y - distance) in occupied_cells
+                    or (cell_x + offset, cell_y + distance) in occupied_cells
+                    or (cell_x - distance, cell_y + offset) in occupied_cells
+                    or (cell_x + distance, cell_y + offset) in occupied_cells
+                ):
+                    return distance
+        return MAX_CELL_DISTANCE
+
+    # Drops the cached neighborhoods that include a cell, when its lines change
+    def invalidate_neighborhoods(self, cell_key: int):
+        for neighborhood_key in self.cell_neighborhoods.pop(cell_key, ()):
+            self.drop_neighborhood(neighborhood_key)
+
+    # Removes a neighborhood from the cache, along with its entries in the
+    # neighborhoods of its cells
+    def drop_neighborhood(self, neighborhood_key: tuple[int, ...]):
+        neighborhood = self.neighborhoods.pop(neighborhood_key, None)
+        if neighborhood is None:
+            return
+        for cell_key in neighborhood[0]:
+            neighborhood_keys = self.cell_neighborhoods.get(cell_key)
+            if neighborhood_keys is not None:
+                neighborhood_keys.discard(neighborhood_key)
+                if not neighborhood_keys:
+                    del self.cell_neighborhoods[cell_key]
+
+    # Lines of the cell, in descending id order
+    def get_cell_lines(
+        self, cell: GridCell
+    ) -> list[Union[NormalLine, AccelerationLine]]:
+        lines = self.lines
+        return [lines[index] for index in cell.line_indices]
+
+    def get_cell(self, position: Vector) -> Optional[GridCell]:
+        cell_x = math.floor(position.x / self.cell_size)
+        cell_y = math.floor(position.y / self.cell_size)
+        self.load_cells(cell_x, cell_x, cell_y, cell_y)
+        return self.cells.get(get_cell_key(cell_x, cell_y))
+
+    # Key of the cell containing the position, without building a CellPosition
+    def get_position_key(self, position: Vector) -> int:
+        return get_cell_key(
+            math.floor(position.x / self.cell_size),
+            math.floor(position.y / self.cell_size),
+        )
+
+    # Only needed where the position within the cell matters (line rasterization)
     def get_cell_position(self, position: Vector) -> CellPosition:
         return CellPosition(position, self.cell_size)
 
-    def get_next_position(
-        self,
-        curr_pos: Vector,
-        curr_cell_pos: CellPosition,
-        point1: Vector,
-        point2: Vector,
-    ) -> Vector:
-        line_vector = point2 - point1
-
-        if line_vector.x > 0:
-            delta_x = self.cell_size - curr_cell_pos.remainder.x
-        else:
-            delta_x = -1 - curr_cell_pos.remainder.x
+    # Cells a line between the points is registered in, along with the position each
+    # cell was reached at, as (cell x, cell y, position x, position y)
+    def get_cells_between(
+        self, point1: Vector, point2: Vector
+    ) -> list[tuple[int, int, float, float]]:
+        if self.version == GridVersion.V6_0:
+            return self.filter_cells_between(point1, point2)
+        return self.step_cells_between(point1, point2)
 
-        if line_vector.y > 0:
-            delta_y = self.cell_size - curr_cell_pos.remainder.y
-        else:
-            delta_y = -1 - curr_cell_pos.remainder.y
+    # DDA stepping used by 6.1 and 6.2, on plain floats
+    # Each step moves to the next cell boundary along the line, with the quirks of
+    # each version (6.2 steps differently in negative cells, 6.1 rounds positions)
+    def step_cells_between(
+        self, point1: Vector, point2: Vector
+    ) -> list[tuple[int, int, float, float]]:
+        cell_size = self.cell_size
+        x = point1.x
+        y = point1.y
+        cell_x = math.floor(x / cell_size)
+        cell_y = math.floor(y / cell_size)
+        final_cell_x = math.floor(point2.x / cell_size)
+        final_cell_y = math.floor(point2.y / cell_size)
+
+        if (x == point2.x and y == point2.y) or (
+            cell_x == final_cell_x and cell_y == final_cell_y
+        ):
+            return [(cell_x, cell_y, x, y)]
+
+        lower_bound_x = min(cell_x, final_cell_x)
+        lower_bound_y = min(cell_y, final_cell_y)
+        upper_bound_x = max(cell_x, final_cell_x)
+        upper_bound_y = max(cell_y, final_cell_y)
+
+        vector_x = point2.x - x
+        vector_y = point2.y - y
+        positive_x = vector_x > 0
+        positive_y = vector_y > 0
+        negative_correction = self.version == GridVersion.V6_2
+        rounded = self.version == GridVersion.V6_1
+        slope = y_intercept = x_per_y = y_per_x = 0.0
+        if vector_x != 0 and vector_y != 0:
+            if rounded:
+                slope = vector_y / vector_x
+                y_intercept = y - slope * x
+            else:
+                x_per_y = vector_x / vector_y
+                y_per_x = vector_y / vector_x
 
-        if self.version == GridVersion.V6_2:
-            # Add correction for negative cell positions
-            if curr_cell_pos.x < 0:
-                if line_vector.x > 0:
-                    delta_x = self.cell_size + curr_cell_pos.remainder.x
-                else:
-                    delta_x = -(self.cell_size + curr_cell_pos.remainder.x)
+        cells = []
+        while (
+            lower_bound_x <= cell_x <= upper_bound_x
+            and lower_bound_y <= cell_y <= upper_bound_y
+        ):
+            cells.append((cell_x, cell_y, x, y))
 
-            if curr_cell_pos.y < 0:
-                if line_vector.y > 0:
-                    delta_y = self.cell_size + curr_cell_pos.remainder.y
-                else:
-                    delta_y = -(self.cell_size + curr_cell_pos.remainder.y)
-
-        if line_vector.x == 0:
-            next_pos = Vector(curr_pos.x, curr_pos.y + delta_y)
-        elif line_vector.y == 0:
-            next_pos = Vector(curr_pos.x + delta_x, curr_pos.y)
-        elif self.version == GridVersion.V6_1:
-            slope = line_vector.y / line_vector.x
-            y_intercept = point1.y - slope * point1.x
-            next_x = round((curr_pos.y + delta_y - y_intercept) / slope)
-            next_y = round(slope * (curr_pos.x + delta_x) + y_intercept)
-            if abs(next_y - curr_pos.y) < abs(delta_y):
-                next_pos = Vector(curr_pos.x + delta_x, next_y)
-            elif abs(next_y - curr_pos.y) == abs(delta_y):
-                next_pos = Vector(curr_pos.x + delta_x, curr_pos.y + delta_y)
+            remainder_x = x - cell_x * cell_size
+            remainder_y = y - cell_y * cell_size
+            if positive_x:
+                delta_x = cell_size - remainder_x
             else:
-                next_pos = Vector(next_x, curr_pos.y + delta_y)
-        else:
-            y_based_delta_x = delta_y * (line_vector.x / line_vector.y)
-            x_based_delta_y = delta_x * (line_vector.y / line_vector.x)
-            next_x = curr_pos.x + y_based_delta_x
-            next_y = curr_pos.y + x_based_delta_y
-            if abs(x_based_delta_y) < abs(delta_y):
-                next_pos = Vector(curr_pos.x + delta_x, next_y)
-            elif abs(x_based_delta_y) == abs(delta_y):
-                next_pos = Vector(curr_pos.x + delta_x, curr_pos.y + delta_y)
+                delta_x = -1 - remainder_x
+            if positive_y:
+                delta_y = cell_size - remainder_y
+            else:
+                delta_y = -1 - remainder_y
+
+            if negative_correction:
+                if cell_x < 0:
+                    if positive_x:
+                        delta_x = cell_size + remainder_x
+                    else:
+                        delta_x = -(cell_size + remainder_x)
+                if cell_y < 0:
+                    if positive_y:
+                        delta_y = cell_size + remainder_y
+                    else:
+                        delta_y = -(cell_size + remainder_y)
+
+            if vector_x == 0:
+                y = y + delta_y
+            elif vector_y == 0:
+                x = x + delta_x
+            elif rounded:
+                next_x = round((y + delta_y - y_intercept) / slope)
+                next_y = round(slope * (x + delta_x) + y_intercept)
+                if abs(next_y - y) < abs(delta_y):
+                    x, y = x + delta_x, next_y
+                elif abs(next_y - y) == abs(delta_y):
+                    x, y = x + delta_x, y + delta_y
+                else:
+                    x, y = next_x, y + delta_y
             else:
-                next_pos = Vector(next_x, curr_pos.y + delta_y)
+                x_based_delta_y = delta_x * y_per_x
+                if abs(x_based_delta_y) < abs(delta_y):
+                    x, y = x + delta_x, y + x_based_delta_y
+                elif abs(x_based_delta_y) == abs(delta_y):
+                    x, y = x + delta_x, y + delta_y
+                else:
+                    x, y = x + delta_y * x_per_y, y + delta_y
 
-        return next_pos
+            next_cell_x = math.floor(x / cell_size)
+            next_cell_y = math.floor(y / cell_size)
+            # This causes a crash in 6.1, so just break early
+            if next_cell_x == cell_x and next_cell_y == cell_y:
+                break
+            cell_x = next_cell_x
+            cell_y = next_cell_y
 
-    def get_cell_positions_between(
+        return cells
+
+    # Cells in the bounding box of the line that overlap its hitbox, used by 6.0
+    # Reference: https://github.com/kevansevans/OpenLR/blob/542bb76e85aff820ae720cfc0d5af1bb4eb50969/src/hxlr/engine/Grid.hx#L251
+    # Accepted cells have their center within about half a cell of the line (along
+    # its normal), so each column only tests the rows around that band, with the
+    # same checks on each cell as testing the whole bounding box
+    def filter_cells_between(
         self, point1: Vector, point2: Vector
-    ) -> list[CellPosition]:
-        cells = []
-        initial_cell = self.get_cell_position(point1)
-        final_cell = self.get_cell_position(point2)
-        lower_bound_x = min(initial_cell.x, final_cell.x)
-        lower_bound_y = min(initial_cell.y, final_cell.y)
-        upper_bound_x = max(initial_cell.x, final_cell.x)
-        upper_bound_y = max(initial_cell.y, final_cell.y)
-        curr_pos = point1.copy()
-        curr_cell_pos = initial_cell
+    ) -> list[tuple[int, int, float, float]]:
+        cell_size = self.cell_size
+        initial_cell_x = math.floor(point1.x / cell_size)
+        initial_cell_y = math.floor(point1.y / cell_size)
+        final_cell_x = math.floor(point2.x / cell_size)
+        final_cell_y = math.floor(point2.y / cell_size)
 
         if (point1.x == point2.x and point1.y == point2.y) or (
-            initial_cell.x == final_cell.x and initial_cell.y == final_cell.y
+            initial_cell_x == final_cell_x and initial_cell_y == final_cell_y
         ):
-            return [initial_cell]
+            return [(initial_cell_x, initial_cell_y, point1.x, point1.y)]
+
+        lower_bound_x = min(initial_cell_x, final_cell_x)
+        lower_bound_y = min(initial_cell_y, final_cell_y)
+        upper_bound_x = max(initial_cell_x, final_cell_x)
+        upper_bound_y = max(initial_cell_y, final_cell_y)
+
+        vector_x = point2.x - point1.x
+        vector_y = point2.y - point1.y
+        inverse_length = 1 / math.sqrt(vector_x * vector_x + vector_y * vector_y)
+        normal_x = -vector_y * inverse_length
+        normal_y = vector_x * inverse_length
+        absolute_normal_x = abs(normal_x)
+        absolute_normal_y = abs(normal_y)
+        halfway_x = abs(vector_x) * 0.5
+        halfway_y = abs(vector_y) * 0.5
+        midpoint_x = point1.x + vector_x * 0.5
+        midpoint_y = point1.y + vector_y * 0.5
+        band = (absolute_normal_x + absolute_normal_y) * cell_size * 0.5
 
-        line_vector = point2 - point1
-        line_normal_unit = line_vector.rot_ccw() * (1 / line_vector.length())
-
-        if self.version == GridVersion.V6_0:
-            # Reference: https://github.com/kevansevans/OpenLR/blob/542bb76e85aff820ae720cfc0d5af1bb4eb50969/src/hxlr/engine/Grid.hx#L251
-            line_halfway = 0.5 * Vector(abs(line_vector.x), abs(line_vector.y))
-            line_midpoint = point1 + line_vector * 0.5
-            absolute_normal = Vector(abs(line_normal_unit.x), abs(line_normal_unit.y))
-            # Finds axis-aligned bounding box and filters it
-            for cell_x in range(lower_bound_x, upper_bound_x + 1):
-                for cell_y in range(lower_bound_y, upper_bound_y + 1):
-                    curr_pos = self.cell_size * Vector(cell_x + 0.5, cell_y + 0.5)
-                    next_cell_pos = self.get_cell_position(curr_pos)
-                    dist_between_centers = line_midpoint - curr_pos
-                    dist_from_cell_center = absolute_normal @ next_cell_pos.remainder
-                    cell_overlap_into_hitbox = (
-                        Vector(dist_from_cell_center, dist_from_cell_center)
-                        @ absolute_normal
-                    )
-                    norm_dist_between_centers = line_normal_unit @ dist_between_centers
-                    dist_from_line = abs(
-                        norm_dist_between_centers * line_normal_unit.x
-                    ) + abs(norm_dist_between_centers * line_normal_unit.y)
-                    if (
-                        line_halfway.x + next_cell_pos.remainder.x
-                        >= abs(dist_between_centers.x)
-                        and line_halfway.y + next_cell_pos.remainder.y
-                        >= abs(dist_between_centers.y)
-                        and cell_overlap_into_hitbox >= dist_from_line
-                    ):
-                        cells.append(next_cell_pos)
-        else:
-            # Performs DDA stepping
-            while (
-                lower_bound_x <= curr_cell_pos.x
-                and curr_cell_pos.x <= upper_bound_x
-                and lower_bound_y <= curr_cell_pos.y
-                and curr_cell_pos.y <= upper_bound_y
-            ):
-                cells.append(curr_cell_pos)
-                curr_pos = self.get_next_position(
-                    curr_pos, curr_cell_pos, point1, point2
+        cells = []
+        for cell_x in range(lower_bound_x, upper_bound_x + 1):
+            center_x = (cell_x + 0.5) * cell_size
+            first_y = lower_bound_y
+            last_y = upper_bound_y
+            if normal_y != 0:
+                # Rows where the distance along the normal is within the band, with a
+                # row of margin for rounding
+                offset = normal_x * (midpoint_x - center_x)
+                edge1 = (midpoint_y - (band - offset) / normal_y) / cell_size - 0.5
+                edge2 = (midpoint_y + (band + offset) / normal_y) / cell_size - 0.5
+                first_y = max(
+                    first_y, math.floor(max(min(edge1, edge2) - 1, lower_bound_y))
+                )
+                last_y = min(
+                    last_y, math.ceil(min(max(edge1, edge2) + 1, upper_bound_y))
                 )
-                next_cell_pos = self.get_cell_position(curr_pos)
 
-                # This causes a crash in 6.1, so just break early
+            next_cell_x = math.floor(center_x / cell_size)
+            remainder_x = center_x - next_cell_x * cell_size
+            between_centers_x = midpoint_x - center_x
+            for cell_y in range(first_y, last_y + 1):
+                center_y = (cell_y + 0.5) * cell_size
+                next_cell_y = math.floor(center_y / cell_size)
+                remainder_y = center_y - next_cell_y * cell_size
+                between_centers_y = midpoint_y - center_y
+                from_cell_center = (
+                    absolute_normal_x * remainder_x + absolute_normal_y * remainder_y
+                )
+                overlap_into_hitbox = (
+                    from_cell_center * absolute_normal_x
+                    + from_cell_center * absolute_normal_y
+                )
+                normal_between_centers = (
+                    normal_x * between_centers_x + normal_y * between_centers_y
+                )
+                from_line = abs(normal_between_centers * normal_x) + abs(
+                    normal_between_centers * normal_y
+                )
                 if (
-                    next_cell_pos.x == curr_cell_pos.x
-                    and next_cell_pos.y == curr_cell_pos.y
+                    halfway_x + remainder_x >= abs(between_centers_x)
+                    and halfway_y + remainder_y >= abs(between_centers_y)
+                    and overlap_into_hitbox >= from_line
                 ):
-                    break
-
-                curr_cell_pos = next_cell_pos
+                    cells.append((next_cell_x, next_cell_y, center_x, center_y))
 
         return cells
 
-    def get_lines_near_position(self, position: Vector):
-        interacting_lines: list[Union[NormalLine, AccelerationLine]] = []
-        # Get cells in a 3 x 3
-        # May need update if line hitbox size is modified
-        for x_offset in (-1, 0, 1):
-            for y_offset in (-1, 0, 1):
-                cell = self.get_cell(
-                    position + self.cell_size * Vector(x_offset, y_offset),
-                )
+    def get_cell_positions_between(
+        self, point1: Vector, point2: Vector
+    ) -> list[CellPosition]:
+        return [
+            self.get_cell_position(Vector(world_x, world_y))
+            for _, _, world_x, world_y in self.get_cells_between(point1, point2)
+        ]
 
-                if cell is None:
-                    continue
+    # Returns the lines of the 3 x 3 cells around the position, which stays the same
+    # list until lines in those cells change, so it must not be modified
+    def get_lines_near_position(self, position: Vector):
+        return self.query_neighborhood(position.x, position.y)[1]
 
-                for line in cell.lines:
-                    # Intentionally contains duplicates, ordered by id
-                    interacting_lines.append(line)
+    # Same as get_lines_near_position, returning the records of the lines
+    def get_records_near(self, x: float, y: float) -> list[LineRecord]:
+        return self.query_neighborhood(x, y)[2]
 
-        return interacting_lines
+    def query_neighborhood(self, x: float, y: float) -> Neighborhood:
+        # Same as the cells of the position offset by -1, 0 and 1 cells on each axis
+        # (these are not always consecutive, due to rounding of the offset positions)
+        # May need update if line hitbox size is modified
+        cell_size = self.cell_size
+        neighborhood_key = (
+            math.floor((x - cell_size) / cell_size),
+            math.floor(x / cell_size),
+            math.floor((x + cell_size) / cell_size),
+            math.floor((y - cell_size) / cell_size),
+            math.floor(y / cell_size),
+            math.floor((y + cell_size) / cell_size),
+        )
+        neighborhood = self.neighborhoods.get(neighborhood_key)
+        if neighborhood is None:
+            neighborhood = self.get_neighborhood(neighborhood_key)
+        # Empty cells are also tracked, since lines can be added to them later
+        self.queried_cells.update(neighborhood[0])
+        return neighborhood
+
+    def get_neighborhood(self, neighborhood_key: tuple[int, ...]) -> Neighborhood:
+        self.load_cells(
+            neighborhood_key[0],
+            neighborhood_key[2],
+            neighborhood_key[3],
+            neighborhood_key[5],
+        )
+        cell_keys = tuple(
+            get_cell_key(x, y)
+            for x in neighborhood_key[:3]
+            for y in neighborhood_key[3:]
+        )
+        lines: list[Union[NormalLine, AccelerationLine]] = []
+        for cell_key in cell_keys:
+            cell = self.cells.get(cell_key)
+            if cell is not None:
+                # Intentionally contains duplicates, ordered by id
+                lines.extend(self.get_cell_lines(cell))
+
+        neighborhood = (cell_keys, lines, [line.base.record for line in lines])
+        # Dicts keep insertion order, so the first neighborhood is the oldest
+        if len(self.neighborhoods) >= self.max_neighborhoods:
+            self.drop_neighborhood(next(iter(self.neighborhoods)))
+        self.neighborhoods[neighborhood_key] = neighborhood
+        for cell_key in cell_keys:
+            if cell_key not in self.cell_neighborhoods:
+                self.cell_neighborhoods[cell_key] = set()
+            self.cell_neighborhoods[cell_key].add(neighborhood_key)
+        return neighborhood
+
+    # Whether get_lines_near_position would return no lines for every position in the
+    # box, so that collisions of points within it can be skipped
+    # The blocks of the cells around the box get marked as queried, which covers
+    # every cell querying each position would mark (and more, which only means more
+    # frames get invalidated when lines get added there)
+    def is_area_empty(
+        self, min_x: float, min_y: float, max_x: float, max_y: float
+    ) -> bool:
+        cell_size = self.cell_size
+        first_x = math.floor((min_x - cell_size) / cell_size)
+        first_y = math.floor((min_y - cell_size) / cell_size)
+        last_x = math.floor((max_x + cell_size) / cell_size)
+        last_y = math.floor((max_y + cell_size) / cell_size)
+        # The cells around the box are all closer to its center cell than the
+        # nearest cell with lines
+        center_x = (first_x + last_x) // 2
+        center_y = (first_y + last_y) // 2
+        distance = self.cell_distances.get((center_x, center_y))
+        if distance is None:
+            distance = self.get_cell_distance(center_x, center_y)
+        if distance <= max(last_x - center_x, last_y - center_y):
+            return False
+
+        block_range = (
+            first_x // BLOCK_CELLS,
+            last_x // BLOCK_CELLS,
+            first_y // BLOCK_CELLS,
+            last_y // BLOCK_CELLS,
+        )
+        blocks = self.range_blocks.get(block_range)
+        if blocks is None:
+            first_block_x, last_block_x, first_block_y, last_block_y = block_range
+            if len(self.range_blocks) >= self.max_range_blocks:
+                del self.range_blocks[next(iter(self.range_blocks))]
+            blocks = self.range_blocks[block_range] = tuple(
+                (x, y)
+                for x in range(first_block_x, last_block_x + 1)
+                for y in range(first_block_y, last_block_y + 1)
+            )
+        self.queried_blocks.update(blocks)
+        return True
 
+    # Lines in the order they were added (pending lines get added first, in the order
+    # they were given)
     def get_all_lines(self):
-        seen = set()
-        lines = []
-        for cell in self.cells.values():
-            for line in cell.lines:
-                if line.base.id not in seen:
-                    lines.append(line)
-                    seen.add(line.base.id)
-        return lines
+        if self.line_tiles is not None:
+            self.load_lines(self.line_tiles.take_all())
+        return [line for line in self.lines if line is not None]
@@ -1,4 +1,5 @@
 from engine.bone import BaseBone
+from engine.point import BasePoint
 from enum import Enum
 
 
@@ -9,6 +10,8 @@ class JointType(Enum):
 
 # Joint between two bones that can break
 class Joint:
+    __slots__ = ("bone1", "bone2")
+
     def __init__(
         self,
         bone1: BaseBone,
@@ -17,7 +20,7 @@ class Joint:
         self.bone1 = bone1
         self.bone2 = bone2
 
-    def should_break(self):
-        delta1 = self.bone1.get_vector()
-        delta2 = self.bone2.get_vector()
+    def should_break(self, points: list[BasePoint]):
+        delta1 = self.bone1.get_vector(points)
+        delta2 = self.bone2.get_vector(points)
         return delta1.cross(delta2) < 0
@@ -1,8 +1,36 @@
 from engine.vector import Vector
-from engine.point import ContactPoint
+from engine.point import BasePoint
+from typing import Optional
+
+# Values of a line used by the collision loop of the scalar backend, in one flat list:
+# bounds (min x, min y, max x, max y), start x and y, vector x and y, normal x and y,
+# inverse length squared, left and right limits, and acceleration x and y
+# Each line keeps one list and updates it in place, so records the grid has handed
+# out stay current when the line gets edited
+LineRecord = list[float]
 
 
 class BaseLine:
+    __slots__ = (
+        "id",
+        "endpoints",
+        "flipped",
+        "left_ext",
+        "right_ext",
+        "vector",
+        "length",
+        "inv_length_squared",
+        "unit",
+        "normal_unit",
+        "ext_ratio",
+        "limit_left",
+        "limit_right",
+        "bounds",
+        "acceleration",
+        "acceleration_vector",
+        "record",
+    )
+
     HITBOX_HEIGHT = 10
 
     def __init__(
@@ -19,6 +47,9 @@ class BaseLine:
         self.flipped = flipped
         self.left_ext = left_ext
         self.right_ext = right_ext
+        # Acceleration multiplier of acceleration lines, None for normal lines
+        self.acceleration: Optional[float] = None
+        self.record: LineRecord = []
 
         # init computed fields
         self.update_computed()
@@ -50,6 +81,53 @@ class BaseLine:
         if self.right_ext:
             self.limit_right += self.ext_ratio
 
+        # Box around every position that can interact with the line (the hitbox
+        # between the extended ends), as (min x, min y, max x, max y)
+        # The margin keeps rounding in the interaction test from reaching outside it
+        BOUNDS_MARGIN = 1
+        start = self.endpoints[0] + self.vector * self.limit_left
+        end = self.endpoints[0] + self.vector * self.limit_right
+        hitbox = self.normal_unit * self.HITBOX_HEIGHT
+        corners = (start, end, start + hitbox, end + hitbox)
+        self.bounds = (
+            min(corner.x for corner in corners) - BOUNDS_MARGIN,
+            min(corner.y for corner in corners) - BOUNDS_MARGIN,
+            max(corner.x for corner in corners) + BOUNDS_MARGIN,
+            max(corner.y for corner in corners) + BOUNDS_MARGIN,
+        )
+
+        # Subtracting no acceleration leaves positions unchanged
+        if self.acceleration is None:
+            self.acceleration_vector = Vector(0.0, 0.0)
+        else:
+            ACCELERATION_SCALAR = 0.1
+            self.acceleration_vector = self.unit * (
+                self.acceleration * ACCELERATION_SCALAR
+            )
+        # Updated with the other computed fields, so the setters keep it current
+        self.record[:] = self.get_record()
+
+    def get_record(self) -> LineRecord:
+        min_x, min_y, max_x, max_y = self.bounds
+        acceleration = self.acceleration_vector
+        return [
+            min_x,
+            min_y,
+            max_x,
+            max_y,
+            self.endpoints[0].x,
+            self.endpoints[0].y,
+            self.vector.x,
+            self.vector.y,
+            self.normal_unit.x,
+            self.normal_unit.y,
+            self.inv_length_squared,
+            self.limit_left,
+            self.limit_right,
+            acceleration.x,
+            acceleration.y,
+        ]
+
     def set_endpoints(self, p1: Vector, p2: Vector):
         self.endpoints: tuple[Vector, Vector] = (p1.copy(), p2.copy())
         self.update_computed()
@@ -65,9 +143,19 @@ class BaseLine:
 
     # Returns whether a point should interact with this line and the distance
     # from the top of the line to the point
-    def should_interact(self, point: ContactPoint) -> tuple[bool, float]:
-        offset_from_point = point.base.position - self.endpoints[0]
-        moving_into_line = (self.normal_unit @ point.base.velocity) > 0
+    def should_interact(self, point: BasePoint) -> tuple[bool, float]:
+        min_x, min_y, max_x, max_y = self.bounds
+        position = point.position
+        if (
+            position.x < min_x
+            or position.y < min_y
+            or position.x > max_x
+            or position.y > max_y
+        ):
+            return (False, 0.0)
+
+        offset_from_point = point.position - self.endpoints[0]
+        moving_into_line = (self.normal_unit @ point.velocity) > 0
         dist_from_line_top = self.normal_unit @ offset_from_point
         pos_between_ends = (self.vector @ offset_from_point) * self.inv_length_squared
 
@@ -86,6 +174,8 @@ class BaseLine:
 
 
 class NormalLine:
+    __slots__ = ("base",)
+
     def __init__(self, base: BaseLine):
         self.base = base
         self.update_computed()
@@ -93,66 +183,62 @@ class NormalLine:
     def update_computed(self):
         self.base.update_computed()
 
-    def interact(self, point: ContactPoint) -> tuple[Vector, Vector]:
+    def interact(self, point: BasePoint, friction: float) -> tuple[Vector, Vector]:
         interaction, dist_from_line_top = self.base.should_interact(point)
 
         if interaction:
-            new_position = point.base.position - (
-                self.base.normal_unit * dist_from_line_top
-            )
+            new_position = point.position - (self.base.normal_unit * dist_from_line_top)
 
             friction_vector = (
-                self.base.normal_unit.rot_cw() * point.friction
+                self.base.normal_unit.rot_cw() * friction
             ) * dist_from_line_top
 
-            if point.base.previous_position.x >= new_position.x:
+            if point.previous_position.x >= new_position.x:
                 friction_vector.x *= -1
-            if point.base.previous_position.y < new_position.y:
+            if point.previous_position.y < new_position.y:
                 friction_vector.y *= -1
 
-            new_previous_position = point.base.previous_position + friction_vector
+            new_previous_position = point.previous_position + friction_vector
 
             return (new_position, new_previous_position)
         else:
-            return (point.base.position, point.base.previous_position)
+            return (point.position, point.previous_position)
 
 
 class AccelerationLine:
+    __slots__ = ("base", "acceleration")
+
     def __init__(self, base: BaseLine, acceleration: float):
         self.base = base
         self.acceleration = acceleration
         self.update_computed()
 
+    # The base line computes the acceleration vector along with its other fields
     def update_computed(self):
+        self.base.acceleration = self.acceleration
         self.base.update_computed()
-        ACCELERATION_SCALAR = 0.1
-        self.acceleration_vector = self.base.unit * (
-            self.acceleration * ACCELERATION_SCALAR
-        )
 
-    def interact(self, point: ContactPoint) -> tuple[Vector, Vector]:
+    def interact(self, point: BasePoint, friction: float) -> tuple[Vector, Vector]:
         interaction, dist_from_line_top = self.base.should_interact(point)
 
         if interaction:
-            new_position = point.base.position - (
-                self.base.normal_unit * dist_from_line_top
-            )
+            new_position = point.position - (self.base.normal_unit * dist_from_line_top)
 
             friction_vector = (
-                self.base.normal_unit.rot_cw() * point.friction
+                self.base.normal_unit.rot_cw() * friction
             ) * dist_from_line_top
 
-            if point.base.previous_position.x >= new_position.x:
+            if point.previous_position.x >= new_position.x:
                 friction_vector.x *= -1
-            if point.base.previous_position.y < new_position.y:
+            if point.previous_position.y < new_position.y:
                 friction_vector.y *= -1
 
             new_previous_position = (
-                point.base.previous_position
+                point.previous_position
                 + friction_vector
-                - self.acceleration_vector
+                - self.base.acceleration_vector
             )
 
             return (new_position, new_previous_position)
         else:
-            return (point.base.position, point.base.previous_position)
+            return (point.position, point.previous_position)
@@ -0,0 +1,116 @@
+# Lines of a track that only get built once a part of the track near them gets used,
+# so that loading a huge track does not build and rasterize every line up front
+# Lines are indexed by the tiles (squares of TILE_CELLS x TILE_CELLS grid cells) that
+# the box between their endpoints spans, since the grid only registers a line in
+# cells between its endpoints (in every grid version)
+
+from engine.line import NormalLine, AccelerationLine
+from typing import Any, Callable, Union
+import math
+
+TILE_CELLS = 16
+
+
+class LineTiles:
+    def __init__(
+        self,
+        cell_size: int,
+        build_lines: Callable[[list[Any]], list[Union[NormalLine, AccelerationLine]]],
+    ):
+        self.cell_size = cell_size
+        # Builds lines from their sources (the data they were added with)
+        self.build_lines = build_lines
+        # Source and id of each line added, the source is None once it has been taken
+        self.sources: list[Any] = []
+        self.ids: list[int] = []
+        # Index of the first line not taken yet with each id
+        self.pending_ids: dict[int, int] = {}
+        # Indices of all the lines not taken yet with ids more than one line has
+        self.duplicate_indices: dict[int, list[int]] = {}
+        # Indices of the lines in each tile not taken yet, by tile column and row
+        self.tiles: dict[tuple[int, int], list[int]] = {}
+        # Line ids in descending order, for finding the largest pending id, built the
+        # first time it is needed (ids of taken lines get skipped)
+        self.sorted_ids: list[int] = []
+        self.sorted_index = 0
+
+    def __len__(self):
+        return len(self.pending_ids) + sum(
+            len(indices) - 1 for indices in self.duplicate_indices.values()
+        )
+
+    def add(
+        self, source: Any, line_id: int, x1: float, y1: float, x2: float, y2: float
+    ):
+        cell_size = self.cell_size
+        first_x = math.floor(min(x1, x2) / cell_size) // TILE_CELLS
+        first_y = math.floor(min(y1, y2) / cell_size) // TILE_CELLS
+        last_x = math.floor(max(x1, x2) / cell_size) // TILE_CELLS
+        last_y = math.floor(max(y1, y2) / cell_size) // TILE_CELLS
+
+        index = len(self.sources)
+        self.sources.append(source)
+        self.ids.append(line_id)
+        first_index = self.pending_ids.get(line_id)
+        if first_index is None:
+            self.pending_ids[line_id] = index
+        else:
+            duplicate_indices = self.duplicate_indices.get(line_id)
+            if duplicate_indices is None:
+                duplicate_indices = self.duplicate_indices[line_id] = [first_index]
+            duplicate_indices.append(index)
+        for tile_x in range(first_x, last_x + 1):
+            for tile_y in range(first_y, last_y + 1):
+                tile = self.tiles.get((tile_x, tile_y))
+                if tile is None:
+                    tile = self.tiles[(tile_x, tile_y)] = []
+                tile.append(index)
+        self.sorted_ids = []
+
+    # Sources of the lines not taken yet, in the order they were added
+    # Lines sharing an id get taken together, so that the grid orders them in cells
+    # the same as when every line gets added up front
+    def take(self, indices: list[int]) -> list[Any]:
+        if self.duplicate_indices:
+            indices = list(indices)
+            for line_id in {self.ids[index] for index in indices}:
+                indices.extend(self.duplicate_indices.pop(line_id, ()))
+        sources = []
+        for index in sorted(indices):
+            source = self.sources[index]
+            if source is None:
+                continue
+            sources.append(source)
+            self.sources[index] = None
+            self.pending_ids.pop(self.ids[index], None)
+        return sources
+
+    # Takes the lines in the tiles overlapping the range of cells
+    def take_cells(
+        self, first_x: int, last_x: int, first_y: int, last_y: int
+    ) -> list[Any]:
+        indices = []
+        for tile_x in range(first_x // TILE_CELLS, last_x // TILE_CELLS + 1):
+            for tile_y in range(first_y // TILE_CELLS, last_y // TILE_CELLS + 1):
+                indices.extend(self.tiles.pop((tile_x, tile_y), ()))
+        return self.take(indices)
+
+    def take_line(self, line_id: int) -> list[Any]:
+        index = self.pending_ids.get(line_id)
+        if index is None:
+            return []
+        return self.take([index])
+
+    def take_all(self) -> list[Any]:
+        self.tiles.clear()
+        return self.take(list(self.pending_ids.values()))
+
+    def get_max_line_id(self) -> int:
+        if not self.sorted_ids:
+            self.sorted_ids = sorted(self.pending_ids, reverse=True)
+            self.sorted_index = 0
+        while self.sorted_index < len(self.sorted_ids):
+            if self.sorted_ids[self.sorted_index] in self.pending_ids:
+                return self.sorted_ids[self.sorted_index]
+            self.sorted_index += 1
+        return -1
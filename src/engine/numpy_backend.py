@@ -0,0 +1,342 @@
+# Optional NumPy physics backend, which steps the skeletons of every entity at once
+# Point state is kept as structure-of-arrays (one row per entity, one column per point)
+# and every operation is done in the same order as the pure python path, so results
+# stay bit-identical
+# Bones are still processed one at a time (each bone depends on the previous one),
+# but each bone gets processed across all entities with array operations
+# Collisions run per point, since every point queries the grid separately
+# Arrays get built from the points of the entities every frame and written back at
+# the end of it, since the frame cache packs the entities (keeping them across frames
+# would only save the building), so per rider this costs a bit more than the scalar
+# backend, and array operations cost more than python objects below about 5 riders
+# (see benchmark_backends in src/benchmark.py)
+
+from engine.entity import Entity, MountPhase, RemountVersion
+from engine.bone import NormalBone, RepelBone, MountBone, BaseBone
+from engine.scalar_backend import interact_lines, EMPTY_CHECK_DISTANCE
+from engine.grid import Grid
+from engine.vector import Vector
+from engine.flags import LR_COM_SCARF
+import numpy as np
+
+
+class BoneArrays:
+    def __init__(self, bones: list[BaseBone]):
+        self.point1 = bones[0].point1
+        self.point2 = bones[0].point2
+        self.bias = bones[0].bias
+        self.length_factor = bones[0].length_factor
+        # Rest lengths can differ between entities (LRA applies rotation first)
+        self.rest_length = np.array([bone.rest_length for bone in bones])
+        self.target_length = self.rest_length * self.length_factor
+
+    def get_vector(self, x: np.ndarray, y: np.ndarray):
+        return (
+            x[:, self.point1] - x[:, self.point2],
+            y[:, self.point1] - y[:, self.point2],
+        )
+
+    def get_adjustment(self, dx: np.ndarray, dy: np.ndarray):
+        length = np.sqrt(dx * dx + dy * dy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            adjustment = np.where(
+                length == 0, 0.0, (length - self.target_length) / length
+            )
+        return (length, adjustment)
+
+    def update_points(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        dx: np.ndarray,
+        dy: np.ndarray,
+        adjustment: np.ndarray,
+        mask: np.ndarray,
+    ):
+        scaled_x = dx * adjustment
+        scaled_y = dy * adjustment
+        x[:, self.point1] = np.where(
+            mask, x[:, self.point1] - scaled_x * (1 - self.bias), x[:, self.point1]
+        )
+        y[:, self.point1] = np.where(
+            mask, y[:, self.point1] - scaled_y * (1 - self.bias), y[:, self.point1]
+        )
+        x[:, self.point2] = np.where(
+            mask, x[:, self.point2] + scaled_x * self.bias, x[:, self.point2]
+        )
+        y[:, self.point2] = np.where(
+            mask, y[:, self.point2] + scaled_y * self.bias, y[:, self.point2]
+        )
+
+
+# Skeleton topology shared by all entities, built once from the initial entities
+class NumpySkeletons:
+    REMOUNT_STRENGTH_FACTOR = 0.1
+    LRA_REMOUNT_STRENGTH_FACTOR = 0.5
+    REMOUNT_ENDURANCE_FACTOR = 2
+
+    def __init__(self, entities: list[Entity]):
+        template = entities[0].skeleton
+        skeletons = [entity.skeleton for entity in entities]
+
+        self.contact_indices = [point.index for point in template.contact_points]
+        self.flutter_indices = [point.index for point in template.flutter_points]
+        self.friction = [point.friction for point in template.contact_points]
+        # Positions in contact_indices of the points of each contact group
+        contact_positions = {
+            id(point): k for k, point in enumerate(template.contact_points)
+        }
+        self.contact_groups = [
+            [contact_positions[id(point)] for point in group]
+            for group in template.contact_groups
+        ]
+        self.air_friction_factor = np.array(
+            [1 - point.air_friction for point in template.flutter_points]
+        )
+
+        self.structural_bones: list[tuple[type, BoneArrays, float]] = []
+        for i, bone in enumerate(template.structural_bones):
+            bones = [skeleton.structural_bones[i].base for skeleton in skeletons]
+            endurance = bone.endurance if isinstance(bone, MountBone) else 0.0
+            self.structural_bones.append((type(bone), BoneArrays(bones), endurance))
+
+        self.flutter_bones = [
+            BoneArrays([skeleton.flutter_bones[i].base for skeleton in skeletons])
+            for i in range(len(template.flutter_bones))
+        ]
+
+        bone_indices = {id(bone): i for i, bone in enumerate(template.bones)}
+        self.mount_joints = [
+            (bone_indices[id(joint.bone1)], bone_indices[id(joint.bone2)])
+            for joint in template.mount_joints
+        ]
+        self.break_joints = [
+            (bone_indices[id(joint.bone1)], bone_indices[id(joint.bone2)])
+            for joint in template.break_joints
+        ]
+        self.all_bones = [
+            BoneArrays([skeleton.bones[i] for skeleton in skeletons])
+            for i in range(len(template.bones))
+        ]
+
+        self.lra = np.array(
+            [entity.state.remount_version == RemountVersion.LRA for entity in entities]
+        )
+
+    def joints_should_break(
+        self, joint: tuple[int, int], x: np.ndarray, y: np.ndarray
+    ) -> np.ndarray:
+        dx1, dy1 = self.all_bones[joint[0]].get_vector(x, y)
+        dx2, dy2 = self.all_bones[joint[1]].get_vector(x, y)
+        return dx1 * dy2 - dy1 * dx2 < 0
+
+    def process_skeletons(self, entities: list[Entity], gravity: Vector, grid: Grid):
+        x = np.array(
+            [[point.position.x for point in e.points] for e in entities], dtype=float
+        )
+        y = np.array(
+            [[point.position.y for point in e.points] for e in entities], dtype=float
+        )
+        vx = np.array(
+            [[point.velocity.x for point in e.points] for e in entities], dtype=float
+        )
+        vy = np.array(
+            [[point.velocity.y for point in e.points] for e in entities], dtype=float
+        )
+        px = np.array(
+            [[point.previous_position.x for point in e.points] for e in entities],
+            dtype=float,
+        )
+        py = np.array(
+            [[point.previous_position.y for point in e.points] for e in entities],
+            dtype=float,
+        )
+
+        # momentum
+        contact = self.contact_indices
+        new_vx = (x[:, contact] - px[:, contact]) + gravity.x
+        new_vy = (y[:, contact] - py[:, contact]) + gravity.y
+        px[:, contact] = x[:, contact]
+        py[:, contact] = y[:, contact]
+        x[:, contact] = x[:, contact] + new_vx
+        y[:, contact] = y[:, contact] + new_vy
+        vx[:, contact] = new_vx
+        vy[:, contact] = new_vy
+
+        flutter = self.flutter_indices
+        new_vx = (
+            (x[:, flutter] - px[:, flutter]) * self.air_friction_factor
+        ) + gravity.x
+        new_vy = (
+            (y[:, flutter] - py[:, flutter]) * self.air_friction_factor
+        ) + gravity.y
+        new_x = x[:, flutter] + new_vx
+        new_y = y[:, flutter] + new_vy
+        if LR_COM_SCARF:
+            for r, entity in enumerate(entities):
+                for k, point in enumerate(entity.skeleton.flutter_points):
+                    flutter_offset = point.get_flutter(
+                        Vector(new_vx[r, k], new_vy[r, k]),
+                        Vector(x[r, flutter[k]], y[r, flutter[k]]),
+                    )
+                    new_x[r, k] += flutter_offset.x
+                    new_y[r, k] += flutter_offset.y
+        px[:, flutter] = x[:, flutter]
+        py[:, flutter] = y[:, flutter]
+        x[:, flutter] = new_x
+        y[:, flutter] = new_y
+        vx[:, flutter] = new_vx
+        vy[:, flutter] = new_vy
+
+        initial_remounting = np.array(
+            [e.state.mount_phase == MountPhase.REMOUNTING for e in entities]
+        )
+        initial_mounted = np.array(
+            [e.state.mount_phase == MountPhase.MOUNTED for e in entities]
+        )
+        mounted = np.array([e.state.is_mounted() for e in entities])
+        remounting = initial_remounting.copy()
+        dismounted = np.array([e.dismounted_this_frame for e in entities])
+
+        lra = self.lra
+        lra_remounting = lra & initial_remounting
+        normal_strength = np.where(
+            lra_remounting, self.LRA_REMOUNT_STRENGTH_FACTOR, 1.0
+        )
+
+        for _ in range(6):
+            # bones
+            for bone_type, bone, endurance in self.structural_bones:
+                dx, dy = bone.get_vector(x, y)
+                length, adjustment = bone.get_adjustment(dx, dy)
+
+                if bone_type is NormalBone:
+                    mask = np.ones(len(entities), dtype=bool)
+                    bone.update_points(x, y, dx, dy, adjustment * normal_strength, mask)
+                elif bone_type is RepelBone:
+                    mask = length < bone.target_length
+                    bone.update_points(x, y, dx, dy, adjustment * normal_strength, mask)
+                else:
+                    applies = (lra & (initial_mounted | initial_remounting)) | (
+                        ~lra & mounted
+                    )
+                    com_remounting = ~lra & remounting
+                    remount_check = lra_remounting | com_remounting
+                    strength = np.where(
+                        lra_remounting,
+                        self.LRA_REMOUNT_STRENGTH_FACTOR,
+                        np.where(com_remounting, self.REMOUNT_STRENGTH_FACTOR, 1.0),
+                    )
+                    bone_endurance = np.where(
+                        remount_check,
+                        endurance * self.REMOUNT_ENDURANCE_FACTOR,
+                        endurance,
+                    )
+                    intact = (
+                        adjustment
+                        <= (bone_endurance * bone.rest_length) * bone.length_factor
+                    )
+
+                    active = applies & ~dismounted
+                    bone.update_points(
+                        x, y, dx, dy, adjustment * strength, active & intact
+                    )
+
+                    for r in np.flatnonzero(active & ~intact):
+                        dismounted[r] = True
+                        entities[r].dismounted_this_frame = True
+                        entities[r].state.dismount()
+                        mounted[r] = entities[r].state.is_mounted()
+                        remounting[r] = (
+                            entities[r].state.mount_phase == MountPhase.REMOUNTING
+                        )
+
+            # line collisions
+            x, y, px, py = self.process_collisions(entities, grid, x, y, vx, vy, px, py)
+
+        # flutter bones (like scarf)
+        for bone in self.flutter_bones:
+            dx, dy = bone.get_vector(x, y)
+            _, adjustment = bone.get_adjustment(dx, dy)
+            bone.update_points(
+                x, y, dx, dy, adjustment, np.ones(len(entities), dtype=bool)
+            )
+
+        # check dismount
+        should_break = np.zeros(len(entities), dtype=bool)
+        for joint in self.mount_joints:
+            should_break |= self.joints_should_break(joint, x, y)
+        for r in np.flatnonzero(mounted & ~dismounted & should_break):
+            entities[r].dismounted_this_frame = True
+            entities[r].state.dismount()
+            if entities[r].state.remount_version == RemountVersion.LRA:
+                entities[r].state.break_sled()
+
+        # check skeleton break (like sled break)
+        should_break = np.zeros(len(entities), dtype=bool)
+        for joint in self.break_joints:
+            should_break |= self.joints_should_break(joint, x, y)
+        for r in np.flatnonzero(should_break):
+            state = entities[r].state
+            if (
+                state.remount_version != RemountVersion.LRA
+                and state.remount_version != RemountVersion.COM_V1
+            ) or state.is_mounted():
+                state.break_sled()
+
+        for r, entity in enumerate(entities):
+            for i, point in enumerate(entity.points):
+                point.update_state(
+                    Vector(float(x[r, i]), float(y[r, i])),
+                    Vector(float(vx[r, i]), float(vy[r, i])),
+                    Vector(float(px[r, i]), float(py[r, i])),
+                )
+
+    def process_collisions(
+        self,
+        entities: list[Entity],
+        grid: Grid,
+        x: np.ndarray,
+        y: np.ndarray,
+        vx: np.ndarray,
+        vy: np.ndarray,
+        px: np.ndarray,
+        py: np.ndarray,
+    ):
+        xs = x.tolist()
+        ys = y.tolist()
+        pxs = px.tolist()
+        pys = py.tolist()
+        vxs = vx.tolist()
+        vys = vy.tolist()
+
+        for r in range(len(entities)):
+            for group in self.contact_groups:
+                # Points only move when they hit a line, so in empty space none of
+                # them move
+                i = self.contact_indices[group[0]]
+                if (
+                    grid.get_position_distance(xs[r][i], ys[r][i])
+                    > EMPTY_CHECK_DISTANCE
+                ):
+                    group_xs = [xs[r][self.contact_indices[k]] for k in group]
+                    group_ys = [ys[r][self.contact_indices[k]] for k in group]
+                    if grid.is_area_empty(
+                        min(group_xs), min(group_ys), max(group_xs), max(group_ys)
+                    ):
+                        continue
+
+                for k in group:
+                    i = self.contact_indices[k]
+                    xs[r][i], ys[r][i], pxs[r][i], pys[r][i] = interact_lines(
+                        grid.get_records_near(xs[r][i], ys[r][i]),
+                        self.friction[k],
+                        xs[r][i],
+                        ys[r][i],
+                        vxs[r][i],
+                        vys[r][i],
+                        pxs[r][i],
+                        pys[r][i],
+                    )
+
+        return (np.array(xs), np.array(ys), np.array(pxs), np.array(pys))
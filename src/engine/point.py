@@ -10,6 +10,8 @@ class PointType(Enum):
 
 
 class BasePoint:
+    __slots__ = ("position", "velocity", "previous_position")
+
     def __init__(
         self,
         position: Vector,
@@ -32,33 +34,39 @@ class BasePoint:
         self.previous_position = new_prev_pos.copy()
 
 
-# Colliding point of an entity
+# Colliding point of an entity, referring to its state by index into the
+# entity's points
 class ContactPoint:
+    __slots__ = ("index", "friction")
+
     def __init__(
         self,
-        initial_position: Vector,
+        index: int,
         friction: float,
     ):
-        self.base = BasePoint(initial_position, Vector(0, 0), initial_position)
+        self.index = index
         self.friction = friction
 
-    def initial_step(self, gravity: Vector):
-        computed_velocity = self.base.position - self.base.previous_position
+    def initial_step(self, points: list[BasePoint], gravity: Vector):
+        base = points[self.index]
+        computed_velocity = base.position - base.previous_position
         new_velocity = computed_velocity + gravity
-        current_position = self.base.position
+        current_position = base.position
         new_position = current_position + new_velocity
 
-        self.base.update_state(new_position, new_velocity, current_position)
+        base.update_state(new_position, new_velocity, current_position)
 
 
 # Non-colliding point of an entity
 class FlutterPoint:
+    __slots__ = ("index", "air_friction")
+
     def __init__(
         self,
-        initial_position: Vector,
+        index: int,
         air_friction: float,
     ):
-        self.base = BasePoint(initial_position, Vector(0, 0), initial_position)
+        self.index = index
         self.air_friction = air_friction
 
     # glsl pseudo-randomness
@@ -79,13 +87,14 @@ class FlutterPoint:
         random_angle *= 2 * math.pi
         return random_length * Vector(math.cos(random_angle), math.sin(random_angle))
 
-    def initial_step(self, gravity: Vector):
-        computed_velocity = self.base.position - self.base.previous_position
+    def initial_step(self, points: list[BasePoint], gravity: Vector):
+        base = points[self.index]
+        computed_velocity = base.position - base.previous_position
         new_velocity = (computed_velocity * (1 - self.air_friction)) + gravity
-        current_position = self.base.position
+        current_position = base.position
         new_position = current_position + new_velocity
 
         if LR_COM_SCARF:
             new_position += self.get_flutter(new_velocity, current_position)
 
-        self.base.update_state(new_position, new_velocity, current_position)
+        base.update_state(new_position, new_velocity, current_position)
@@ -0,0 +1,295 @@
+# Allocation-free physics backend, which steps an entity by updating its point
+# coordinates in place as plain floats instead of creating Vector temporaries
+# Every operation is done in the same order as the object-based path, so results
+# stay bit-identical (debug breakpoints are not supported)
+
+from engine.entity import Entity, MountPhase, RemountVersion
+from engine.bone import NormalBone, RepelBone, BaseBone
+from engine.joint import Joint
+from engine.point import BasePoint, ContactPoint
+from engine.line import BaseLine, LineRecord
+from engine.grid import Grid
+from engine.vector import Vector
+from engine.flags import LR_COM_SCARF
+from math import sqrt
+
+REMOUNT_STRENGTH_FACTOR = 0.1
+LRA_REMOUNT_STRENGTH_FACTOR = 0.5
+REMOUNT_ENDURANCE_FACTOR = 2
+# Contact groups further than this many cells from lines get checked for being in
+# empty space, closer groups are most likely touching lines
+EMPTY_CHECK_DISTANCE = 2
+HITBOX_HEIGHT = BaseLine.HITBOX_HEIGHT
+
+
+# Moves the bone's points towards its rest length (repel bones only push apart)
+def process_bone(
+    points: list[BasePoint], bone: BaseBone, strength: float, repel: bool = False
+):
+    position1 = points[bone.point1].position
+    position2 = points[bone.point2].position
+    dx = position1.x - position2.x
+    dy = position1.y - position2.y
+    length = sqrt(dx * dx + dy * dy)
+    target_length = bone.rest_length * bone.length_factor
+
+    if repel and not length < target_length:
+        return
+
+    if length == 0:
+        adjustment = 0
+    else:
+        adjustment = (length - target_length) / length
+    adjustment = adjustment * strength
+
+    scaled_x = dx * adjustment
+    scaled_y = dy * adjustment
+    position1.x = position1.x - scaled_x * (1 - bone.bias)
+    position1.y = position1.y - scaled_y * (1 - bone.bias)
+    position2.x = position2.x + scaled_x * bone.bias
+    position2.y = position2.y + scaled_y * bone.bias
+
+
+def get_adjustment(points: list[BasePoint], bone: BaseBone) -> float:
+    position1 = points[bone.point1].position
+    position2 = points[bone.point2].position
+    dx = position1.x - position2.x
+    dy = position1.y - position2.y
+    length = sqrt(dx * dx + dy * dy)
+
+    if length == 0:
+        return 0
+
+    return (length - bone.rest_length * bone.length_factor) / length
+
+
+def joint_should_break(points: list[BasePoint], joint: Joint) -> bool:
+    bone1 = joint.bone1
+    bone2 = joint.bone2
+    dx1 = points[bone1.point1].position.x - points[bone1.point2].position.x
+    dy1 = points[bone1.point1].position.y - points[bone1.point2].position.y
+    dx2 = points[bone2.point1].position.x - points[bone2.point2].position.x
+    dy2 = points[bone2.point1].position.y - points[bone2.point2].position.y
+    return dx1 * dy2 - dy1 * dx2 < 0
+
+
+# Applies every line interaction to a contact point, returning its new position and
+# previous position
+def interact_lines(
+    records: list[LineRecord],
+    friction: float,
+    x: float,
+    y: float,
+    velocity_x: float,
+    velocity_y: float,
+    previous_x: float,
+    previous_y: float,
+) -> tuple[float, float, float, float]:
+    for record in records:
+        # Cheap rejection of lines the point is nowhere near
+        if x < record[0] or y < record[1] or x > record[2] or y > record[3]:
+            continue
+
+        (
+            _,
+            _,
+            _,
+            _,
+            start_x,
+            start_y,
+            vector_x,
+            vector_y,
+            normal_x,
+            normal_y,
+            inv_length_squared,
+            limit_left,
+            limit_right,
+            acceleration_x,
+            acceleration_y,
+        ) = record
+        offset_x = x - start_x
+        offset_y = y - start_y
+        dist_from_line_top = normal_x * offset_x + normal_y * offset_y
+        pos_between_ends = (
+            vector_x * offset_x + vector_y * offset_y
+        ) * inv_length_squared
+
+        if not (
+            normal_x * velocity_x + normal_y * velocity_y > 0
+            and 0 < dist_from_line_top
+            and dist_from_line_top < HITBOX_HEIGHT
+            and limit_left <= pos_between_ends
+            and pos_between_ends <= limit_right
+        ):
+            continue
+
+        x = x - normal_x * dist_from_line_top
+        y = y - normal_y * dist_from_line_top
+        friction_x = (normal_y * friction) * dist_from_line_top
+        friction_y = (-normal_x * friction) * dist_from_line_top
+        if previous_x >= x:
+            friction_x *= -1
+        if previous_y < y:
+            friction_y *= -1
+        previous_x = previous_x + friction_x - acceleration_x
+        previous_y = previous_y + friction_y - acceleration_y
+
+    return (x, y, previous_x, previous_y)
+
+
+def process_initial_points(entity: Entity, gravity: Vector):
+    points = entity.points
+    for point in entity.skeleton.contact_points:
+        base = points[point.index]
+        position = base.position
+        velocity = base.velocity
+        previous_position = base.previous_position
+        velocity.x = (position.x - previous_position.x) + gravity.x
+        velocity.y = (position.y - previous_position.y) + gravity.y
+        previous_position.x = position.x
+        previous_position.y = position.y
+        position.x = position.x + velocity.x
+        position.y = position.y + velocity.y
+
+    for point in entity.skeleton.flutter_points:
+        base = points[point.index]
+        position = base.position
+        velocity = base.velocity
+        previous_position = base.previous_position
+        air_friction_factor = 1 - point.air_friction
+        velocity.x = (
+            (position.x - previous_position.x) * air_friction_factor
+        ) + gravity.x
+        velocity.y = (
+            (position.y - previous_position.y) * air_friction_factor
+        ) + gravity.y
+        if LR_COM_SCARF:
+            flutter = point.get_flutter(velocity, position)
+        previous_position.x = position.x
+        previous_position.y = position.y
+        position.x = position.x + velocity.x
+        position.y = position.y + velocity.y
+        if LR_COM_SCARF:
+            position.x = position.x + flutter.x
+            position.y = position.y + flutter.y
+
+
+def process_bones(entity: Entity, initial_phase: MountPhase):
+    points = entity.points
+    state = entity.state
+    lra = state.remount_version == RemountVersion.LRA
+    lra_remounting = lra and initial_phase == MountPhase.REMOUNTING
+    lra_mounted = lra and (
+        initial_phase == MountPhase.MOUNTED or initial_phase == MountPhase.REMOUNTING
+    )
+
+    for bone in entity.skeleton.structural_bones:
+        if isinstance(bone, NormalBone):
+            process_bone(
+                points, bone.base, LRA_REMOUNT_STRENGTH_FACTOR if lra_remounting else 1
+            )
+        elif isinstance(bone, RepelBone):
+            process_bone(
+                points,
+                bone.base,
+                LRA_REMOUNT_STRENGTH_FACTOR if lra_remounting else 1,
+                True,
+            )
+        elif lra_mounted or (not lra and state.is_mounted()):
+            # LRA uses the mount phase known at the start of this frame,
+            # while .com uses the current mount phase (which can change)
+            endurance = bone.endurance
+            if lra_remounting:
+                endurance *= REMOUNT_ENDURANCE_FACTOR
+                strength = LRA_REMOUNT_STRENGTH_FACTOR
+            elif not lra and state.mount_phase == MountPhase.REMOUNTING:
+                endurance *= REMOUNT_ENDURANCE_FACTOR
+                strength = REMOUNT_STRENGTH_FACTOR
+            else:
+                strength = 1
+
+            if not entity.dismounted_this_frame:
+                base = bone.base
+                if get_adjustment(points, base) <= (
+                    endurance * base.rest_length * base.length_factor
+                ):
+                    process_bone(points, base, strength)
+                else:
+                    entity.dismounted_this_frame = True
+                    state.dismount()
+
+
+def process_collisions(entity: Entity, grid: Grid):
+    points = entity.points
+    for contact_points in entity.skeleton.contact_groups:
+        # Points only move when they hit a line, so in empty space none of them move
+        position = points[contact_points[0].index].position
+        if grid.get_position_distance(position.x, position.y) > EMPTY_CHECK_DISTANCE:
+            xs = [points[point.index].position.x for point in contact_points]
+            ys = [points[point.index].position.y for point in contact_points]
+            if grid.is_area_empty(min(xs), min(ys), max(xs), max(ys)):
+                continue
+        process_point_collisions(points, contact_points, grid)
+
+
+def process_point_collisions(
+    points: list[BasePoint], contact_points: list[ContactPoint], grid: Grid
+):
+    for point in contact_points:
+        base = points[point.index]
+        position = base.position
+        previous_position = base.previous_position
+        (
+            position.x,
+            position.y,
+            previous_position.x,
+            previous_position.y,
+        ) = interact_lines(
+            grid.get_records_near(position.x, position.y),
+            point.friction,
+            position.x,
+            position.y,
+            base.velocity.x,
+            base.velocity.y,
+            previous_position.x,
+            previous_position.y,
+        )
+
+
+def process_skeleton(entity: Entity, gravity: Vector, grid: Grid):
+    # momentum
+    process_initial_points(entity, gravity)
+
+    initial_phase = entity.state.mount_phase
+    for _ in range(6):
+        # bones
+        process_bones(entity, initial_phase)
+        # line collisions
+        process_collisions(entity, grid)
+
+    # flutter bones (like scarf)
+    for bone in entity.skeleton.flutter_bones:
+        process_bone(entity.points, bone.base, 1)
+
+    # check dismount
+    state = entity.state
+    if state.is_mounted():
+        for joint in entity.skeleton.mount_joints:
+            if (
+                joint_should_break(entity.points, joint)
+                and not entity.dismounted_this_frame
+            ):
+                entity.dismounted_this_frame = True
+                state.dismount()
+                if state.remount_version == RemountVersion.LRA:
+                    # LRA also breaks sled on mount joint break
+                    state.break_sled()
+
+    # check skeleton break (like sled break)
+    if (
+        state.remount_version != RemountVersion.LRA
+        and state.remount_version != RemountVersion.COM_V1
+    ) or state.is_mounted():
+        for joint in entity.skeleton.break_joints:
+            if state.sled_is_intact() and joint_should_break(entity.points, joint):
+                state.break_sled()
@@ -6,6 +6,8 @@ import math
 
 
 class Vector:
+    __slots__ = ("x", "y")
+
     def __init__(self, x: float, y: float):
         self.x = x
         self.y = y
@@ -0,0 +1,272 @@
+# Exports simulated rider state to files for offline analysis, without a display
+# Frames are simulated in order with Engine.iter_frames and written out as they
+# are simulated, so memory use does not grow with the length of the frame range
+
+import argparse
+import csv
+import json
+import mmap
+import sys
+import time
+from array import array
+from enum import Enum
+from typing import Optional, TextIO
+from engine.engine import Engine, PhysicsBackend
+from engine.entity import Entity
+from utils.convert import load_track
+
+
+class ExportFormat(Enum):
+    # One row per point per frame
+    CSV = 0
+    # One json object per frame
+    JSONL = 1
+    # float64 array of shape (frames, entities, values), see NpyExporter
+    NPY = 2
+
+
+class CsvExporter:
+    HEADER = [
+        "frame",
+        "entity",
+        "point",
+        "x",
+        "y",
+        "vx",
+        "vy",
+        "mount_phase",
+        "sled_intact",
+    ]
+
+    def __init__(self, output: TextIO):
+        self.output = output
+        self.writer = csv.writer(output)
+        self.writer.writerow(self.HEADER)
+
+    def write_frame(self, frame: int, entities: list[Entity]):
+        for entity_index, entity in enumerate(entities):
+            mount_phase = entity.state.mount_phase.name
+            sled_intact = int(entity.state.sled_intact)
+            self.writer.writerows(
+                (
+                    frame,
+                    entity_index,
+                    point_index,
+                    repr(point.position.x),
+                    repr(point.position.y),
+                    repr(point.velocity.x),
+                    repr(point.velocity.y),
+                    mount_phase,
+                    sled_intact,
+                )
+                for point_index, point in enumerate(entity.points)
+            )
+
+    def close(self):
+        if self.output is not sys.stdout:
+            self.output.close()
+
+
+class JsonlExporter:
+    def __init__(self, output: TextIO):
+        self.output = output
+
+    def write_frame(self, frame: int, entities: list[Entity]):
+        self.output.write(
+            json.dumps(
+                {
+                    "frame": frame,
+                    "entities": [
+                        {
+                            "mount_phase": entity.state.mount_phase.name,
+                            "sled_intact": entity.state.sled_intact,
+                            "points": [
+                                [
+                                    point.position.x,
+                                    point.position.y,
+                                    point.velocity.x,
+                                    point.velocity.y,
+                                ]
+                                for point in entity.points
+                            ],
+                        }
+                        for entity in entities
+                    ],
+                }
+            )
+        )
+        self.output.write("\n")
+
+    def close(self):
+        if self.output is not sys.stdout:
+            self.output.close()
+
+
+# Writes a .npy file (readable with numpy.load, but numpy is not needed to write it)
+# that gets allocated up front and filled in through a memory map
+# Each entity row holds x, y, vx, vy of every point, then the mount phase value and
+# 1 if the sled is intact (0 otherwise)
+class NpyExporter:
+    MAGIC = b"\x93NUMPY\x01\x00"
+    # Values per point, and values after the points
+    POINT_VALUES = 4
+    STATE_VALUES = 2
+
+    def __init__(self, path: str, num_frames: int, template_entities: list[Entity]):
+        num_entities = len(template_entities)
+        num_points = len(template_entities[0].points) if template_entities else 0
+        self.row_values = num_points * self.POINT_VALUES + self.STATE_VALUES
+        self.frame_bytes = num_entities * self.row_values * 8
+        self.num_frames = num_frames
+
+        byte_order = "<" if sys.byteorder == "little" else ">"
+        header = (
+            f"{{'descr': '{byte_order}f8', 'fortran_order': False, "
+            f"'shape': ({num_frames}, {num_entities}, {self.row_values}), }}"
+        )
+        # The header gets padded so that the data starts at a multiple of 64 bytes
+        header_length = len(self.MAGIC) + 2 + len(header) + 1
+        header += " " * (-header_length % 64) + "\n"
+        self.data_offset = len(self.MAGIC) + 2 + len(header)
+
+        self.file = open(path, "w+b")
+        self.file.write(self.MAGIC)
+        self.file.write(len(header).to_bytes(2, "little"))
+        self.file.write(header.encode("latin1"))
+        self.file.truncate(self.data_offset + num_frames * self.frame_bytes)
+        self.map: Optional[mmap.mmap] = None
+        if num_frames * self.frame_bytes > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        self.index = 0
+
+    def write_frame(self, frame: int, entities: list[Entity]):
+        if self.map is None or self.index >= self.num_frames:
+            return
+
+        values = array("d")
+        for entity in entities:
+            for point in entity.points:
+                values.extend(
+                    (
+                        point.position.x,
+                        point.position.y,
+                        point.velocity.x,
+                        point.velocity.y,
+                    )
+                )
+            values.append(entity.state.mount_phase.value)
+            values.append(1 if entity.state.sled_intact else 0)
+
+        offset = self.data_offset + self.index * self.frame_bytes
+        self.map[offset : offset + self.frame_bytes] = values.tobytes()
+        self.index += 1
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        self.file.close()
+
+
+def open_text_output(path: str) -> TextIO:
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", newline="")
+
+
+def export_frames(
+    engine: Engine,
+    path: str,
+    export_format: ExportFormat,
+    start_frame: int,
+    end_frame: int,
+    step_size: int = 1,
+) -> int:
+    # Checked before the output gets opened, which would leave a file with no frames
+    if start_frame < 0:
+        raise ValueError("start frame has to be at least 0")
+    if step_size < 1:
+        raise ValueError("step size has to be at least 1")
+
+    frames = range(start_frame, end_frame + 1, step_size)
+    if export_format == ExportFormat.CSV:
+        exporter = CsvExporter(open_text_output(path))
+    elif export_format == ExportFormat.JSONL:
+        exporter = JsonlExporter(open_text_output(path))
+    else:
+        initial_frame = engine.get_frame(0)
+        assert initial_frame is not None
+        exporter = NpyExporter(path, len(frames), initial_frame.entities)
+
+    num_frames = 0
+    try:
+        for frame, frame_state in engine.iter_frames(
+            frames.start, frames.stop, frames.step
+        ):
+            exporter.write_frame(frame, frame_state.entities)
+            num_frames += 1
+    finally:
+        exporter.close()
+    return num_frames
+
+
+def get_export_format(path: str) -> ExportFormat:
+    if path.endswith(".npy"):
+        return ExportFormat.NPY
+    if path.endswith(".jsonl"):
+        return ExportFormat.JSONL
+    return ExportFormat.CSV
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Exports rider points and state for a range of frames"
+    )
+    parser.add_argument("track", help=".track.json file")
+    parser.add_argument("output", help="output file (- for stdout with csv/jsonl)")
+    parser.add_argument(
+        "--format",
+        choices=[export_format.name.lower() for export_format in ExportFormat],
+        default=None,
+        help="defaults to the output file extension, or csv",
+    )
+    parser.add_argument("--start", type=int, default=0, help="first frame")
+    parser.add_argument("--end", type=int, default=400, help="last frame")
+    parser.add_argument("--step", type=int, default=1, help="export every nth frame")
+    parser.add_argument("--lra", action="store_true", help="use lra remounting")
+    parser.add_argument(
+        "--lazy", action="store_true", help="only build lines near the riders"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=[backend.name.lower() for backend in PhysicsBackend],
+        default=PhysicsBackend.SCALAR.name.lower(),
+    )
+    args = parser.parse_args()
+
+    if args.format is None:
+        export_format = get_export_format(args.output)
+    else:
+        export_format = ExportFormat[args.format.upper()]
+    if export_format == ExportFormat.NPY and args.output == "-":
+        parser.error("npy output needs a file")
+
+    with open(args.track, "r") as f:
+        engine = load_track(
+            f,
+            args.lra,
+            backend=PhysicsBackend[args.backend.upper()],
+            lazy=args.lazy,
+        )
+
+    start_time = time.perf_counter()
+    try:
+        num_frames = export_frames(
+            engine, args.output, export_format, args.start, args.end, args.step
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    print(
+        f"exported {num_frames} frames in {time.perf_counter() - start_time:.2f}s",
+        file=sys.stderr,
+    )
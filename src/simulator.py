@@ -3,10 +3,10 @@ from engine.entity import Entity
 from engine.line import NormalLine, BaseLine, AccelerationLine
 from engine.bone import NormalBone, MountBone, RepelBone
 import tkinter as tk
-import json
 from enum import Enum
 from typing import Union
-from utils.convert import convert_track
+from utils.convert import load_track
+from utils.prefetch import FramePrefetcher
 import utils.debug
 
 
@@ -41,17 +41,20 @@ class TrackSimulator:
     FLUTTER_BONE_COLOR = "purple"
     HITBOX_COLOR = "lightgray"
     FPS = 40
+    # Frames simulated ahead of the displayed frame in the background
+    LOOK_AHEAD = 5 * FPS
 
     def __init__(self, track_path: str, lra: bool):
         self.track_path = track_path
-        self.track = json.load(open(track_path, "r"))
-        self.engine = convert_track(self.track, lra)
+        with open(track_path, "r") as f:
+            self.engine = load_track(f, lra)
         frame = self.engine.get_frame(0)
         if frame is None:
             self.entities = []
         else:
             self.entities = frame.entities
         self.lines = self.engine.grid.get_all_lines()
+        self.prefetcher = FramePrefetcher(self.engine, self.LOOK_AHEAD)
 
         self.root = tk.Tk()
         self.root.title("Line Rider Python Engine")
@@ -67,6 +70,9 @@ class TrackSimulator:
         self.origin = Vector(0, 0)
 
         self.frame = self.START_FRAME
+        # Whether the frame is still being simulated, the previous entities are
+        # displayed until it is done
+        self.frame_pending = False
         self.focused_entity = 0
         self.playing = False
         self.drawing_line_start = None
@@ -80,6 +86,7 @@ class TrackSimulator:
 
         self.canvas.focus_set()
         self.root.mainloop()
+        self.prefetcher.stop()
 
     def _bind_keys(self):
         self.canvas.bind("<ButtonPress-1>", self._on_mouse_down)
@@ -123,7 +130,9 @@ class TrackSimulator:
                     -1, start_physics_point, end_physics_point, False, False, False
                 )
                 new_normal_line = NormalLine(new_line)
-                self.engine.add_line(new_normal_line)
+                with self.prefetcher.lock:
+                    self.engine.add_line(new_normal_line)
+                    self.prefetcher.invalidate()
                 self.lines.append(new_normal_line)
                 self._update()
 
@@ -135,7 +144,9 @@ class TrackSimulator:
     def _remove_last_line(self, event=None):
         if len(self.lines) > 0:
             last_line = self.lines.pop()
-            self.engine.remove_line(last_line.base.id)
+            with self.prefetcher.lock:
+                self.engine.remove_line(last_line.base.id)
+                self.prefetcher.invalidate()
             self._update()
 
     def _on_resize(self, event):
@@ -143,15 +154,15 @@ class TrackSimulator:
         self._update()
 
     def _prev_breakpoint(self, event=None):
-        utils.debug.dec_breakpoints_target()
-        if len(self.engine.state_cache) > 1:
-            self.engine.state_cache = self.engine.state_cache[:-1]
+        with self.prefetcher.lock:
+            utils.debug.dec_breakpoints_target()
+            self.prefetcher.clear_from(self.frame)
         self._update()
 
     def _next_breakpoint(self, event=None):
-        utils.debug.inc_breakpoints_target()
-        if len(self.engine.state_cache) > 1:
-            self.engine.state_cache = self.engine.state_cache[:-1]
+        with self.prefetcher.lock:
+            utils.debug.inc_breakpoints_target()
+            self.prefetcher.clear_from(self.frame)
         self._update()
 
     def _prev_frame(self, event=None):
@@ -176,19 +187,22 @@ class TrackSimulator:
         self.playing = not self.playing
 
     def _tick(self):
-        if self.playing:
+        if self.frame_pending:
+            self._update()
+        elif self.playing:
+            # Playback waits for frames that are still being simulated
             self._next_frame()
         self.root.after(int(1000 / self.FPS), self._tick)
 
     def _update(self):
-        frame_state = self.engine.get_frame(self.frame)
-        if frame_state is None:
-            self.root.quit()
-        else:
-            for tag in DrawTag:
-                self.draw_indices[tag] = 0
-            self._redraw(frame_state.entities)
-            self._cleanup_canvas_cache()
+        frame_state = self.prefetcher.request(self.frame)
+        self.frame_pending = frame_state is None
+        if frame_state is not None:
+            self.entities = frame_state.entities
+        for tag in DrawTag:
+            self.draw_indices[tag] = 0
+        self._redraw(self.entities)
+        self._cleanup_canvas_cache()
 
     def _cleanup_canvas_cache(self):
         for tag in DrawTag:
@@ -239,30 +253,30 @@ class TrackSimulator:
     def _draw_entity(self, entity: Entity):
         mv_len_zoom = self.MV_LENGTH * self.ZOOM
 
-        for bone in entity.flutter_bones:
-            p1 = self._physics_to_canvas(bone.base.point1.position)
-            p2 = self._physics_to_canvas(bone.base.point1.position)
+        for bone in entity.skeleton.flutter_bones:
+            p1 = self._physics_to_canvas(entity.points[bone.base.point1].position)
+            p2 = self._physics_to_canvas(entity.points[bone.base.point1].position)
             self._generate_line(
                 DrawTag.Bone, self.BONE_WIDTH, p1, p2, color=self.FLUTTER_BONE_COLOR
             )
 
-        for bone in entity.structural_bones:
+        for bone in entity.skeleton.structural_bones:
             if isinstance(bone, NormalBone):
-                p1 = self._physics_to_canvas(bone.base.point1.position)
-                p2 = self._physics_to_canvas(bone.base.point2.position)
+                p1 = self._physics_to_canvas(entity.points[bone.base.point1].position)
+                p2 = self._physics_to_canvas(entity.points[bone.base.point2].position)
                 self._generate_line(
                     DrawTag.Bone, self.BONE_WIDTH, p1, p2, color=self.NORMAL_BONE_COLOR
                 )
 
             elif isinstance(bone, MountBone) and entity.state.is_mounted():
-                p1 = self._physics_to_canvas(bone.base.point1.position)
-                p2 = self._physics_to_canvas(bone.base.point2.position)
+                p1 = self._physics_to_canvas(entity.points[bone.base.point1].position)
+                p2 = self._physics_to_canvas(entity.points[bone.base.point2].position)
                 self._generate_line(
                     DrawTag.Bone, self.BONE_WIDTH, p1, p2, color=self.MOUNT_BONE_COLOR
                 )
             elif isinstance(bone, RepelBone):
-                p1 = self._physics_to_canvas(bone.base.point1.position)
-                p2 = self._physics_to_canvas(bone.base.point2.position)
+                p1 = self._physics_to_canvas(entity.points[bone.base.point1].position)
+                p2 = self._physics_to_canvas(entity.points[bone.base.point2].position)
                 self._generate_line(
                     DrawTag.Bone, self.BONE_WIDTH, p1, p2, color=self.REPEL_BONE_COLOR
                 )
@@ -345,6 +359,11 @@ class TrackSimulator:
             self.canvas_center.y * 2 - 75,
         )
 
+        if self.frame_pending:
+            timestamp += (
+                f" (simulating {self.prefetcher.prefetched_frame}/{self.frame})"
+            )
+
         self._generate_text(
             timestamp, self.canvas_center.x, self.canvas_center.y * 2 - 50
         )
@@ -1,14 +1,36 @@
 # Runs track tests, line grid tests, and other unit tests
 
 import unittest
+import ast
+import csv
 import json
 import math
 import sys
+import importlib.util
+import io
+import os
+import random
+import subprocess
+import tempfile
+import time
+from array import array
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any
 from engine.grid import CellPosition, Grid, GridVersion
 from engine.vector import Vector
+from engine.line import AccelerationLine, BaseLine, NormalLine
+from engine.point import BasePoint
+from engine.scalar_backend import interact_lines
+from engine.engine import Engine, PhysicsBackend
+from engine.cache import CachedFrame, FrameCache, KeyframeCache, WindowCache
+from engine.frame_store import FrameStore
+from utils.convert import convert_lines, convert_track, load_track
+from utils.prefetch import FramePrefetcher
+from utils.track_reader import TrackReader
+from batch import run_batch
+from export import ExportFormat, export_frames
 from utils.create_fixture_test import sanitize, create_fixture_test
+import utils.debug
 
 # Caps the engine test cases that get included based on frame * rider calculations
 MAX_ENGINE_CALCS: Optional[int] = None
@@ -38,6 +60,126 @@ class ColorTextTestRunner(unittest.TextTestRunner):
         super().__init__(*args, resultclass=ColorTestResult, **kwargs)  # type: ignore
 
 
+# The original DDA stepping of get_cell_positions_between, on Vector and
+# CellPosition objects, used to check the faster implementation
+def get_reference_dda_cells(grid: Grid, point1: Vector, point2: Vector):
+    def get_next_position(curr_pos: Vector, curr_cell_pos: CellPosition) -> Vector:
+        line_vector = point2 - point1
+
+        if line_vector.x > 0:
+            delta_x = grid.cell_size - curr_cell_pos.remainder.x
+        else:
+            delta_x = -1 - curr_cell_pos.remainder.x
+
+        if line_vector.y > 0:
+            delta_y = grid.cell_size - curr_cell_pos.remainder.y
+        else:
+            delta_y = -1 - curr_cell_pos.remainder.y
+
+        if grid.version == GridVersion.V6_2:
+            if curr_cell_pos.x < 0:
+                if line_vector.x > 0:
+                    delta_x = grid.cell_size + curr_cell_pos.remainder.x
+                else:
+                    delta_x = -(grid.cell_size + curr_cell_pos.remainder.x)
+
+            if curr_cell_pos.y < 0:
+                if line_vector.y > 0:
+                    delta_y = grid.cell_size + curr_cell_pos.remainder.y
+                else:
+                    delta_y = -(grid.cell_size + curr_cell_pos.remainder.y)
+
+        if line_vector.x == 0:
+            return Vector(curr_pos.x, curr_pos.y + delta_y)
+        if line_vector.y == 0:
+            return Vector(curr_pos.x + delta_x, curr_pos.y)
+        if grid.version == GridVersion.V6_1:
+            slope = line_vector.y / line_vector.x
+            y_intercept = point1.y - slope * point1.x
+            next_x = round((curr_pos.y + delta_y - y_intercept) / slope)
+            next_y = round(slope * (curr_pos.x + delta_x) + y_intercept)
+            if abs(next_y - curr_pos.y) < abs(delta_y):
+                return Vector(curr_pos.x + delta_x, next_y)
+            if abs(next_y - curr_pos.y) == abs(delta_y):
+                return Vector(curr_pos.x + delta_x, curr_pos.y + delta_y)
+            return Vector(next_x, curr_pos.y + delta_y)
+
+        y_based_delta_x = delta_y * (line_vector.x / line_vector.y)
+        x_based_delta_y = delta_x * (line_vector.y / line_vector.x)
+        if abs(x_based_delta_y) < abs(delta_y):
+            return Vector(curr_pos.x + delta_x, curr_pos.y + x_based_delta_y)
+        if abs(x_based_delta_y) == abs(delta_y):
+            return Vector(curr_pos.x + delta_x, curr_pos.y + delta_y)
+        return Vector(curr_pos.x + y_based_delta_x, curr_pos.y + delta_y)
+
+    initial_cell = grid.get_cell_position(point1)
+    final_cell = grid.get_cell_position(point2)
+    if (point1.x == point2.x and point1.y == point2.y) or (
+        initial_cell.x == final_cell.x and initial_cell.y == final_cell.y
+    ):
+        return [initial_cell]
+
+    cells = []
+    curr_pos = point1.copy()
+    curr_cell_pos = initial_cell
+    while min(initial_cell.x, final_cell.x) <= curr_cell_pos.x <= max(
+        initial_cell.x, final_cell.x
+    ) and min(initial_cell.y, final_cell.y) <= curr_cell_pos.y <= max(
+        initial_cell.y, final_cell.y
+    ):
+        cells.append(curr_cell_pos)
+        curr_pos = get_next_position(curr_pos, curr_cell_pos)
+        next_cell_pos = grid.get_cell_position(curr_pos)
+        if next_cell_pos.x == curr_cell_pos.x and next_cell_pos.y == curr_cell_pos.y:
+            break
+        curr_cell_pos = next_cell_pos
+    return cells
+
+
+# The original 6.0 rasterization of get_cell_positions_between, testing every cell
+# in the bounding box of the line, used to check the faster implementation
+def get_reference_aabb_cells(grid: Grid, point1: Vector, point2: Vector):
+    initial_cell = grid.get_cell_position(point1)
+    final_cell = grid.get_cell_position(point2)
+    if (point1.x == point2.x and point1.y == point2.y) or (
+        initial_cell.x == final_cell.x and initial_cell.y == final_cell.y
+    ):
+        return [initial_cell]
+
+    cells = []
+    line_vector = point2 - point1
+    line_normal_unit = line_vector.rot_ccw() * (1 / line_vector.length())
+    line_halfway = 0.5 * Vector(abs(line_vector.x), abs(line_vector.y))
+    line_midpoint = point1 + line_vector * 0.5
+    absolute_normal = Vector(abs(line_normal_unit.x), abs(line_normal_unit.y))
+    for cell_x in range(
+        min(initial_cell.x, final_cell.x), max(initial_cell.x, final_cell.x) + 1
+    ):
+        for cell_y in range(
+            min(initial_cell.y, final_cell.y), max(initial_cell.y, final_cell.y) + 1
+        ):
+            curr_pos = grid.cell_size * Vector(cell_x + 0.5, cell_y + 0.5)
+            next_cell_pos = grid.get_cell_position(curr_pos)
+            dist_between_centers = line_midpoint - curr_pos
+            dist_from_cell_center = absolute_normal @ next_cell_pos.remainder
+            cell_overlap_into_hitbox = (
+                Vector(dist_from_cell_center, dist_from_cell_center) @ absolute_normal
+            )
+            norm_dist_between_centers = line_normal_unit @ dist_between_centers
+            dist_from_line = abs(norm_dist_between_centers * line_normal_unit.x) + abs(
+                norm_dist_between_centers * line_normal_unit.y
+            )
+            if (
+                line_halfway.x + next_cell_pos.remainder.x
+                >= abs(dist_between_centers.x)
+                and line_halfway.y + next_cell_pos.remainder.y
+                >= abs(dist_between_centers.y)
+                and cell_overlap_into_hitbox >= dist_from_line
+            ):
+                cells.append(next_cell_pos)
+    return cells
+
+
 class TestGrid(unittest.TestCase):
     def setUp(self) -> None:
         self.grid_62 = Grid(GridVersion.V6_2, 14)
@@ -57,6 +199,54 @@ class TestGrid(unittest.TestCase):
                 )
                 seen[key] = (i, j)
 
+    def test_position_keys_match_cell_positions(self):
+        rng = random.Random(0)
+        positions = [Vector(-1e-17, 14 - 1e-15), Vector(-14, 0), Vector(0, -0.0)]
+        for _ in range(1000):
+            positions.append(Vector(rng.uniform(-1e4, 1e4), rng.uniform(-1e4, 1e4)))
+        for position in positions:
+            self.assertEqual(
+                self.grid_62.get_position_key(position),
+                self.grid_62.get_cell_position(position).get_key(),
+            )
+
+    def test_rasterizers_match_reference(self):
+        rng = random.Random(0)
+        points = []
+        for _ in range(400):
+            scale = rng.choice((1, 14, 100, 1000))
+            point1 = Vector(rng.uniform(-scale, scale), rng.uniform(-scale, scale))
+            point2 = point1 + Vector(
+                rng.uniform(-scale, scale), rng.uniform(-scale, scale)
+            )
+            points.append((point1, point2))
+            # Axis aligned, on cell boundaries and integer positions
+            points.append((point1, Vector(point1.x, point2.y)))
+            points.append((point1, Vector(point2.x, point1.y)))
+            points.append((14 * Vector(round(point1.x), round(point1.y)), point2))
+            points.append(
+                (
+                    Vector(round(point1.x), round(point1.y)),
+                    Vector(round(point2.x), round(point2.y)),
+                )
+            )
+
+        for grid in (self.grid_60, self.grid_61, self.grid_62):
+            for point1, point2 in points:
+                if grid.version == GridVersion.V6_0:
+                    # Testing the whole bounding box gets slow for long lines
+                    if (point2 - point1).length() > 300:
+                        continue
+                    expected = get_reference_aabb_cells(grid, point1, point2)
+                else:
+                    expected = get_reference_dda_cells(grid, point1, point2)
+                cells = grid.get_cell_positions_between(point1, point2)
+                self.assertEqual(
+                    [(cell.x, cell.y, cell.world_position) for cell in cells],
+                    [(cell.x, cell.y, cell.world_position) for cell in expected],
+                    f"{grid.version.name} {point1} {point2}",
+                )
+
     def _run_cases(self, grid: Grid, cases: list, engine_name: str):
         for _, case in enumerate(cases):
             with self.subTest(engine=engine_name, case=case["name"]):
@@ -99,6 +289,361 @@ class TestGrid(unittest.TestCase):
         grid_tests = json.loads(Path("grid_60_tests.json").read_text())
         self._run_cases(self.grid_60, grid_tests, "grid_60")
 
+    def test_line_index(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        lines = convert_lines(track_data["lines"])
+        grid = Grid(GridVersion.V6_2, 14)
+        grid.add_lines(lines[:1000])
+        for line in lines[1000:]:
+            grid.add_line(line)
+
+        max_id = max(line.base.id for line in lines)
+        self.assertEqual(grid.get_max_line_id(), max_id)
+        self.assertIs(grid.get_line_by_id(lines[500].base.id), lines[500])
+        self.assertEqual(grid.get_all_lines(), lines)
+
+        removed = grid.get_line_by_id(max_id)
+        assert removed is not None
+        grid.remove_line(removed)
+        self.assertIsNone(grid.get_line_by_id(max_id))
+        self.assertEqual(
+            grid.get_max_line_id(),
+            max(line.base.id for line in lines if line is not removed),
+        )
+        for cell in grid.cells.values():
+            self.assertNotIn(removed, grid.get_cell_lines(cell))
+
+        moved = lines[0]
+        old_index = grid.get_line_index(moved)
+        assert old_index is not None
+        old_keys = set(grid.line_cell_keys[old_index])
+        moved.base.set_endpoints(
+            moved.base.endpoints[0] + Vector(500, 500),
+            moved.base.endpoints[1] + Vector(500, 500),
+        )
+        grid.move_line(moved)
+        new_keys = {
+            position.get_key()
+            for position in grid.get_cell_positions_between(*moved.base.endpoints)
+        }
+        new_index = grid.get_line_index(moved)
+        assert new_index is not None
+        self.assertEqual(set(grid.line_cell_keys[new_index]), new_keys)
+        for cell_key in old_keys - new_keys:
+            self.assertNotIn(moved, grid.get_cell_lines(grid.cells[cell_key]))
+        for cell_key in new_keys:
+            self.assertIn(moved, grid.get_cell_lines(grid.cells[cell_key]))
+
+        # The largest id left, whichever order lines were added and get removed in
+        for shuffled in (False, True):
+            rng = random.Random(0)
+            remaining = list(lines)
+            if shuffled:
+                rng.shuffle(remaining)
+            grid = Grid(GridVersion.V6_2, 14)
+            grid.add_lines(remaining)
+            remaining.sort(key=lambda line: line.base.id)
+            while remaining:
+                line = remaining.pop(rng.choice((0, -1)))
+                grid.remove_line(line)
+                self.assertEqual(
+                    grid.get_max_line_id(),
+                    remaining[-1].base.id if remaining else -1,
+                )
+
+    # Tracks can have lines sharing an id, which all collide, and get looked up by id
+    # as the first one added
+    def test_duplicate_line_ids(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        track_data["lines"].append({**track_data["lines"][0], "x2": 500})
+
+        grid = Grid(GridVersion.V6_2, 14)
+        lines = convert_lines(track_data["lines"])
+        grid.add_lines(lines[:-1])
+        grid.add_line(lines[-1])
+        self.assertEqual(grid.get_num_lines(), len(lines))
+        self.assertEqual(grid.get_all_lines(), lines)
+        for position in grid.get_cell_positions_between(*lines[-1].base.endpoints):
+            self.assertIn(
+                lines[-1], grid.get_cell_lines(grid.cells[position.get_key()])
+            )
+
+        line_id = lines[0].base.id
+        self.assertIs(grid.get_line_by_id(line_id), lines[0])
+        grid.remove_line(lines[0])
+        self.assertIs(grid.get_line_by_id(line_id), lines[-1])
+        for position in grid.get_cell_positions_between(*lines[-1].base.endpoints):
+            cell_lines = grid.get_cell_lines(grid.cells[position.get_key()])
+            self.assertIn(lines[-1], cell_lines)
+            self.assertNotIn(lines[0], cell_lines)
+        grid.remove_line(lines[-1])
+        self.assertIsNone(grid.get_line_by_id(line_id))
+
+    def test_lines_near_position(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        grid = Grid(GridVersion.V6_2, 14)
+        grid.add_lines(convert_lines(track_data["lines"]))
+        lines = grid.get_all_lines()
+        rng = random.Random(0)
+        positions = [
+            Vector(-1e-17, 14 - 1e-15),
+            Vector(-14, 0),
+            Vector(13.999999999999998, -28),
+        ]
+        for _ in range(300):
+            line = rng.choice(lines)
+            positions.append(
+                line.base.endpoints[0]
+                + Vector(rng.uniform(-20, 20), rng.uniform(-20, 20))
+            )
+
+        def get_expected(position: Vector):
+            cell_keys = []
+            expected_lines = []
+            for x_offset in (-1, 0, 1):
+                for y_offset in (-1, 0, 1):
+                    cell_key = grid.get_cell_position(
+                        position + 14 * Vector(x_offset, y_offset)
+                    ).get_key()
+                    cell_keys.append(cell_key)
+                    cell = grid.cells.get(cell_key)
+                    if cell is not None:
+                        expected_lines.extend(grid.get_cell_lines(cell))
+            return set(cell_keys), expected_lines
+
+        for position in positions:
+            expected_keys, expected_lines = get_expected(position)
+            grid.queried_cells.clear()
+            self.assertEqual(grid.get_lines_near_position(position), expected_lines)
+            self.assertEqual(grid.queried_cells, expected_keys)
+
+        # Edits only affect the neighborhoods of the edited cells
+        neighborhoods = len(grid.neighborhoods)
+        position = positions[-1]
+        line = NormalLine(
+            BaseLine(-1, position, position + Vector(5, 5), False, False, False)
+        )
+        line.base.id = grid.get_max_line_id() + 1
+        grid.add_line(line)
+        self.assertGreater(len(grid.neighborhoods), neighborhoods - 30)
+        self.assertEqual(
+            grid.get_lines_near_position(position), get_expected(position)[1]
+        )
+        self.assertIn(line, grid.get_lines_near_position(position))
+        grid.remove_line(line)
+        self.assertNotIn(line, grid.get_lines_near_position(position))
+
+        # The cache stays within its limit, dropping the oldest neighborhoods from
+        # the neighborhoods of their cells too
+        grid.neighborhoods.clear()
+        grid.cell_neighborhoods.clear()
+        grid.max_neighborhoods = 16
+        for position in positions:
+            self.assertEqual(
+                grid.get_lines_near_position(position), get_expected(position)[1]
+            )
+            self.assertLessEqual(len(grid.neighborhoods), 16)
+        self.assertEqual(
+            set().union(*grid.cell_neighborhoods.values()), set(grid.neighborhoods)
+        )
+
+    def test_empty_areas(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        grid = Grid(GridVersion.V6_2, 14)
+        grid.add_lines(convert_lines(track_data["lines"]))
+        lines = grid.get_all_lines()
+        rng = random.Random(0)
+        # Gives the same results with its caches limited, staying within the limits
+        limited = Grid(GridVersion.V6_2, 14)
+        limited.add_lines(lines)
+        limited.max_cell_distances = 8
+        limited.max_range_blocks = 8
+
+        results = []
+        for _ in range(300):
+            corner = rng.choice(lines).base.endpoints[0] + Vector(
+                rng.uniform(-100, 100), rng.uniform(-100, 100)
+            )
+            size = Vector(rng.uniform(0, 30), rng.uniform(0, 30))
+            grid.queried_blocks.clear()
+            empty = grid.is_area_empty(
+                corner.x, corner.y, corner.x + size.x, corner.y + size.y
+            )
+            results.append(empty)
+            limited.queried_blocks.clear()
+            self.assertEqual(
+                limited.is_area_empty(
+                    corner.x, corner.y, corner.x + size.x, corner.y + size.y
+                ),
+                empty,
+            )
+            self.assertEqual(limited.queried_blocks, grid.queried_blocks)
+            self.assertLessEqual(len(limited.cell_distances), 8)
+            self.assertLessEqual(len(limited.range_blocks), 8)
+            if not empty:
+                continue
+            for _ in range(10):
+                position = corner + Vector(
+                    rng.uniform(0, size.x), rng.uniform(0, size.y)
+                )
+                self.assertEqual(grid.get_lines_near_position(position), [])
+                # Every cell the position queries is in a queried block
+                for x_offset in (-14, 0, 14):
+                    for y_offset in (-14, 0, 14):
+                        cell_position = grid.get_cell_position(
+                            position + Vector(x_offset, y_offset)
+                        )
+                        self.assertIn(
+                            grid.get_block(cell_position.x, cell_position.y),
+                            grid.queried_blocks,
+                        )
+        self.assertIn(True, results)
+        self.assertIn(False, results)
+
+        # Occupancy follows line edits
+        position = Vector(-5000, -5000)
+        self.assertTrue(
+            grid.is_area_empty(position.x, position.y, position.x, position.y)
+        )
+        line = NormalLine(
+            BaseLine(
+                -1,
+                position + Vector(0, 10),
+                position + Vector(30, 10),
+                False,
+                False,
+                False,
+            )
+        )
+        line.base.id = grid.get_max_line_id() + 1
+        grid.add_line(line)
+        self.assertFalse(
+            grid.is_area_empty(position.x, position.y, position.x, position.y)
+        )
+        grid.remove_line(line)
+        self.assertTrue(
+            grid.is_area_empty(position.x, position.y, position.x, position.y)
+        )
+
+    def test_add_lines_matches_add_line(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        lines = convert_lines(track_data["lines"])
+        random.Random(0).shuffle(lines)
+        # Lines with equal ids go after the ones added before them
+        lines += convert_lines(track_data["lines"][:50])
+
+        for grid_version in GridVersion:
+            with self.subTest(grid_version=grid_version.name):
+                expected = Grid(grid_version, 14)
+                for line in lines[:100]:
+                    expected.add_line(line)
+                grid = Grid(grid_version, 14)
+                grid.add_lines(lines[:100])
+                for line in lines[100:]:
+                    expected.add_line(line)
+                grid.add_lines(lines[100:])
+
+                self.assertEqual(list(grid.cells), list(expected.cells))
+                for cell_key, cell in grid.cells.items():
+                    expected_cell = expected.cells[cell_key]
+                    self.assertEqual(cell.line_indices, expected_cell.line_indices)
+                    self.assertEqual(
+                        (cell.x, cell.y), (expected_cell.x, expected_cell.y)
+                    )
+                    self.assertEqual(
+                        [id(line) for line in grid.get_cell_lines(cell)],
+                        [id(line) for line in expected.get_cell_lines(expected_cell)],
+                    )
+
+
+class TestLineBounds(unittest.TestCase):
+    # Every position in the hitbox between the extended ends is inside the bounds
+    def test_bounds_cover_hitbox(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            scale = rng.choice((1, 100, 1e5))
+            start = Vector(rng.uniform(-scale, scale), rng.uniform(-scale, scale))
+            end = start + Vector(rng.uniform(-50, 50), rng.uniform(-50, 50))
+            line = BaseLine(
+                0,
+                start,
+                end,
+                rng.random() < 0.5,
+                rng.random() < 0.5,
+                rng.random() < 0.5,
+            )
+            min_x, min_y, max_x, max_y = line.bounds
+            for _ in range(50):
+                position = (
+                    line.endpoints[0]
+                    + line.vector * rng.uniform(line.limit_left, line.limit_right)
+                    + line.normal_unit * rng.uniform(0, line.HITBOX_HEIGHT)
+                )
+                offset = position - line.endpoints[0]
+                distance = line.normal_unit @ offset
+                along = (line.vector @ offset) * line.inv_length_squared
+                if (
+                    0 < distance < line.HITBOX_HEIGHT
+                    and line.limit_left <= along <= line.limit_right
+                ):
+                    self.assertTrue(min_x <= position.x <= max_x)
+                    self.assertTrue(min_y <= position.y <= max_y)
+
+
+class TestLineRecords(unittest.TestCase):
+    # Interacting with line records gives the same results as interacting with the
+    # lines, one line at a time or several at once
+    def test_interact_lines_matches_lines(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            start = Vector(rng.uniform(-100, 100), rng.uniform(-100, 100))
+            lines = []
+            for _ in range(3):
+                base = BaseLine(
+                    0,
+                    start + Vector(rng.uniform(-5, 5), rng.uniform(-5, 5)),
+                    start + Vector(rng.uniform(-50, 50), rng.uniform(-50, 50)),
+                    rng.random() < 0.5,
+                    rng.random() < 0.5,
+                    rng.random() < 0.5,
+                )
+                if rng.random() < 0.5:
+                    lines.append(NormalLine(base))
+                else:
+                    lines.append(AccelerationLine(base, rng.uniform(-3, 3)))
+
+            for _ in range(20):
+                point = BasePoint(
+                    start + Vector(rng.uniform(-20, 50), rng.uniform(-20, 50)),
+                    Vector(rng.uniform(-5, 5), rng.uniform(-5, 5)),
+                    start + Vector(rng.uniform(-20, 50), rng.uniform(-20, 50)),
+                )
+                friction = rng.choice((0.0, 0.1, 0.8))
+                result = interact_lines(
+                    [line.base.record for line in lines],
+                    friction,
+                    point.position.x,
+                    point.position.y,
+                    point.velocity.x,
+                    point.velocity.y,
+                    point.previous_position.x,
+                    point.previous_position.y,
+                )
+                for line in lines:
+                    new_position, new_previous_position = line.interact(point, friction)
+                    point.update_state(
+                        new_position, point.velocity, new_previous_position
+                    )
+                self.assertEqual(
+                    [value.hex() for value in result],
+                    [
+                        point.position.x.hex(),
+                        point.position.y.hex(),
+                        point.previous_position.x.hex(),
+                        point.previous_position.y.hex(),
+                    ],
+                )
+
 
 class TestVector(unittest.TestCase):
     def setUp(self):
@@ -195,6 +740,778 @@ class TestVector(unittest.TestCase):
         self.assertNotEqual(v, v)
 
 
+def load_fixture_engine(track_file: str, lra: bool, **kwargs) -> Engine:
+    with open(f"fixtures/{track_file}.track.json", "r") as f:
+        track_data = json.load(f)
+    return convert_track(track_data, lra, **kwargs)
+
+
+class EngineTestCase(unittest.TestCase):
+    def assertFramesEqual(self, result: Optional[CachedFrame], expected: CachedFrame):
+        self.assertIsNotNone(result)
+        assert result is not None
+        self.assertEqual(len(result.entities), len(expected.entities))
+        for result_entity, expected_entity in zip(result.entities, expected.entities):
+            self.assertEqual(
+                result_entity.state.mount_phase, expected_entity.state.mount_phase
+            )
+            self.assertEqual(
+                result_entity.state.sled_intact, expected_entity.state.sled_intact
+            )
+            for result_point, expected_point in zip(
+                result_entity.points, expected_entity.points
+            ):
+                self.assertEqual(
+                    result_point.position.hex(), expected_point.position.hex()
+                )
+                self.assertEqual(
+                    result_point.velocity.hex(), expected_point.velocity.hex()
+                )
+                self.assertEqual(
+                    result_point.previous_position.hex(),
+                    expected_point.previous_position.hex(),
+                )
+
+    # Checks every frame against the default backend, after making the same edit to
+    # both engines
+    def assertBackendMatches(
+        self,
+        backend: PhysicsBackend,
+        track_file: str,
+        lra: bool,
+        last_frame: int,
+        edit: Optional[Callable[[Engine], None]] = None,
+        edit_frame: int = 0,
+    ):
+        expected = load_fixture_engine(track_file, lra)
+        engine = load_fixture_engine(track_file, lra, backend=backend)
+        if edit is not None:
+            # Frames after the edit get simulated again, with lines the grid has
+            # already handed out
+            for edited in (expected, engine):
+                edited.get_frame(edit_frame)
+                edit(edited)
+                edited.state_cache.truncate(edit_frame + 1)
+        for frame in range(last_frame + 1):
+            expected_frame = expected.get_frame(frame)
+            assert expected_frame is not None
+            self.assertFramesEqual(engine.get_frame(frame), expected_frame)
+
+
+class TestKeyframeCache(EngineTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = load_fixture_engine("remount_two_riders", False)
+        cls.reference.get_frame(120)
+
+    def test_random_seeks_match(self):
+        engine = load_fixture_engine(
+            "remount_two_riders", False, state_cache=KeyframeCache(10, hot_window=2)
+        )
+        for frame in (83, 5, 120, 44, 45, 43, 100, 0, 77):
+            expected = self.reference.get_frame(frame)
+            assert expected is not None
+            self.assertFramesEqual(engine.get_frame(frame), expected)
+
+    def test_memory_bounded(self):
+        cache = KeyframeCache(10, hot_window=2)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        for frame in range(121):
+            engine.get_frame(frame)
+        # 13 keyframes (0 to 120) plus the two frames behind the playhead
+        self.assertEqual(len(cache), 15)
+
+    def test_automatic_interval(self):
+        cache = KeyframeCache(max_seek_time=0.01)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        engine.get_frame(120)
+        self.assertIsNotNone(cache.interval)
+        assert cache.interval is not None
+        self.assertLessEqual(len(cache), 121 // cache.interval + cache.hot_window + 2)
+        expected = self.reference.get_frame(60)
+        assert expected is not None
+        self.assertFramesEqual(engine.get_frame(60), expected)
+
+
+class TestCacheBudget(EngineTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = load_fixture_engine("remount_two_riders", False)
+        cls.reference.get_frame(120)
+
+    def assertMatchesReference(self, engine: Engine, frames: tuple[int, ...]):
+        for frame in frames:
+            expected = self.reference.get_frame(frame)
+            assert expected is not None
+            self.assertFramesEqual(engine.get_frame(frame), expected)
+
+    def test_lru_frame_budget(self):
+        cache = FrameCache(max_frames=20)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        self.assertMatchesReference(engine, (120, 30, 110, 119))
+        self.assertEqual(len(cache), 20)
+        self.assertIn(0, cache)
+        self.assertIn(110, cache)
+        self.assertNotIn(100, cache)
+
+    def test_window_frame_budget(self):
+        cache = WindowCache(max_frames=10)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        self.assertMatchesReference(engine, (120, 60, 55))
+        self.assertEqual(len(cache), 10)
+        self.assertEqual(cache.indices, [0, 52, 53, 54, 55, 56, 57, 58, 59, 60])
+
+    def test_keyframe_byte_budget(self):
+        cache = KeyframeCache(10, hot_window=4, max_bytes=1)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        self.assertMatchesReference(engine, (120, 64, 63))
+        self.assertEqual(cache.indices, [0, 63])
+
+        cache.max_bytes = cache.get_frame_size(cache.frames[0]) * 8
+        self.assertMatchesReference(engine, (120, 64, 63))
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.assertEqual(len(cache), 8)
+
+    def test_packed_frames(self):
+        cache = FrameCache()
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        expected = engine.get_frame(60)
+        assert expected is not None
+        self.assertFramesEqual(cache.get(60), expected)
+        self.assertMatchesReference(engine, (60, 30))
+        # 2 riders with 17 points each
+        self.assertLess(cache.get_frame_size(cache.frames[60]), 2 * 17 * 6 * 8 + 200)
+
+    def test_stats(self):
+        cache = FrameCache(max_frames=10)
+        engine = load_fixture_engine("remount_two_riders", False, state_cache=cache)
+        engine.get_frame(50)
+        engine.get_frame(50)
+        engine.get_frame(20)
+        self.assertEqual(cache.get_stats()["hits"], 1)
+        self.assertEqual(cache.get_stats()["misses"], 2)
+        self.assertEqual(cache.get_stats()["recomputed"], 20)
+        self.assertEqual(cache.get_stats()["frames"], 10)
+
+
+class TestCompactObjects(unittest.TestCase):
+    def assertSlotted(self, objects: list):
+        for obj in objects:
+            self.assertFalse(hasattr(obj, "__dict__"), type(obj).__name__)
+
+    def test_frame_objects_slotted(self):
+        engine = load_fixture_engine("line_flags", False)
+        frame = engine.get_frame(10)
+        assert frame is not None
+        for entity in frame.entities:
+            skeleton = entity.skeleton
+            self.assertSlotted(skeleton.contact_points + skeleton.flutter_points)
+            self.assertSlotted(entity.points + [entity.points[0].position])
+            self.assertSlotted(skeleton.structural_bones + skeleton.flutter_bones)
+            self.assertSlotted(
+                skeleton.bones + skeleton.mount_joints + skeleton.break_joints
+            )
+
+    def test_frames_share_skeleton(self):
+        engine = load_fixture_engine("remount_two_riders", False)
+        initial = engine.get_frame(0)
+        frame = engine.get_frame(10)
+        assert initial is not None and frame is not None
+        for entity, initial_entity in zip(frame.entities, initial.entities):
+            self.assertIs(entity.skeleton, initial_entity.skeleton)
+            self.assertIsNot(entity.points[0], initial_entity.points[0])
+            self.assertIsNot(entity.state, initial_entity.state)
+        self.assertIsNot(frame.entities[0].skeleton, frame.entities[1].skeleton)
+
+    def test_grid_objects_slotted(self):
+        engine = load_fixture_engine("line_flags", False)
+        for cell in engine.grid.cells.values():
+            lines = engine.grid.get_cell_lines(cell)
+            self.assertSlotted([cell] + lines + [line.base for line in lines])
+            self.assertIsInstance(cell.line_indices, array)
+
+
+class TestLineEdits(EngineTestCase):
+    def get_frame(self, engine: Engine, frame: int) -> CachedFrame:
+        result = engine.get_frame(frame)
+        assert result is not None
+        return result
+
+    def test_add_line_keeps_earlier_frames(self):
+        engine = load_fixture_engine("line_flags", False)
+        engine.get_frame(160)
+        position = self.get_frame(engine, 150).entities[0].points[0].position
+        p1 = position + Vector(-20, 5)
+        p2 = position + Vector(20, 5)
+        engine.add_line(NormalLine(BaseLine(-1, p1, p2, False, False, False)))
+        self.assertGreater(len(engine.state_cache), 100)
+        self.assertLessEqual(len(engine.state_cache), 151)
+
+        expected = load_fixture_engine("line_flags", False)
+        expected.add_line(NormalLine(BaseLine(-1, p1, p2, False, False, False)))
+        self.assertFramesEqual(engine.get_frame(150), self.get_frame(expected, 150))
+
+    # Frames that skipped collisions in empty space still get cleared by lines added
+    # there
+    def test_add_line_in_empty_space(self):
+        engine = load_fixture_engine(
+            "ten_pc_spam", False, backend=PhysicsBackend.SCALAR
+        )
+        engine.get_frame(160)
+        position = self.get_frame(engine, 150).entities[0].points[0].position
+        self.assertTrue(
+            engine.grid.is_area_empty(position.x, position.y, position.x, position.y)
+        )
+        p1 = position + Vector(-20, 5)
+        p2 = position + Vector(20, 5)
+        engine.add_line(NormalLine(BaseLine(-1, p1, p2, False, False, False)))
+        self.assertLessEqual(len(engine.state_cache), 151)
+
+        expected = load_fixture_engine("ten_pc_spam", False)
+        expected.add_line(NormalLine(BaseLine(-1, p1, p2, False, False, False)))
+        self.assertFramesEqual(engine.get_frame(160), self.get_frame(expected, 160))
+        self.assertNotEqual(
+            self.get_frame(engine, 160).entities[0].points[0].position,
+            self.get_frame(load_fixture_engine("ten_pc_spam", False), 160)
+            .entities[0]
+            .points[0]
+            .position,
+        )
+
+    def test_remove_line_keeps_earlier_frames(self):
+        engine = load_fixture_engine("line_flags", False)
+        engine.get_frame(150)
+        line = NormalLine(
+            BaseLine(-1, Vector(-500, 0), Vector(-450, 0), False, False, False)
+        )
+        engine.add_line(line)
+        self.assertEqual(len(engine.state_cache), 151)
+        engine.remove_line(line.base.id)
+        self.assertEqual(len(engine.state_cache), 151)
+
+        last_line_id = engine.grid.get_max_line_id()
+        engine.remove_line(last_line_id)
+        expected = load_fixture_engine("line_flags", False)
+        expected.remove_line(last_line_id)
+        self.assertFramesEqual(engine.get_frame(150), self.get_frame(expected, 150))
+
+
+class TestIterFrames(EngineTestCase):
+    def test_matches_get_frame(self):
+        engine = load_fixture_engine("remount_two_riders", False)
+        expected = load_fixture_engine("remount_two_riders", False)
+        frames = list(engine.iter_frames(3, 120, 7))
+        self.assertEqual([frame for frame, _ in frames], list(range(3, 120, 7)))
+        for frame, frame_state in frames:
+            self.assertFramesEqual(frame_state, expected.get_frame(frame))
+        self.assertEqual(len(engine.state_cache), 1)
+
+    def test_checkpoints(self):
+        engine = load_fixture_engine("remount_two_riders", False)
+        for _ in engine.iter_frames(0, 100, checkpoint_interval=25):
+            pass
+        self.assertEqual(engine.state_cache.indices, [0, 25, 50, 75])
+        expected = load_fixture_engine("remount_two_riders", False)
+        self.assertFramesEqual(engine.get_frame(60), expected.get_frame(60))
+        # Resumed from frame 50
+        self.assertEqual(engine.state_cache.indices, [0, 25, 50, *range(51, 61), 75])
+
+
+class TestTrackReader(EngineTestCase):
+    def read(self, text: str, chunk_size: int) -> dict:
+        lines: list = []
+        track_data = TrackReader(io.StringIO(text), chunk_size).read_track(lines.append)
+        track_data["lines"] = lines
+        return track_data
+
+    def test_matches_json_load(self):
+        for track_file in ("veil", "feature", "remount_two_riders"):
+            with open(f"fixtures/{track_file}.track.json", "r") as f:
+                text = f.read()
+            # Chunks small enough to split every value
+            for chunk_size in (1, 7, 4096):
+                self.assertEqual(self.read(text, chunk_size), json.loads(text))
+
+        for text in ('{"lines": []}', '{"lines" : [ 1 ,2, 3 ] , "a": 1234 }'):
+            for chunk_size in (1, 2, 3):
+                self.assertEqual(self.read(text, chunk_size), json.loads(text))
+        for text in ('{"lines": [1, 2', '{"lines": [1 2]}', "[]"):
+            with self.assertRaises(json.JSONDecodeError):
+                self.read(text, 4)
+
+    def test_load_track_matches_convert_track(self):
+        for lazy in (False, True):
+            with open("fixtures/veil.track.json", "r") as f:
+                engine = load_track(f, False, lazy=lazy)
+            expected = load_fixture_engine("veil", False)
+            for frame in (40, 200):
+                expected_frame = expected.get_frame(frame)
+                assert expected_frame is not None
+                self.assertFramesEqual(engine.get_frame(frame), expected_frame)
+            self.assertEqual(
+                engine.grid.get_max_line_id(), expected.grid.get_max_line_id()
+            )
+
+
+class TestLazyLoading(EngineTestCase):
+    def test_frames_match_eager(self):
+        for track_file, backend in (
+            ("veil", PhysicsBackend.SCALAR),
+            ("fakie_park_autumn", PhysicsBackend.PYTHON),
+        ):
+            expected = load_fixture_engine(track_file, False, backend=backend)
+            engine = load_fixture_engine(track_file, False, backend=backend, lazy=True)
+            for frame in (40, 200):
+                self.assertFramesEqual(
+                    engine.get_frame(frame), self.get_expected(expected, frame)
+                )
+            self.assertLess(engine.grid.get_num_lines(), expected.grid.get_num_lines())
+
+    # Lines sharing an id get built together, in the same order as eager loading
+    def test_duplicate_line_ids(self):
+        track_data = json.loads(Path("fixtures/veil.track.json").read_text())
+        track_data["lines"].append({**track_data["lines"][0], "x2": 500})
+        expected = convert_track(track_data, False)
+        engine = convert_track(track_data, False, lazy=True)
+        for frame in (40, 200):
+            self.assertFramesEqual(
+                engine.get_frame(frame), self.get_expected(expected, frame)
+            )
+
+    def get_expected(self, engine: Engine, frame: int) -> CachedFrame:
+        frame_state = engine.get_frame(frame)
+        assert frame_state is not None
+        return frame_state
+
+    def test_line_edits_match_eager(self):
+        expected = load_fixture_engine("veil", False)
+        engine = load_fixture_engine("veil", False, lazy=True)
+        self.assertEqual(engine.grid.get_num_lines(), 0)
+        self.assertEqual(engine.grid.get_max_line_id(), expected.grid.get_max_line_id())
+
+        # Removing a line that was not built yet builds it first
+        last_line_id = expected.grid.get_max_line_id()
+        for edited in (expected, engine):
+            edited.remove_line(last_line_id)
+        self.assertIsNone(engine.grid.get_line_by_id(last_line_id))
+        self.assertEqual(engine.grid.get_max_line_id(), expected.grid.get_max_line_id())
+
+        for edited in (expected, engine):
+            edited.add_line(
+                NormalLine(
+                    BaseLine(-1, Vector(0, 20), Vector(100, 20), False, False, False)
+                )
+            )
+        self.assertFramesEqual(engine.get_frame(100), self.get_expected(expected, 100))
+        self.assertEqual(
+            sorted(line.base.id for line in engine.grid.get_all_lines()),
+            sorted(line.base.id for line in expected.grid.get_all_lines()),
+        )
+
+
+class TestFramePrefetcher(EngineTestCase):
+    def wait_for(self, prefetcher: FramePrefetcher, frame: int):
+        deadline = time.monotonic() + 30
+        while prefetcher.prefetched_frame < frame:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_prefetches_ahead_of_playhead(self):
+        engine = load_fixture_engine("remount_two_riders", False)
+        prefetcher = FramePrefetcher(engine, 30)
+        self.addCleanup(prefetcher.stop)
+        self.wait_for(prefetcher, 30)
+        # Stops at the look ahead until the playhead moves
+        time.sleep(0.05)
+        self.assertEqual(prefetcher.prefetched_frame, 30)
+        self.assertIsNone(prefetcher.request(50))
+        self.wait_for(prefetcher, 80)
+
+        expected = load_fixture_engine("remount_two_riders", False)
+        frame_state = prefetcher.request(70)
+        assert frame_state is not None
+        self.assertFramesEqual(frame_state, expected.get_frame(70))
+        self.assertEqual(engine.state_cache.recomputed, 0)
+
+    def test_line_edit(self):
+        engine = load_fixture_engine("line_flags", False)
+        prefetcher = FramePrefetcher(engine, 160)
+        self.addCleanup(prefetcher.stop)
+        self.wait_for(prefetcher, 160)
+
+        line = NormalLine(
+            BaseLine(-1, Vector(-100, 20), Vector(100, 20), False, False, False)
+        )
+        with prefetcher.lock:
+            engine.add_line(line)
+            prefetcher.invalidate()
+        self.wait_for(prefetcher, 160)
+
+        expected = load_fixture_engine("line_flags", False)
+        expected.add_line(
+            NormalLine(
+                BaseLine(-1, Vector(-100, 20), Vector(100, 20), False, False, False)
+            )
+        )
+        frame_state = prefetcher.request(160)
+        assert frame_state is not None
+        self.assertFramesEqual(frame_state, expected.get_frame(160))
+
+    def test_breakpoints(self):
+        engine = load_fixture_engine("remount_two_riders", False)
+        prefetcher = FramePrefetcher(engine, 30)
+        self.addCleanup(prefetcher.stop)
+        self.addCleanup(utils.debug.dec_breakpoints_target)
+        self.wait_for(prefetcher, 30)
+        # Breakpoints apply to every engine, so the expected frame is simulated first
+        expected = self.get_expected(
+            load_fixture_engine("remount_two_riders", False), 10
+        )
+
+        # Frames prefetched past the playhead get cleared too, and nothing gets
+        # prefetched at the breakpoint
+        with prefetcher.lock:
+            utils.debug.inc_breakpoints_target()
+            prefetcher.clear_from(10)
+        self.assertEqual(engine.state_cache.latest(), 9)
+        frame_state = prefetcher.request(10)
+        assert frame_state is not None
+        self.assertNotEqual(
+            frame_state.entities[0].points[0].position,
+            expected.entities[0].points[0].position,
+        )
+        time.sleep(0.05)
+        self.assertEqual(engine.state_cache.latest(), 10)
+
+        with prefetcher.lock:
+            utils.debug.dec_breakpoints_target()
+            prefetcher.clear_from(10)
+        self.wait_for(prefetcher, 40)
+        frame_state = prefetcher.request(10)
+        assert frame_state is not None
+        self.assertFramesEqual(frame_state, expected)
+
+    def get_expected(self, engine: Engine, frame: int) -> CachedFrame:
+        frame_state = engine.get_frame(frame)
+        assert frame_state is not None
+        return frame_state
+
+
+class TestFrameStore(EngineTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    # The store of the last loaded engine is kept as self.frame_store
+    def load_engine(self, track_file: str) -> Engine:
+        self.frame_store = FrameStore(self.directory.name)
+        return load_fixture_engine(track_file, False, frame_store=self.frame_store)
+
+    def test_reopened_track_reads_stored_frames(self):
+        self.load_engine("remount_two_riders").get_frame(60)
+
+        engine = self.load_engine("remount_two_riders")
+        self.assertEqual(len(self.frame_store), 61)
+        expected = load_fixture_engine("remount_two_riders", False)
+        self.assertFramesEqual(engine.get_frame(60), expected.get_frame(60))
+        self.assertEqual(engine.state_cache.max_simulated, 0)
+        # Frames read from the store are hits, not misses
+        stats = engine.state_cache.get_stats()
+        self.assertEqual(
+            (stats["hits"], stats["store_hits"], stats["misses"]), (1, 1, 0)
+        )
+
+        # Resumes from the last stored frame
+        self.assertFramesEqual(engine.get_frame(80), expected.get_frame(80))
+        self.assertEqual(engine.state_cache.get_stats()["frames"], 21)
+        self.assertEqual(len(self.frame_store), 81)
+        self.assertEqual(engine.state_cache.get_stats()["misses"], 1)
+
+    # Batch workers simulating the same track share its file, which has to end up
+    # with every frame once, in order
+    def test_concurrent_writers(self):
+        results = run_batch(
+            [
+                {
+                    "path": "fixtures/remount_two_riders.track.json",
+                    "start_frame": 0,
+                    "end_frame": 400,
+                    "lra": False,
+                    "frame_store": self.directory.name,
+                }
+            ]
+            * 6,
+            processes=3,
+        )
+        for result in results:
+            self.assertIsNone(result["error"])
+            self.assertEqual(result["final_state"], results[0]["final_state"])
+
+        engine = self.load_engine("remount_two_riders")
+        self.assertEqual(len(self.frame_store), 401)
+        assert self.frame_store.path is not None
+        self.assertEqual(
+            os.path.getsize(self.frame_store.path), 401 * self.frame_store.record_size
+        )
+        expected = load_fixture_engine("remount_two_riders", False)
+        for frame in range(0, 401, 20):
+            self.assertFramesEqual(engine.get_frame(frame), expected.get_frame(frame))
+
+    def get_line_below(self, position: Vector) -> NormalLine:
+        return NormalLine(
+            BaseLine(
+                -1,
+                position + Vector(-20, 5),
+                position + Vector(20, 5),
+                False,
+                False,
+                False,
+            )
+        )
+
+    def get_position(self, engine: Engine, frame: int) -> Vector:
+        cached_frame = engine.get_frame(frame)
+        assert cached_frame is not None
+        return cached_frame.entities[0].points[0].position
+
+    def test_line_edit_keeps_unaffected_frames(self):
+        engine = self.load_engine("line_flags")
+        engine.get_frame(160)
+        position = self.get_position(engine, 150)
+        line = self.get_line_below(position)
+        engine.add_line(line)
+        self.assertGreater(len(self.frame_store), 100)
+        self.assertLessEqual(len(self.frame_store), 151)
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+
+        expected = load_fixture_engine("line_flags", False)
+        expected.add_line(self.get_line_below(position))
+        self.assertFramesEqual(engine.get_frame(160), expected.get_frame(160))
+
+        # Going back to the original track goes back to its file
+        engine.remove_line(line.base.id)
+        self.assertEqual(len(self.frame_store), 161)
+
+    def test_line_edit_clears_frames_read_from_store(self):
+        self.load_engine("line_flags").get_frame(160)
+        engine = self.load_engine("line_flags")
+        position = self.get_position(engine, 150)
+        # Frames read from the store have unknown queried cells, so none are kept
+        engine.add_line(self.get_line_below(position))
+        self.assertEqual(len(self.frame_store), 1)
+
+        expected = load_fixture_engine("line_flags", False)
+        expected.add_line(self.get_line_below(position))
+        self.assertFramesEqual(engine.get_frame(160), expected.get_frame(160))
+
+
+# Edits lines the riders of veil and accel_flags hit through the setters of their
+# base lines, then moves them to their new cells
+def edit_lines(engine: Engine):
+    grid = engine.grid
+    for line_id in (21, 88, 4):
+        line = grid.get_line_by_id(line_id)
+        if line is None:
+            continue
+        start, end = line.base.endpoints
+        line.base.set_endpoints(start + Vector(0, -3), end + Vector(0, 2))
+        line.base.set_flipped(not line.base.flipped)
+        line.base.set_extensions(True, True)
+        grid.move_line(line)
+
+
+# Flips and extends every line without telling the grid, which only needs to know
+# when endpoints change
+def flip_lines(engine: Engine):
+    for line in engine.grid.get_all_lines():
+        line.base.set_flipped(not line.base.flipped)
+        line.base.set_extensions(not line.base.left_ext, True)
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+class TestNumpyBackend(EngineTestCase):
+    def test_remounting_riders(self):
+        self.assertBackendMatches(PhysicsBackend.NUMPY, "shuffle_sleds", False, 240)
+
+    def test_lra_remounting(self):
+        self.assertBackendMatches(PhysicsBackend.NUMPY, "lra_remount", True, 60)
+
+    def test_acceleration_lines(self):
+        self.assertBackendMatches(PhysicsBackend.NUMPY, "accel_flags", False, 160)
+
+    def test_edited_lines(self):
+        for track_file in ("veil", "accel_flags"):
+            self.assertBackendMatches(
+                PhysicsBackend.NUMPY, track_file, False, 160, edit_lines
+            )
+
+    def test_lines_edited_after_simulating(self):
+        self.assertBackendMatches(
+            PhysicsBackend.NUMPY, "accel_flags", False, 60, flip_lines, 5
+        )
+
+
+class TestScalarBackend(EngineTestCase):
+    def test_remounting_riders(self):
+        self.assertBackendMatches(PhysicsBackend.SCALAR, "shuffle_sleds", False, 240)
+
+    def test_lra_remounting(self):
+        self.assertBackendMatches(PhysicsBackend.SCALAR, "lra_remount", True, 60)
+
+    def test_acceleration_lines(self):
+        self.assertBackendMatches(PhysicsBackend.SCALAR, "accel_flags", False, 160)
+
+    def test_edited_lines(self):
+        for track_file in ("veil", "accel_flags"):
+            self.assertBackendMatches(
+                PhysicsBackend.SCALAR, track_file, False, 160, edit_lines
+            )
+
+    def test_lines_edited_after_simulating(self):
+        self.assertBackendMatches(
+            PhysicsBackend.SCALAR, "accel_flags", False, 60, flip_lines, 5
+        )
+
+
+class TestBatch(unittest.TestCase):
+    def test_matches_fixtures(self):
+        fixtures: list[Dict[str, Any]] = json.loads(
+            Path("fixture_tests.json").read_text()
+        )
+        expected = {
+            fixture["file"]: fixture
+            for fixture in fixtures
+            if fixture["test"] in ("rider remounted", "rider should be mounted")
+        }
+        results = run_batch(
+            [
+                {
+                    "path": f"fixtures/{track_file}.track.json",
+                    "start_frame": 0,
+                    "end_frame": fixture["frame"],
+                    "lra": fixture.get("lra", False),
+                }
+                for track_file, fixture in expected.items()
+            ],
+            processes=2,
+        )
+
+        self.assertEqual(len(results), 2)
+        for result, fixture in zip(results, expected.values()):
+            self.assertIsNone(result["error"])
+            self.assertEqual(
+                result["final_state"][0]["points"][
+                    : len(fixture["state"]["entities"][0]["points"])
+                ],
+                fixture["state"]["entities"][0]["points"],
+            )
+            self.assertEqual(result["final_state"][0]["mount_phase"], "MOUNTED")
+            self.assertEqual(result["events"][-1]["event"], "MOUNTED")
+            self.assertEqual(result["events"][-1]["frame"], fixture["frame"])
+
+
+class TestExport(EngineTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.expected = load_fixture_engine("remount_two_riders", False)
+
+    def export(self, export_format: ExportFormat, file_name: str) -> str:
+        path = os.path.join(self.directory.name, file_name)
+        engine = load_fixture_engine("remount_two_riders", False)
+        self.assertEqual(export_frames(engine, path, export_format, 10, 40, 10), 4)
+        return path
+
+    def get_entities(self, frame: int):
+        cached_frame = self.expected.get_frame(frame)
+        assert cached_frame is not None
+        return cached_frame.entities
+
+    # Frame ranges that cannot be exported get rejected before the output file gets
+    # created, also on the command line
+    def test_invalid_range(self):
+        path = os.path.join(self.directory.name, "export.npy")
+        engine = load_fixture_engine("remount_two_riders", False)
+        for export_format in ExportFormat:
+            for start_frame, step_size in ((0, 0), (-5, 1)):
+                with self.assertRaises(ValueError):
+                    export_frames(
+                        engine, path, export_format, start_frame, 40, step_size
+                    )
+                self.assertFalse(os.path.exists(path))
+
+        for arguments in (["--step", "0"], ["--start", "-5"]):
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    "src/export.py",
+                    "fixtures/remount_two_riders.track.json",
+                    path,
+                    *arguments,
+                ],
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode, 2)
+            self.assertIn("has to be at least", result.stderr)
+            self.assertFalse(os.path.exists(path))
+
+    def test_csv(self):
+        with open(self.export(ExportFormat.CSV, "export.csv"), newline="") as f:
+            rows = list(csv.DictReader(f))
+
+        entities = self.get_entities(40)
+        num_points = len(entities[0].points)
+        self.assertEqual(len(rows), 4 * len(entities) * num_points)
+        row = rows[-1]
+        point = entities[-1].points[-1]
+        self.assertEqual(row["frame"], "40")
+        self.assertEqual(float(row["x"]), point.position.x)
+        self.assertEqual(float(row["vy"]), point.velocity.y)
+        self.assertEqual(row["mount_phase"], entities[-1].state.mount_phase.name)
+
+    def test_jsonl(self):
+        with open(self.export(ExportFormat.JSONL, "export.jsonl")) as f:
+            lines = [json.loads(line) for line in f]
+
+        self.assertEqual([line["frame"] for line in lines], [10, 20, 30, 40])
+        for line in lines:
+            for exported, entity in zip(
+                line["entities"], self.get_entities(line["frame"])
+            ):
+                self.assertEqual(exported["sled_intact"], entity.state.sled_intact)
+                self.assertEqual(
+                    exported["points"][3],
+                    [
+                        entity.points[3].position.x,
+                        entity.points[3].position.y,
+                        entity.points[3].velocity.x,
+                        entity.points[3].velocity.y,
+                    ],
+                )
+
+    def test_npy(self):
+        with open(self.export(ExportFormat.NPY, "export.npy"), "rb") as f:
+            self.assertEqual(f.read(8), b"\x93NUMPY\x01\x00")
+            header_length = int.from_bytes(f.read(2), "little")
+            self.assertEqual((10 + header_length) % 64, 0)
+            header = ast.literal_eval(f.read(header_length).decode("latin1"))
+            values = array("d")
+            values.frombytes(f.read())
+
+        entities = self.get_entities(30)
+        num_points = len(entities[0].points)
+        self.assertEqual(header["shape"], (4, len(entities), num_points * 4 + 2))
+        self.assertEqual(len(values), 4 * len(entities) * (num_points * 4 + 2))
+        row_start = (2 * len(entities) + 1) * (num_points * 4 + 2)
+        row = values[row_start : row_start + num_points * 4 + 2]
+        entity = entities[1]
+        self.assertEqual(row[4 * 5], entity.points[5].position.x)
+        self.assertEqual(row[4 * 5 + 3], entity.points[5].velocity.y)
+        self.assertEqual(row[-2], entity.state.mount_phase.value)
+        self.assertEqual(row[-1], 1 if entity.state.sled_intact else 0)
+
+
 def create_fixture_tests():
     fixtures: list[Dict[str, Any]] = json.loads(Path("fixture_tests.json").read_text())
     _classes_by_file: dict[str, type] = {}
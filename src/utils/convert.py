@@ -4,30 +4,45 @@ from engine.vector import Vector
 from engine.grid import GridVersion
 from engine.line import NormalLine, AccelerationLine, BaseLine
 from engine.entity import Entity, RemountVersion, EntityState, InitialEntityParams
-from engine.engine import Engine
-from typing import Union, Any
+from engine.engine import Engine, PhysicsBackend, DEFAULT_CELL_SIZE
+from engine.line_tiles import LineTiles
+from engine.cache import FrameCache
+from engine.frame_store import FrameStore
+from utils.track_reader import read_track
+from typing import Union, Any, Optional, TextIO
+
+
+# Scenery lines and zero length lines never collide, so they do not get converted
+def is_solid_line(line: dict[str, Any]) -> bool:
+    return line["type"] != 2 and not (
+        line["x1"] == line["x2"] and line["y1"] == line["y2"]
+    )
+
+
+def convert_line(line: dict[str, Any]) -> Optional[Union[NormalLine, AccelerationLine]]:
+    if not is_solid_line(line):
+        return None
+    new_line = BaseLine(
+        line["id"],
+        Vector(line["x1"], line["y1"]),
+        Vector(line["x2"], line["y2"]),
+        line["flipped"],
+        line["leftExtended"],
+        line["rightExtended"],
+    )
+    if line["type"] == 0:
+        return NormalLine(new_line)
+    if line["type"] == 1:
+        return AccelerationLine(new_line, line.get("multiplier", 1))
+    return None
 
 
 def convert_lines(lines: list):
     converted_lines: list[Union[NormalLine, AccelerationLine]] = []
     for line in lines:
-        if line["type"] != 2 and not (
-            line["x1"] == line["x2"] and line["y1"] == line["y2"]
-        ):
-            new_line = BaseLine(
-                line["id"],
-                Vector(line["x1"], line["y1"]),
-                Vector(line["x2"], line["y2"]),
-                line["flipped"],
-                line["leftExtended"],
-                line["rightExtended"],
-            )
-            if line["type"] == 0:
-                converted_lines.append(NormalLine(new_line))
-            elif line["type"] == 1:
-                converted_lines.append(
-                    AccelerationLine(new_line, line.get("multiplier", 1))
-                )
+        converted_line = convert_line(line)
+        if converted_line is not None:
+            converted_lines.append(converted_line)
     return converted_lines
 
 
@@ -74,8 +89,70 @@ def convert_version(grid_version_string: str) -> GridVersion:
     return grid_version_mapping.get(grid_version_string, GridVersion.V6_2)
 
 
-def convert_track(track_data: dict[str, Any], lra: bool):
+def add_line_tile(line_tiles: LineTiles, line: dict[str, Any]):
+    if is_solid_line(line):
+        line_tiles.add(line, line["id"], line["x1"], line["y1"], line["x2"], line["y2"])
+
+
+# Indexes the solid lines by the area they are in, to be converted once needed
+def get_line_tiles(lines: list) -> LineTiles:
+    line_tiles = LineTiles(DEFAULT_CELL_SIZE, convert_lines)
+    for line in lines:
+        add_line_tile(line_tiles, line)
+    return line_tiles
+
+
+def convert_track(
+    track_data: dict[str, Any],
+    lra: bool,
+    state_cache: Optional[FrameCache] = None,
+    backend: PhysicsBackend = PhysicsBackend.PYTHON,
+    frame_store: Optional[FrameStore] = None,
+    lazy: bool = False,
+):
     version = convert_version(track_data["version"])
     entities = convert_riders(track_data["riders"], lra)
+    # Lazy loading only converts lines once simulated frames get near them
+    if lazy:
+        return Engine(
+            version,
+            entities,
+            [],
+            state_cache,
+            backend,
+            frame_store,
+            get_line_tiles(track_data["lines"]),
+        )
     lines = convert_lines(track_data["lines"])
-    return Engine(version, entities, lines)
+    return Engine(version, entities, lines, state_cache, backend, frame_store)
+
+
+# Same as convert_track on the parsed file, converting each line as it gets read
+# instead of parsing every line first
+def load_track(
+    file: TextIO,
+    lra: bool,
+    state_cache: Optional[FrameCache] = None,
+    backend: PhysicsBackend = PhysicsBackend.PYTHON,
+    frame_store: Optional[FrameStore] = None,
+    lazy: bool = False,
+):
+    lines: list[Union[NormalLine, AccelerationLine]] = []
+    line_tiles = None
+    if lazy:
+        line_tiles = LineTiles(DEFAULT_CELL_SIZE, convert_lines)
+        track_data = read_track(file, lambda line: add_line_tile(line_tiles, line))
+    else:
+
+        def on_line(line: dict[str, Any]):
+            converted_line = convert_line(line)
+            if converted_line is not None:
+                lines.append(converted_line)
+
+        track_data = read_track(file, on_line)
+
+    version = convert_version(track_data["version"])
+    entities = convert_riders(track_data["riders"], lra)
+    return Engine(
+        version, entities, lines, state_cache, backend, frame_store, line_tiles
+    )
@@ -1,11 +1,10 @@
 import re
-import json
 import unittest
 import struct
 from typing import Optional
 from engine.engine import Engine
 from engine.entity import MountPhase
-from utils.convert import convert_track
+from utils.convert import load_track
 
 _LOADED_ENGINES: dict[str, Engine] = {}
 
@@ -19,8 +18,7 @@ def get_engine(track_file: str, lra: bool) -> Engine:
     eng = _LOADED_ENGINES.get(track_file)
     if eng is None:
         with open(f"fixtures/{track_file}.track.json", "r") as f:
-            track_data = json.load(f)
-        eng = convert_track(track_data, lra)
+            eng = load_track(f, lra)
         _LOADED_ENGINES[track_file] = eng
     return eng
 
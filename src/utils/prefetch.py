@@ -0,0 +1,100 @@
+# Simulates frames ahead of a playhead on a background thread, so that frames are
+# already cached by the time they get displayed
+# Every use of the engine, from either thread, has to hold the prefetcher's lock
+
+from engine.engine import Engine
+from engine.cache import CachedFrame
+from typing import Optional
+import threading
+import time
+import utils.debug
+
+
+class FramePrefetcher:
+    def __init__(self, engine: Engine, look_ahead: int):
+        self.engine = engine
+        # How many frames past the playhead to simulate
+        self.look_ahead = look_ahead
+        self.lock = threading.Lock()
+        # Notified when the playhead moves or the engine changes
+        self.wake = threading.Condition(self.lock)
+        self.playhead = 0
+        self.running = True
+
+        # Latest simulated frame, every frame up to it can be read without
+        # simulating more than a cache interval
+        self.prefetched_frame = 0
+        self.prefetched_state: Optional[CachedFrame] = None
+        with self.lock:
+            self.reset()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def get_target(self) -> int:
+        return self.playhead + self.look_ahead
+
+    # Resumes prefetching from the latest cached or stored frame before the target
+    def reset(self):
+        self.prefetched_frame, self.prefetched_state = self.engine.get_nearest_frame(
+            self.get_target()
+        )
+
+    # Has to be called (holding the lock) after anything that clears cached frames,
+    # like line edits
+    def invalidate(self):
+        self.reset()
+        self.wake.notify()
+
+    # Has to be called (holding the lock) after the breakpoint target changes, since
+    # frames from the given one on (including the ones prefetched past it) were
+    # simulated up to a different breakpoint
+    # Prefetching stays stopped while there is a breakpoint target
+    def clear_from(self, frame: int):
+        self.engine.state_cache.truncate(frame)
+        self.invalidate()
+
+    def should_prefetch(self) -> bool:
+        # Frames simulated while at a breakpoint are incomplete
+        return (
+            self.prefetched_frame < self.get_target()
+            and utils.debug.breakpoint_target == 0
+        )
+
+    def prefetch_frame(self):
+        assert self.prefetched_state is not None
+        start_time = time.perf_counter()
+        frame = self.prefetched_frame + 1
+        self.engine.simulate_frame(frame, self.prefetched_state)
+        self.engine.state_cache.add(frame, self.prefetched_state, self.get_target())
+        self.engine.state_cache.record_steps(1, time.perf_counter() - start_time)
+        self.prefetched_frame = frame
+
+    def run(self):
+        while True:
+            # The lock gets released after every frame, so the other thread never
+            # waits longer than one frame takes to simulate
+            with self.lock:
+                if not self.running:
+                    return
+                if self.should_prefetch():
+                    self.prefetch_frame()
+                else:
+                    self.wake.wait()
+            time.sleep(0)
+
+    # Moves the playhead, returning the frame if it is already simulated
+    # At a breakpoint, frames get simulated right away instead
+    def request(self, frame: int) -> Optional[CachedFrame]:
+        with self.lock:
+            self.playhead = frame
+            self.wake.notify()
+            if frame <= self.prefetched_frame or utils.debug.breakpoint_target != 0:
+                return self.engine.get_frame(frame)
+            return None
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.wake.notify()
+        self.thread.join()
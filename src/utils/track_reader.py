@@ -0,0 +1,120 @@
+# Reads .track.json files incrementally, handing each item of the lines array to a
+# callback as soon as it is parsed, so the whole track never exists as json objects
+# at once (only the other top level fields get kept, which are small)
+# Values get parsed by the json module itself, so they are the same as with json.load
+
+from typing import Any, Callable, TextIO
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Comma between items of an array, with the whitespace around it
+ITEM_SEPARATOR = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+
+
+class TrackReader:
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        # Text read but not parsed yet starts at index
+        self.buffer = ""
+        self.index = 0
+        self.end_of_file = False
+
+    # Reads at least another chunk, or as much as is buffered, so that values longer
+    # than a chunk do not get parsed again for every chunk
+    def read_more(self) -> bool:
+        if self.end_of_file:
+            return False
+        text = self.file.read(max(self.chunk_size, len(self.buffer) - self.index))
+        if not text:
+            self.end_of_file = True
+            return False
+        self.buffer = self.buffer[self.index :] + text
+        self.index = 0
+        return True
+
+    # Next character after any whitespace, without consuming it ("" at the end)
+    def peek(self) -> str:
+        while True:
+            self.index = WHITESPACE.match(self.buffer, self.index).end()
+            if self.index < len(self.buffer):
+                return self.buffer[self.index]
+            if not self.read_more():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise json.JSONDecodeError(
+                f"Expecting one of {characters!r}", self.buffer, self.index
+            )
+        self.index += 1
+        return character
+
+    def read_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.index)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.end_of_file:
+                    self.index = end
+                    return value
+            except json.JSONDecodeError:
+                if self.end_of_file:
+                    raise
+            self.read_more()
+
+    # Reads the items of an array after its opening bracket
+    # Items get parsed straight from the buffer with the scanner of the decoder while
+    # they are followed by a comma, which is the same as read_value does, without
+    # the overhead of checking for the end of the buffer and whitespace separately
+    def read_items(self, on_item: Callable[[Any], None]):
+        if self.peek() == "]":
+            self.index += 1
+            return
+        scan_once = self.decoder.scan_once
+        while True:
+            buffer = self.buffer
+            index = self.index
+            while True:
+                try:
+                    item, end = scan_once(buffer, index)
+                except (StopIteration, json.JSONDecodeError):
+                    break
+                match = ITEM_SEPARATOR.match(buffer, end)
+                if match is None or match.end() == len(buffer):
+                    break
+                on_item(item)
+                index = match.end()
+            self.index = index
+
+            on_item(self.read_value())
+            if self.expect(",]") == "]":
+                return
+            self.peek()
+
+    # Calls on_line with each item of the lines array, returning the other fields
+    def read_track(self, on_line: Callable[[Any], None]) -> dict[str, Any]:
+        track_data: dict[str, Any] = {}
+        self.expect("{")
+        if self.peek() == "}":
+            self.index += 1
+            return track_data
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            if key == "lines" and self.peek() == "[":
+                self.index += 1
+                self.read_items(on_line)
+            else:
+                track_data[key] = self.read_value()
+            if self.expect(",}") == "}":
+                return track_data
+
+
+def read_track(file: TextIO, on_line: Callable[[Any], None]) -> dict[str, Any]:
+    return TrackReader(file).read_track(on_line)